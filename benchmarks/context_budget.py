@@ -0,0 +1,77 @@
+"""
+Measure the conversation history tokens that the prompts of recorded games would carry, with the full history and
+with the token-budgeted windows of `onuw.agents.context` for a few budgets. Each game is replayed from its messages:
+at every turn of a player, the history visible to the player is rendered by the player's own window, as the agent
+cores do for each of their queries. By default, long synthetic games are used.
+
+The effect of a budget on the win rate needs games played by LLM agents with `context_budget` set in the player
+configs, since the offline backends ignore the prompts; see `--metrics` of main.py for the tokens of live games.
+
+Usage (from the root of the repository):
+    python -m benchmarks.context_budget --budgets 1000 2000 4000
+    python -m benchmarks.context_budget --history_dir logs/ --budgets 2000
+"""
+import os
+import glob
+import json
+import argparse
+import tempfile
+
+from onuw.memory import Message
+from onuw.agents.context import HistoryWindow, estimate_tokens
+from .synthetic import write_histories
+
+
+def load_messages(path):
+    with open(path, "r") as f:
+        history = json.load(f)
+    fields = set(Message.__dataclass_fields__)
+    return [Message(**{key: value for key, value in message.items() if key in fields}) for message in history["messages"]]
+
+
+def history_tokens(messages, token_budget, recent_speeches):
+    """
+    the estimated history tokens of all player turns of a game, and the number of windowed renders
+    """
+    players = sorted(set(message.agent_name for message in messages if message.agent_name != "Moderator"))
+    windows = {player: HistoryWindow(token_budget, recent_speeches) for player in players}
+    total = 0
+    for idx, message in enumerate(messages):
+        if message.agent_name not in windows:
+            continue
+        visible = [earlier for earlier in messages[:idx]
+                   if earlier.turn < message.turn and earlier.is_visible_to(message.agent_name)]
+        total += estimate_tokens(windows[message.agent_name].render(visible))
+    return total, sum(window.num_windowed for window in windows.values())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--history_dir", type=str, default=None, help="directory of recorded games, defaults to synthetic games")
+    parser.add_argument("--num_games", type=int, default=20, help="number of synthetic games")
+    parser.add_argument("--num_players", type=int, default=5)
+    parser.add_argument("--num_rounds", type=int, default=6, help="discussion rounds of the synthetic games")
+    parser.add_argument("--budgets", type=int, nargs="+", default=[1000, 2000, 4000])
+    parser.add_argument("--recent_speeches", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.history_dir is None:
+            paths = write_histories(tmp_dir, args.num_games, num_players=args.num_players, num_rounds=args.num_rounds)
+        else:
+            paths = sorted(glob.glob(os.path.join(args.history_dir, "**", "*.json"), recursive=True))
+        games = [load_messages(path) for path in paths]
+
+    full = sum(history_tokens(messages, None, args.recent_speeches)[0] for messages in games) / len(games)
+    print(f"{len(games)} games, history tokens per game summed over the player turns (x3 for the queries of dpins)")
+    print(f"{'budget':>8} {'tokens/game':>12} {'saved':>7} {'windowed turns':>15}")
+    print(f"{'full':>8} {full:>12.0f} {'':>7} {'':>15}")
+    for budget in args.budgets:
+        results = [history_tokens(messages, budget, args.recent_speeches) for messages in games]
+        tokens = sum(total for total, _ in results) / len(games)
+        windowed = sum(num_windowed for _, num_windowed in results) / len(games)
+        print(f"{budget:>8} {tokens:>12.0f} {1 - tokens / full:>7.1%} {windowed:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark the embedding throughput of `DataProcessor` against a local stub embedder with simulated request latency.
+"before" embeds one observation per request serially, like the processor used to, and "after" uses batched requests
+with bounded concurrency.
+
+Usage (from the root of the repository):
+    python -m benchmarks.embedding_throughput --num_games 50 --latency 0.05
+"""
+import os
+import sys
+import time
+import hashlib
+import argparse
+import tempfile
+
+import numpy as np
+
+from .synthetic import write_histories
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, "dataset_process"))
+from processor import DataProcessor  # noqa: E402
+
+
+class StubEmbeddingProcessor(DataProcessor):
+    """
+    DataProcessor whose embedding requests are served locally, taking `latency` seconds per request
+    """
+    def __init__(self, latency=0.05, dim=256, **kwargs):
+        super().__init__(embedding_model="stub", **kwargs)
+        self.latency = latency
+        self.dim = dim
+
+    def _embed_batch(self, contents):
+        time.sleep(self.latency)
+        embeddings = []
+        for content in contents:
+            seed = int.from_bytes(hashlib.md5(content.encode()).digest()[:4], "little")
+            embeddings.append(np.random.default_rng(seed).standard_normal(self.dim, dtype=np.float32))
+        return embeddings
+
+
+def run(dir_path, **kwargs):
+    processor = StubEmbeddingProcessor(**kwargs)
+    start = time.perf_counter()
+    processor.process_dataset(dir_path)
+    elapsed = time.perf_counter() - start
+    stats = processor.embedding_stats
+    return stats["observations"] / elapsed, stats, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_games", type=int, default=50, help="number of synthetic games")
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated latency of one embedding request in seconds")
+    parser.add_argument("--batch_size", type=int, default=100, help="number of inputs per request after batching")
+    parser.add_argument("--max_concurrency", type=int, default=4, help="number of concurrent requests after batching")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dir_path:
+        write_histories(dir_path, args.num_games)
+        for name, batch_size, max_concurrency in [("before", 1, 1), ("after", args.batch_size, args.max_concurrency)]:
+            rate, stats, elapsed = run(dir_path, latency=args.latency, batch_size=batch_size, max_concurrency=max_concurrency)
+            print(f"{name:>6}: {rate:10.1f} embeddings/s ({stats['observations']} observations, {stats['embedded']} unique, "
+                  f"{stats['requests']} requests, {elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark the construction of per-player observation strings in `DataProcessor` on long synthetic games.
+"before" rebuilds the history of each player by repeated string concatenation, like the processor used to,
+and "after" derives all observations from the history buffers shared by the players of a game.
+
+Usage (from the root of the repository):
+    python -m benchmarks.history_construction --num_rounds 10 20 40 --num_players 5 10
+"""
+import os
+import sys
+import time
+import argparse
+
+from .synthetic import make_history
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, "dataset_process"))
+from processor import DataProcessor  # noqa: E402
+
+
+def legacy_observations(processor, player):
+    """
+    the observation strings of a player, built as the processor did before the shared buffers
+    """
+    visible_messages = ""
+    for message in processor.messages[:processor.day_start_idx]:
+        if message["visible_to"] == "all" or player in message["visible_to"]:
+            visible_messages = f"{visible_messages}\n[{message['agent_name']}]: {message['content']}"
+    observations = []
+    for message in processor.messages[processor.day_start_idx: processor.day_end_idx]:
+        if message["agent_name"] == player:
+            observations.append(f"<Game history>:{visible_messages}\n<My thought and belief>: {message['belief']}".strip())
+        visible_messages = f"{visible_messages}\n[{message['agent_name']}]: {message['content']}"
+    return observations
+
+
+def shared_observations(processor, player):
+    return processor._get_transitions(player)[0]
+
+
+def measure(history, build, repeats):
+    processor = DataProcessor()
+    processor.messages, processor.game_info = history["messages"], history["evaluation"]
+    player_names = list(history["evaluation"]["roles_ground_truth"].keys())
+    processor._index_game()  # locate the Day phase, which both constructions need
+    start = time.perf_counter()
+    for _ in range(repeats):
+        if build is shared_observations:  # building the shared buffers is part of the new construction
+            processor._index_game()
+        observations = [build(processor, player) for player in player_names]
+    return (time.perf_counter() - start) / repeats, observations
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_rounds", type=int, nargs="+", default=[10, 20, 40], help="discussion rounds of the games")
+    parser.add_argument("--num_players", type=int, nargs="+", default=[5, 10], help="players of the games")
+    parser.add_argument("--speech_words", type=int, default=40, help="words of each speech")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'players':>8} {'rounds':>7} {'before ms':>10} {'after ms':>9} {'speedup':>8}")
+    for num_players in args.num_players:
+        for num_rounds in args.num_rounds:
+            history = make_history(num_players=num_players, num_rounds=num_rounds, speech_words=args.speech_words, seed=0)
+            before, legacy = measure(history, legacy_observations, args.repeats)
+            after, shared = measure(history, shared_observations, args.repeats)
+            # the legacy construction matched names as substrings, e.g. player1 saw private messages to player10
+            if num_players < 10:
+                assert legacy == shared, "The observations differ from the legacy construction."
+            print(f"{num_players:>8} {num_rounds:>7} {1000 * before:>10.2f} {1000 * after:>9.2f} {before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
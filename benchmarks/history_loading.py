@@ -0,0 +1,79 @@
+"""
+Benchmark loading game histories, as JSON files written by `Arena.save_history` versus columnar shards.
+"json" parses every file with `json.load`, like `DataProcessor` used to, "columnar open" memory-maps the shards
+and reads a column of every game (the winners) through the zero-copy arrays,
+and "columnar decode" decodes every game back to the JSON format.
+
+Usage (from the root of the repository):
+    python -m benchmarks.history_loading --num_games 100000
+"""
+import gc
+import os
+import json
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+from .synthetic import write_histories
+from onuw.storage import ColumnarReader, convert_json
+
+
+def load_json(paths):
+    histories = []
+    for path in paths:
+        with open(path, "r") as f:
+            histories.append(json.load(f))
+    return histories
+
+
+def open_columnar(shard_paths):
+    readers = [ColumnarReader(path) for path in shard_paths]
+    winners = np.concatenate([reader.arrays["game_winner"] for reader in readers])
+    num_messages = sum(reader.num_messages for reader in readers)
+    return readers, winners, num_messages
+
+
+def decode_columnar(shard_paths):
+    return [history for path in shard_paths for history in ColumnarReader(path)]
+
+
+def timed(function, *args):
+    gc.collect()
+    gc.freeze()  # objects loaded by earlier runs are not traversed by the collector during this run
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_games", type=int, default=100000, help="number of synthetic games")
+    parser.add_argument("--num_rounds", type=int, default=3, help="discussion rounds of the games")
+    parser.add_argument("--games_per_shard", type=int, default=10000)
+    parser.add_argument("--tmp_dir", type=str, default=None, help="where the synthetic games are written")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.tmp_dir) as tmp_dir:
+        json_dir, shard_dir = os.path.join(tmp_dir, "json"), os.path.join(tmp_dir, "columnar")
+        json_paths = write_histories(json_dir, args.num_games, num_rounds=args.num_rounds)
+        convert_time, shard_paths = timed(convert_json, json_paths, shard_dir, args.games_per_shard)
+        json_size = sum(os.path.getsize(path) for path in json_paths)
+        shard_size = sum(os.path.getsize(path) for path in shard_paths)
+        print(f"{args.num_games} games: json {json_size / 2 ** 20:.1f}MB, columnar {shard_size / 2 ** 20:.1f}MB "
+              f"in {len(shard_paths)} shards, converted in {convert_time:.2f}s")
+
+        json_time, histories = timed(load_json, json_paths)
+        open_time, (_, winners, num_messages) = timed(open_columnar, shard_paths)
+        decode_time, decoded = timed(decode_columnar, shard_paths)
+        assert decoded == histories, "The decoded games differ from the json files."
+        assert len(winners) == args.num_games and num_messages == sum(len(history["messages"]) for history in histories)
+
+        print(f"{'load':>16} {'seconds':>9} {'games/s':>12}")
+        for name, seconds in [("json", json_time), ("columnar open", open_time), ("columnar decode", decode_time)]:
+            print(f"{name:>16} {seconds:>9.3f} {args.num_games / seconds:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark streaming game histories with `JSONLHistoryWriter`.
+"sync" serializes, writes and flushes each message on the calling thread, and "background" only enqueues messages
+on the calling thread, as the step loop does, while the writer thread serializes and writes them in batches.
+
+Usage (from the root of the repository):
+    python -m benchmarks.history_streaming --num_messages 200000
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+
+from .synthetic import make_history
+from onuw.memory import Message
+from onuw.storage import JSONLHistoryWriter, load_jsonl
+
+
+def make_messages(num_messages):
+    messages = []
+    while len(messages) < num_messages:
+        for row in make_history(seed=len(messages))["messages"]:
+            row = dict(row, timestamp=int(row["timestamp"]))
+            messages.append(Message(**row))
+    return messages[:num_messages]
+
+
+def write_sync(path, messages):
+    start = time.perf_counter()
+    with open(path, "a", encoding="utf-8") as f:
+        for message in messages:
+            f.write(json.dumps({"type": "message", **message.to_dict()}, ensure_ascii=False) + "\n")
+            f.flush()
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed
+
+
+def write_background(path, messages):
+    start = time.perf_counter()
+    writer = JSONLHistoryWriter(path, fsync=False)
+    for message in messages:
+        writer.write_message(message)
+    enqueued = time.perf_counter() - start
+    writer.close()
+    return enqueued, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_messages", type=int, default=200000)
+    args = parser.parse_args()
+
+    messages = make_messages(args.num_messages)
+    print(f"{'writer':>10} {'step loop s':>12} {'us/message':>11} {'total s':>8} {'messages/s':>11}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, write in [("sync", write_sync), ("background", write_background)]:
+            path = os.path.join(tmp_dir, f"{name}.jsonl")
+            loop_time, total_time = write(path, messages)
+            assert len(load_jsonl(path)["messages"]) == len(messages)
+            print(f"{name:>10} {loop_time:>12.3f} {1e6 * loop_time / len(messages):>11.2f} {total_time:>8.3f} "
+                  f"{len(messages) / total_time:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
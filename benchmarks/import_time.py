@@ -0,0 +1,56 @@
+"""
+Check the import time of `onuw.arena` against a budget, and that it imports none of the heavy optional dependencies,
+which are imported on first use by the backends, agent structures and roles that need them.
+Each measurement runs in a fresh interpreter, and the best of a few runs is compared with the budget.
+
+Usage (from the root of the repository):
+    python -m benchmarks.import_time --budget 0.5
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["d3rlpy", "torch", "numpy", "openai", "google.generativeai", "fuzzywuzzy", "prompt_toolkit", "rich"]
+
+
+def measure(module="onuw.arena"):
+    """
+    the wall time of importing the module in a fresh interpreter, and the heavy modules it imported
+    """
+    code = (f"import sys, time, json; start = time.perf_counter(); import {module}; "
+            f"elapsed = time.perf_counter() - start; "
+            f"print(json.dumps([elapsed, [name for name in {HEAVY_MODULES!r} if name in sys.modules]]))")
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT_DIR, capture_output=True, text=True, check=True)
+    elapsed, heavy_modules = json.loads(output.stdout.strip().splitlines()[-1])
+    return elapsed, heavy_modules
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", type=str, default="onuw.arena")
+    parser.add_argument("--budget", type=float, default=0.5, help="maximum import time in seconds")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(args.repeats)]
+    best = min(elapsed for elapsed, _ in runs)
+    heavy_modules = sorted(set(name for _, names in runs for name in names))
+    print(f"import {args.module}: best {best:.3f}s of {args.repeats} runs, budget {args.budget:.3f}s")
+
+    failed = False
+    if best > args.budget:
+        print(f"FAIL: the import takes {best / args.budget:.1f}x the budget.")
+        failed = True
+    if heavy_modules:
+        print(f"FAIL: heavy optional dependencies imported eagerly: {', '.join(heavy_modules)}")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark loading the replay dataset for training, with synthetic transitions of embedding-sized observations.
+"h5" loads a d3rlpy `.h5` file into a ReplayBuffer, like `training/train.py` used to,
+and "mmap" loads the export of `training/dataset.py`, memory-mapping the observations.
+
+Each load runs in fresh processes, which then sample training batches. The memory of each process is reported as
+private (RssAnon) and file-backed (RssFile) resident memory; file-backed pages are shared by all processes on the machine.
+Note that 1M transitions of 1536-dim observations take about 6GB on disk, and "h5" needs as much memory per process.
+
+Usage (from the root of the repository):
+    python -m benchmarks.replay_loading --num_rows 1000000 --obs_dim 1536 --readers 4
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import multiprocessing
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, "training"))
+from dataset import save_arrays, load_dataset  # noqa: E402
+
+
+def make_arrays(dir_path, num_rows, obs_dim, episode_length=20, chunk_rows=65536, seed=0):
+    """
+    write random transitions to memory-mapped `.npy` files in bounded chunks, returning the memory maps
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(dir_path, exist_ok=True)
+    observations = np.lib.format.open_memmap(os.path.join(dir_path, "observations.npy"), mode='w+',
+                                             dtype=np.float32, shape=(num_rows, obs_dim))
+    for start in range(0, num_rows, chunk_rows):
+        end = min(num_rows, start + chunk_rows)
+        observations[start: end] = rng.standard_normal((end - start, obs_dim), dtype=np.float32)
+    observations.flush()
+    actions = rng.integers(0, 6, num_rows)
+    rewards = rng.standard_normal(num_rows).astype(np.float32)
+    terminals = np.zeros(num_rows, dtype=np.float32)
+    terminals[episode_length - 1::episode_length] = 1.0
+    terminals[-1] = 1.0
+    return observations, actions, rewards, terminals
+
+
+def _memory():
+    memory = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, value = line.split(":", 1)
+            if key in ("VmRSS", "RssAnon", "RssFile"):
+                memory[key] = int(value.split()[0]) / 1024  # MB
+    return memory
+
+
+def _reader(path, num_batches, batch_size, barrier, queue):
+    import d3rlpy  # noqa: F401, imports are not part of the load time
+    start = time.perf_counter()
+    dataset = load_dataset(path)
+    load_time = time.perf_counter() - start
+    barrier.wait()  # all readers sample together, as parallel trainers would
+    start = time.perf_counter()
+    for _ in range(num_batches):
+        dataset.sample_transition_batch(batch_size)
+    sample_time = time.perf_counter() - start
+    queue.put({"load_s": load_time, "sample_s": sample_time, **_memory()})
+
+
+def measure(path, readers, num_batches, batch_size):
+    context = multiprocessing.get_context("spawn")
+    barrier, queue = context.Barrier(readers), context.Queue()
+    processes = [context.Process(target=_reader, args=(path, num_batches, batch_size, barrier, queue)) for _ in range(readers)]
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return {key: float(np.mean([result[key] for result in results])) for key in results[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_rows", type=int, default=1000000, help="number of transitions")
+    parser.add_argument("--obs_dim", type=int, default=1536, help="dimension of observations, as OpenAI embeddings")
+    parser.add_argument("--readers", type=int, default=2, help="number of processes loading the dataset together")
+    parser.add_argument("--num_batches", type=int, default=200, help="training batches sampled by each process")
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--skip_h5", action="store_true", help="only measure mmap, e.g. if the dataset does not fit in memory")
+    parser.add_argument("--tmp_dir", type=str, default=None, help="where the synthetic datasets are written")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.tmp_dir) as tmp_dir:
+        arrays = make_arrays(os.path.join(tmp_dir, "raw"), args.num_rows, args.obs_dim)
+        export_path = os.path.join(tmp_dir, "export")
+        save_arrays(export_path, *arrays)
+        paths = {"mmap": export_path}
+        if not args.skip_h5:
+            import d3rlpy
+            paths["h5"] = os.path.join(tmp_dir, "dataset.h5")
+            with open(paths["h5"], "w+b") as f:
+                d3rlpy.dataset.MDPDataset(*arrays).dump(f)
+        del arrays
+
+        print(f"{args.num_rows} transitions of dim {args.obs_dim}, {args.readers} readers, mean per reader:")
+        print(f"{'format':>6} {'load s':>8} {'sample s':>9} {'RSS MB':>9} {'private MB':>11} {'shared MB':>10}")
+        for name in ["h5", "mmap"]:
+            if name in paths:
+                result = measure(paths[name], args.readers, args.num_batches, args.batch_size)
+                print(f"{name:>6} {result['load_s']:>8.2f} {result['sample_s']:>9.2f} {result['VmRSS']:>9.0f} "
+                      f"{result['RssAnon']:>11.0f} {result['RssFile']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
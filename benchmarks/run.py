@@ -0,0 +1,199 @@
+"""
+Benchmark suite of the game engine, which plays every environment type in `ENV_REGISTRY` with the configs in
+`configs/`, all players using the offline `scripted` backend, so that `Arena`, the environments and the agent cores
+are measured without any LLM. For each environment type it measures games/s, steps/s, the p50 and p99 of the step
+time and the peak memory of a game (the fastest of a few rounds), and the suite measures the import time of `onuw.arena` in a fresh interpreter.
+
+The results are saved as JSON, and compared against a baseline saved by an earlier run: a metric that got worse
+by more than the threshold is flagged as a regression and makes the command exit with status 1.
+
+Usage (from the root of the repository):
+    python -m benchmarks.run --output baseline.json
+    python -m benchmarks.run --baseline baseline.json --output latest.json
+"""
+import os
+import sys
+import json
+import time
+import glob
+import random
+import argparse
+import platform
+import subprocess
+import statistics
+import tracemalloc
+
+from onuw.arena import Arena
+from onuw.config import ArenaConfig, BackendConfig
+from onuw.environments import ENV_REGISTRY
+from .scaling import play
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Whether a larger value of a metric is better, used to flag regressions against the baseline
+HIGHER_IS_BETTER = {
+    "games_per_s": True,
+    "steps_per_s": True,
+    "step_p50_ms": False,
+    "step_p99_ms": False,
+    "peak_memory_mb": False,
+    "import_s": False,
+}
+
+
+def env_configs():
+    """
+    the first config in configs/ of each environment type
+    """
+    configs = {}
+    for path in sorted(glob.glob(os.path.join(ROOT_DIR, "configs", "*.json"))):
+        config = ArenaConfig.load(path)
+        configs.setdefault(config.environment["env_type"], path)
+    return configs
+
+
+def make_arena(config_path, structure=None, seed=0):
+    config = ArenaConfig.load(config_path)
+    for idx, player_config in enumerate(config.players):
+        player_config["backend"] = BackendConfig(backend_type="scripted", seed=seed + idx)
+        if structure is not None:
+            player_config["structure"] = structure
+    random.seed(seed)
+    return Arena.from_config(config, randomness=True)
+
+
+def benchmark_env(config_path, num_games, repeats=3, structure=None, seed=0):
+    arena = make_arena(config_path, structure, seed)
+    play(arena)  # warm up
+
+    # Keep the fastest of a few rounds, which is the least disturbed by the other processes on the machine
+    best_elapsed, step_times = None, None
+    for _ in range(repeats):
+        round_step_times = []
+        start = time.perf_counter()
+        for _ in range(num_games):
+            round_step_times.extend(play(arena))
+        elapsed = time.perf_counter() - start
+        if best_elapsed is None or elapsed < best_elapsed:
+            best_elapsed, step_times = elapsed, round_step_times
+    elapsed = best_elapsed
+
+    # Measure memory in a separate game, since tracing allocations slows down the steps
+    tracemalloc.start()
+    play(arena)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    step_times.sort()
+    return {
+        "config": os.path.relpath(config_path, ROOT_DIR),
+        "num_games": num_games,
+        "repeats": repeats,
+        "steps_per_game": len(step_times) / num_games,
+        "games_per_s": num_games / elapsed,
+        "steps_per_s": len(step_times) / elapsed,
+        "step_p50_ms": 1000 * statistics.median(step_times),
+        "step_p99_ms": 1000 * step_times[min(len(step_times) - 1, int(0.99 * len(step_times)))],
+        "peak_memory_mb": peak_memory / 2 ** 20,
+    }
+
+
+def measure_import(module="onuw.arena", repeats=5):
+    """
+    the best wall time of importing the module in a fresh interpreter
+    """
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    times = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", code], cwd=ROOT_DIR, capture_output=True, text=True, check=True)
+        times.append(float(output.stdout.strip().splitlines()[-1]))
+    return min(times)
+
+
+def git_commit():
+    try:
+        output = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True)
+    except OSError:
+        return None
+    return output.stdout.strip() or None
+
+
+def compare(results, baseline, threshold):
+    """
+    compare the metrics with the baseline, returning (name, metric, baseline, current, relative change, regressed) rows
+    """
+    rows = []
+    pairs = [("suite", {"import_s": results["import_s"]}, {"import_s": baseline.get("import_s")})]
+    pairs += [(env_type, metrics, baseline["envs"].get(env_type, {})) for env_type, metrics in results["envs"].items()]
+    for name, metrics, baseline_metrics in pairs:
+        for metric, higher_is_better in HIGHER_IS_BETTER.items():
+            if metrics.get(metric) is None or not baseline_metrics.get(metric):
+                continue
+            change = metrics[metric] / baseline_metrics[metric] - 1
+            regressed = -change > threshold if higher_is_better else change > threshold
+            rows.append((name, metric, baseline_metrics[metric], metrics[metric], change, regressed))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--envs", type=str, nargs="+", default=None, help="environment types, defaults to all")
+    parser.add_argument("--num_games", type=int, default=50, help="number of timed games of each environment in a round")
+    parser.add_argument("--repeats", type=int, default=3, help="number of rounds, of which the fastest is kept")
+    parser.add_argument("--structure", type=str, default=None, help="agent structure of all players, defaults to the configs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, help="path to save the results as JSON")
+    parser.add_argument("--baseline", type=str, help="results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative change of a metric flagged as a regression")
+    args = parser.parse_args()
+
+    configs = env_configs()
+    missing = [env_type for env_type in ENV_REGISTRY if env_type not in configs]
+    if missing:
+        print(f"No config in configs/ for {', '.join(missing)}, skipped.")
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "num_games": args.num_games,
+            "repeats": args.repeats,
+            "structure": args.structure,
+        },
+        "import_s": measure_import(),
+        "envs": {},
+    }
+    print(f"import onuw.arena: {results['import_s']:.3f}s")
+    print(f"{'env':>16} {'steps':>6} {'games/s':>8} {'steps/s':>8} {'p50 ms':>7} {'p99 ms':>7} {'peak MB':>8}")
+    for env_type in args.envs or ENV_REGISTRY:
+        if env_type not in configs:
+            continue
+        result = benchmark_env(configs[env_type], args.num_games, args.repeats, args.structure, args.seed)
+        results["envs"][env_type] = result
+        print(f"{env_type:>16} {result['steps_per_game']:>6.1f} {result['games_per_s']:>8.2f} {result['steps_per_s']:>8.1f} "
+              f"{result['step_p50_ms']:>7.3f} {result['step_p99_ms']:>7.3f} {result['peak_memory_mb']:>8.2f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("structure") != args.structure:
+            print(f"Warning: the baseline was run with structure {baseline['meta'].get('structure')}, not {args.structure}.")
+        rows = compare(results, baseline, args.threshold)
+        print(f"\nCompared with {args.baseline} (commit {baseline['meta'].get('commit')}), threshold {args.threshold:.0%}:")
+        print(f"{'name':>16} {'metric':>15} {'baseline':>10} {'current':>10} {'change':>8}")
+        for name, metric, before, after, change, regressed in rows:
+            print(f"{name:>16} {metric:>15} {before:>10.3f} {after:>10.3f} {change:>+8.1%}" + ("  REGRESSION" if regressed else ""))
+        regressions = [row for row in rows if row[-1]]
+        if regressions:
+            print(f"{len(regressions)} regressions.")
+            sys.exit(1)
+        print("No regressions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark how the game engine scales with the number of players.
+All players use the offline `scripted` backend, so only the engine and prompt construction are measured.
+
+Usage (from the root of the repository):
+    python -m benchmarks.scaling --num_players 5 10 20 30 50 --num_games 3
+"""
+import os
+import json
+import time
+import random
+import argparse
+import statistics
+import tracemalloc
+
+from onuw.arena import Arena
+from onuw.config import ArenaConfig
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The 10-player config uses a global prompt with placeholders, so it fits games of any size
+TEMPLATE_CONFIG = os.path.join(ROOT_DIR, "configs", "werewolf_10p.json")
+SPECIAL_ROLES = ["Seer", "Robber", "Troublemaker", "Insomniac"]
+
+
+def make_role_pool(num_players):
+    """
+    a role pool with 3 more roles than players, a quarter of the players being Werewolves
+    """
+    num_werewolves = max(2, num_players // 4)
+    num_villagers = max(0, num_players + 3 - num_werewolves - len(SPECIAL_ROLES))
+    role_pool = {"Werewolf": num_werewolves, "Villager": num_villagers}
+    for role in SPECIAL_ROLES[:num_players + 3 - num_werewolves - num_villagers]:
+        role_pool[role] = 1
+    return role_pool
+
+
+def make_config(num_players, structure="dpins:no", max_discuss_round=3, latency=0., seed=0):
+    with open(TEMPLATE_CONFIG, "r") as f:
+        template = json.load(f)
+
+    players = []
+    for idx in range(num_players):
+        players.append({
+            "name": f"player{idx + 1}",
+            "role": "",  # assigned randomly
+            "backend": {"backend_type": "scripted", "seed": seed + idx, "latency": latency},
+            "structure": structure
+        })
+    return ArenaConfig({
+        "name": template["name"],
+        "global_prompt": template["global_prompt"],
+        "environment": {
+            "env_type": "werewolf",
+            "role_pool": make_role_pool(num_players),
+            "max_discuss_round": max_discuss_round,
+        },
+        "players": players
+    })
+
+
+def record_prompt_sizes(arena):
+    """
+    wrap the backends of all players to record the number of characters sent in each query
+    """
+    prompt_sizes = []
+    for player in arena.players:
+        query = player.backend.query
+
+        def recorded_query(agent_name, prompts, request_msg=None, *args, _query=query, **kwargs):
+            prompt_sizes.append(sum(len(prompt) for prompt in prompts.values()) + len(request_msg or ""))
+            return _query(agent_name, prompts, request_msg, *args, **kwargs)
+
+        player.backend.query = recorded_query
+    return prompt_sizes
+
+
+def play(arena):
+    """
+    play one game to the end, returning the wall time of each step
+    """
+    step_times = []
+    timestep = arena.reset()
+    while not timestep.terminal:
+        start = time.perf_counter()
+        timestep = arena.step()
+        step_times.append(time.perf_counter() - start)
+    return step_times
+
+
+def benchmark(num_players, num_games, structure, max_discuss_round, seed):
+    random.seed(seed)
+    arena = Arena.from_config(make_config(num_players, structure, max_discuss_round, seed=seed), randomness=True)
+    prompt_sizes = record_prompt_sizes(arena)
+
+    step_times = []
+    for _ in range(num_games):
+        step_times.extend(play(arena))
+
+    # Measure memory in a separate game, since tracing allocations slows down the steps
+    tracemalloc.start()
+    play(arena)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    step_times.sort()
+    return {
+        "num_players": num_players,
+        "steps_per_game": len(step_times) / num_games,
+        "step_mean_ms": 1000 * statistics.mean(step_times),
+        "step_p99_ms": 1000 * step_times[min(len(step_times) - 1, int(0.99 * len(step_times)))],
+        "game_s": sum(step_times) / num_games,
+        "peak_memory_mb": peak_memory / 2 ** 20,
+        "prompt_mean_chars": statistics.mean(prompt_sizes),
+        "prompt_max_chars": max(prompt_sizes),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_players", type=int, nargs="+", default=[5, 10, 20, 30, 50], help="player counts to benchmark")
+    parser.add_argument("--num_games", type=int, default=3, help="number of timed games for each player count")
+    parser.add_argument("--structure", type=str, default="dpins:no", help="agent structure of all players")
+    parser.add_argument("--max_discuss_round", type=int, default=3, help="number of discussion rounds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, help="path to save the results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    header = f"{'players':>8} {'steps':>7} {'step ms':>9} {'p99 ms':>8} {'game s':>8} {'peak MB':>8} {'prompt':>8} {'max prompt':>11}"
+    print(header)
+    for num_players in args.num_players:
+        result = benchmark(num_players, args.num_games, args.structure, args.max_discuss_round, args.seed)
+        results.append(result)
+        print(f"{result['num_players']:>8} {result['steps_per_game']:>7.0f} {result['step_mean_ms']:>9.3f} {result['step_p99_ms']:>8.3f} "
+              f"{result['game_s']:>8.3f} {result['peak_memory_mb']:>8.2f} {result['prompt_mean_chars']:>8.0f} {result['prompt_max_chars']:>11}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
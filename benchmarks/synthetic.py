@@ -0,0 +1,86 @@
+"""
+Synthetic game histories in the format written by `Arena.save_history`, for benchmarks that need many or long games.
+"""
+import os
+import json
+import random
+
+SPEAKING_STRATEGIES = ["honest_evidence", "deceptive_evidence", "honest_accusation",
+                       "deceptive_accusation", "honest_defense", "deceptive_defense"]
+ROLES = ["Werewolf", "Werewolf", "Seer", "Robber", "Troublemaker", "Insomniac", "Villager", "Villager"]
+WORDS = ["I", "think", "player", "is", "the", "Werewolf", "because", "said", "checked", "swapped",
+         "role", "night", "not", "trust", "me", "Seer", "Robber", "vote", "for", "suspicious"]
+
+
+def _message(agent_name, content, turn, visible_to="all", belief="", strategy=""):
+    return {"agent_name": agent_name, "belief": belief, "strategy": strategy, "content": content, "thought": "",
+            "turn": turn, "timestamp": "0", "visible_to": visible_to, "msg_type": "text"}
+
+
+def _sentence(rng, num_words):
+    return " ".join(rng.choice(WORDS) for _ in range(num_words)) + "."
+
+
+def make_history(num_players=5, num_rounds=3, speech_words=40, seed=None):
+    """
+    make one game history with random speeches, following the message flow of the `werewolf` environment
+    """
+    rng = random.Random(seed)
+    player_names = [f"player{idx + 1}" for idx in range(num_players)]
+    roles = ROLES + ["Villager"] * max(0, num_players + 3 - len(ROLES))
+    rng.shuffle(roles)
+    roles_assigned = dict(zip(player_names, roles))
+
+    messages, turn = [], 0
+    messages.append(_message("Moderator", "Welcome to the One Night Ultimate Werewolf game.", turn))
+    for player in player_names:  # private night information
+        turn += 1
+        messages.append(_message("Moderator", f"Your role is {roles_assigned[player]}.", turn, visible_to=player))
+    turn += 1
+    messages.append(_message("Moderator", f"Night phase ends. Everyone, wake up! Now we will start discussion from {player_names[0]}.", turn))
+    for round_idx in range(num_rounds):
+        for player in player_names:
+            turn += 1
+            messages.append(_message(player, _sentence(rng, speech_words), turn,
+                                     belief=_sentence(rng, speech_words // 2), strategy=rng.choice(SPEAKING_STRATEGIES)))
+        turn += 1
+        if round_idx < num_rounds - 1:
+            messages.append(_message("Moderator", f"Discussion round {round_idx + 1} ends.", turn))
+        else:
+            messages.append(_message("Moderator", "Day phase ends. Now vote which of the other players is the Werewolf.", turn))
+
+    voting_result = {player: 0 for player in player_names}
+    for player in player_names:
+        turn += 1
+        vote = rng.choice([other for other in player_names if other != player])
+        voting_result[vote] += 1
+        messages.append(_message(player, f"I am voting for {vote}.", turn, visible_to=player))
+    turn += 1
+    winner = rng.choice(["Team Village", "Team Werewolf", "Draw"])
+    messages.append(_message("Moderator", f"Game over. {winner} wins.", turn))
+
+    return {
+        "messages": messages,
+        "evaluation": {
+            "roles_assigned": roles_assigned,
+            "roles_ground_truth": roles_assigned,
+            "role_pool": roles[num_players:],
+            "player_backends": {player: "scripted" for player in player_names},
+            "voting_result": voting_result,
+            "winner": winner
+        }
+    }
+
+
+def write_histories(dir_path, num_games, seed=0, **kwargs):
+    """
+    write synthetic game histories as JSON files to dir_path, returning their paths
+    """
+    os.makedirs(dir_path, exist_ok=True)
+    paths = []
+    for idx in range(num_games):
+        path = os.path.join(dir_path, f"synthetic_{idx:06d}.json")
+        with open(path, "w") as f:
+            json.dump(make_history(seed=seed + idx, **kwargs), f)
+        paths.append(path)
+    return paths
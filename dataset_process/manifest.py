@@ -0,0 +1,111 @@
+import os
+import json
+import hashlib
+
+
+def file_hash(file_path, block_size=1 << 20):
+    """
+    SHA256 of the content of a file.
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, mode='rb') as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+class Manifest(object):
+    """
+    The manifest of game histories processed into a TransitionStore.
+    Each history is recorded with its size, modification time, content hash and the rows of its transitions in the store.
+    Rows of changed or deleted histories are marked as stale until the store is compacted.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.files = {}  # file name -> {"size", "mtime", "sha256", "rows": [start, end]}
+        self.stale_rows = []  # [start, end] ranges of rows no longer backed by a history
+        self.num_rows = 0  # number of rows in the store when the manifest was saved
+        self._pending = {}  # file name -> fingerprint of histories waiting to be processed
+        if os.path.exists(path):
+            with open(path, mode='r') as f:
+                manifest = json.load(f)
+            self.files, self.stale_rows, self.num_rows = manifest["files"], manifest["stale_rows"], manifest["num_rows"]
+
+    def save(self, num_rows):
+        self.num_rows = num_rows
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, mode='w') as f:
+            json.dump({"files": self.files, "stale_rows": self.stale_rows, "num_rows": self.num_rows}, f)
+        os.replace(tmp_path, self.path)
+
+    def reset(self):
+        self.files, self.stale_rows, self.num_rows = {}, [], 0
+
+    def sync_with_store(self, num_rows):
+        """
+        Reconcile the manifest with the rows in the store.
+        args:
+            num_rows: the number of rows in the store
+        returns:
+            False if the manifest refers to rows missing from the store, in which case it should be rebuilt
+        """
+        if self.num_rows > num_rows or any(entry["rows"][1] > num_rows for entry in self.files.values()):
+            return False
+        if num_rows > self.num_rows:  # rows appended by an interrupted run that never reached the manifest
+            self.stale_rows.append([self.num_rows, num_rows])
+            self.num_rows = num_rows
+        return True
+
+    def diff(self, dir_path, file_names):
+        """
+        Compare the histories in dir_path with the manifest. Rows of changed and deleted histories become stale.
+        args:
+            dir_path: the path of all game histories
+            file_names: the names of the histories in dir_path
+        returns:
+            the paths of new or changed histories to process
+        """
+        pending_paths = []
+        self._pending = {}
+        for file_name in file_names:
+            file_path = os.path.join(dir_path, file_name)
+            stat = os.stat(file_path)
+            entry = self.files.get(file_name)
+            if entry is not None and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+                continue  # unchanged, without reading the file
+
+            sha256 = file_hash(file_path)
+            if entry is not None and entry["sha256"] == sha256:  # touched but unchanged
+                entry["mtime"] = stat.st_mtime
+                continue
+            if entry is not None:  # changed
+                self.stale_rows.append(self.files.pop(file_name)["rows"])
+            self._pending[file_name] = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": sha256}
+            pending_paths.append(file_path)
+
+        deleted = set(self.files) - set(file_names)
+        for file_name in deleted:
+            self.stale_rows.append(self.files.pop(file_name)["rows"])
+        return pending_paths
+
+    def add(self, file_path, start, end):
+        """
+        Record a processed history and the rows of its transitions.
+        """
+        file_name = os.path.basename(file_path)
+        entry = self._pending.pop(file_name)
+        entry["rows"] = [start, end]
+        self.files[file_name] = entry
+
+    def live_ranges(self):
+        """
+        Get the non-empty row ranges of recorded histories, sorted by their position in the store.
+        returns:
+            list of (file name, start, end)
+        """
+        ranges = [(file_name, entry["rows"][0], entry["rows"][1]) for file_name, entry in self.files.items()]
+        return sorted([r for r in ranges if r[2] > r[1]], key=lambda r: r[1])
+
+    @property
+    def num_stale_rows(self):
+        return sum(end - start for start, end in self.stale_rows)
@@ -1,8 +1,15 @@
 import os
-import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from tqdm import tqdm
 import numpy as np
-from utils import get_embeddings
+from utils import get_embeddings_batch, BACKEND_BATCH_SIZE
+from store import TransitionStore
+from manifest import Manifest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from onuw.storage import iter_histories  # noqa: E402
 
 SPEAKING_STRATEGY = {
     "honest_evidence": 0,
@@ -16,10 +23,25 @@ TEAM_VILLAGE = ["Insomniac", "Robber", "Seer", "Troublemaker", "Villager"]
 TEAM_WEREWOLF = ["Werewolf"]
 
 
+def _parse_history_file(file_path):
+    """
+    Parse one game history in a worker process.
+    """
+    return DataProcessor()._parse_history(file_path)
+
+
 class DataProcessor(object):
-    def __init__(self, embedding_model="gemini"):
+    def __init__(self, embedding_model="gemini", batch_size=None, max_concurrency=4, num_workers=None, chunk_size=1000):
         self.embedding_model = embedding_model
-        # all transitions
+        # embedding requests
+        self.batch_size = batch_size if batch_size else BACKEND_BATCH_SIZE.get(embedding_model, 1)
+        self.max_concurrency = max_concurrency
+        self.embedding_stats = {"observations": 0, "embedded": 0, "requests": 0, "seconds": 0.}
+        # parsing pipeline, games are parsed by num_workers processes and embedded chunk_size games at a time
+        self.num_workers = num_workers if num_workers else os.cpu_count()
+        self.chunk_size = chunk_size
+        # all transitions, kept in memory or streamed to the on-disk store
+        self.store = None
         self.observations = []
         self.actions = []
         self.rewards = []
@@ -29,17 +51,112 @@ class DataProcessor(object):
         self.game_info = None
         self.day_start_idx = 0  # include
         self.day_end_idx = 0  # not include
+        # shared history buffers of one game, built once and used by all players
+        self._lines = []  # "\n[agent_name]: content" of each message before the Day phase ends
+        self._day_buffer = ""  # concatenated lines of the Day phase
+        self._day_offsets = []  # length of the day buffer before each message of the Day phase
+        self._day_speeches = {}  # player name -> indexes of the player's messages in the Day phase
     
-    def process_dataset(self, dir_path):
+    def process_dataset(self, dir_path, store_dir=None):
         """
         Process all game histories in dir_path
         args:
             dir_path: the path of all game histories
+            store_dir: if given, stream transitions to an on-disk store in this directory instead of keeping them in memory
         """
         self.clear()
-        for file_name in tqdm(os.listdir(dir_path)):
-            file_path = os.path.join(dir_path, file_name)
-            self.process_history(file_path)
+        if store_dir is not None:
+            self.store = TransitionStore(store_dir)
+            self.store.clear()
+        file_paths = [os.path.join(dir_path, file_name) for file_name in sorted(os.listdir(dir_path))]
+        self.process_histories(file_paths)
+    
+    def update_dataset(self, dir_path, store_dir):
+        """
+        Incrementally update the on-disk store with the game histories in dir_path.
+        Only new or changed histories are parsed and embedded, according to the manifest kept in store_dir,
+        and the transitions of changed or deleted histories are removed.
+        args:
+            dir_path: the path of all game histories
+            store_dir: the directory of the on-disk store and its manifest
+        returns:
+            whether the transitions in the store changed
+        """
+        self.clear()
+        self.store = TransitionStore(store_dir)
+        manifest = Manifest(os.path.join(store_dir, "manifest.json"))
+        if not manifest.sync_with_store(len(self.store)):  # inconsistent with the store, rebuild from scratch
+            self.store.clear()
+            manifest.reset()
+        
+        pending_paths = manifest.diff(dir_path, sorted(os.listdir(dir_path)))
+        changed = len(pending_paths) > 0 or manifest.num_stale_rows > 0
+        self.process_histories(pending_paths, manifest=manifest)
+        
+        if manifest.num_stale_rows > 0:  # drop stale transitions, keeping every history's transitions contiguous
+            live_ranges = manifest.live_ranges()
+            new_starts = self.store.compact([(start, end) for _, start, end in live_ranges])
+            for file_name, entry in manifest.files.items():
+                entry["rows"] = [0, 0]
+            for (file_name, start, end), new_start in zip(live_ranges, new_starts):
+                manifest.files[file_name]["rows"] = [new_start, new_start + end - start]
+            manifest.stale_rows = []
+        manifest.save(len(self.store))
+        return changed
+    
+    def process_histories(self, file_paths, manifest=None):
+        """
+        Process game histories chunk by chunk: a worker pool parses the games of a chunk,
+        whose observations are then deduplicated, embedded together and added to the transitions.
+        args:
+            file_paths: the paths of the game histories
+            manifest: if given, record the rows of each history in the on-disk store to the manifest
+        """
+        executor = ProcessPoolExecutor(max_workers=self.num_workers) if self.num_workers > 1 and len(file_paths) > 1 else None
+        try:
+            with tqdm(total=len(file_paths)) as progress:
+                for start in range(0, len(file_paths), self.chunk_size):
+                    chunk = file_paths[start: start + self.chunk_size]
+                    if executor is not None:
+                        results = executor.map(_parse_history_file, chunk, chunksize=max(1, len(chunk) // (4 * self.num_workers)))
+                    else:
+                        results = map(self._parse_history, chunk)
+                    results = list(results)
+                    start_row = len(self.store) if self.store is not None else 0
+                    self._add_trajectories([trajectory for result in results for trajectory in result])
+                    if manifest is not None:
+                        for file_path, result in zip(chunk, results):
+                            num_rows = sum(len(acts) for _, acts, _, _ in result)
+                            manifest.add(file_path, start_row, start_row + num_rows)
+                            start_row += num_rows
+                        manifest.save(len(self.store))
+                    progress.update(len(chunk))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+    
+    def _add_trajectories(self, trajectories):
+        """
+        Embed the observations of trajectories at once, then scatter the embeddings back to the transitions.
+        args:
+            trajectories: list of (observations, actions, rewards, terminals)
+        """
+        embeddings = self._embed_all([obs for obs_list, _, _, _ in trajectories for obs in obs_list])
+        if self.store is not None:
+            if len(trajectories) > 0:
+                self.store.append(embeddings,
+                                  np.concatenate([acts for _, acts, _, _ in trajectories]),
+                                  np.concatenate([rews for _, _, rews, _ in trajectories]),
+                                  np.concatenate([terms for _, _, _, terms in trajectories]))
+            return
+        
+        offset = 0
+        for obs_list, acts, rews, terms in trajectories:
+            self.observations.append(embeddings[offset: offset + len(obs_list)])
+            self.actions.append(acts)
+            self.rewards.append(rews)
+            self.terminals.append(terms)
+            offset += len(obs_list)
     
     def process_history(self, file_path):
         """
@@ -47,10 +164,62 @@ class DataProcessor(object):
         args:
             file_path: the path of the game history
         """
-        with open(file_path, mode='r') as f:
-            history = json.load(f)
-        self.messages, self.game_info = history["messages"], history["evaluation"]
+        self.process_histories([file_path])
+    
+    def _parse_history(self, file_path):
+        """
+        Parse a game history file into the trajectories of all players, with observations not embedded yet.
+        args:
+            file_path: the path of the game history, a json file or a columnar (.onuwc) shard of many games
+        returns:
+            list of (observations, actions, rewards, terminals) of each player of each game
+        """
+        trajectories = []
+        for history in iter_histories([file_path]):
+            self.messages, self.game_info = history["messages"], history["evaluation"]
+            self._index_game()
+            
+            # get all player names
+            player_names = list(self.game_info["roles_ground_truth"].keys())
+            # gather all players' trajectory
+            for player in player_names:
+                obs, acts, rews, terms, _ = self._get_transitions(player)
+                trajectories.append((obs, acts, rews, terms))
+        return trajectories
+    
+    def _embed_all(self, contents):
+        """
+        Embed contents after deduplication, in provider-sized batches with bounded concurrency.
+        args:
+            contents: the list of contents to embed
+        returns:
+            embeddings of contents (numpy.array), in the same order as contents
+        """
+        start = time.perf_counter()
+        unique_idx = {}
+        content_idx = np.array([unique_idx.setdefault(content, len(unique_idx)) for content in contents], dtype=np.int64)
+        unique_contents = list(unique_idx)
+        batches = [unique_contents[i: i + self.batch_size] for i in range(0, len(unique_contents), self.batch_size)]
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            results = list(executor.map(self._embed_batch, batches))
+        embeddings = np.array([embedding for result in results for embedding in result], dtype=np.float32)
         
+        self.embedding_stats["observations"] += len(contents)
+        self.embedding_stats["embedded"] += len(unique_contents)
+        self.embedding_stats["requests"] += len(batches)
+        self.embedding_stats["seconds"] += time.perf_counter() - start
+        return embeddings[content_idx] if len(unique_contents) > 0 else embeddings
+    
+    def _embed_batch(self, contents):
+        """
+        Embed one batch of contents with the embedding model.
+        """
+        return get_embeddings_batch(contents, backend=self.embedding_model)
+    
+    def _index_game(self):
+        """
+        Find the Day phase of the current game and build the history buffers shared by all players in one pass.
+        """
         # find the day phase start and end index
         for idx, message in enumerate(self.messages):
             if message["agent_name"] == "Moderator":
@@ -60,15 +229,27 @@ class DataProcessor(object):
                     self.day_end_idx = idx
                     break
         
-        # get all player names
-        player_names = list(self.game_info["roles_ground_truth"].keys())
-        # gather all players' trajectory
-        for player in player_names:
-            obs, acts, rews, terms, _ = self._get_transitions(player)
-            self.observations.append(obs)
-            self.actions.append(acts)
-            self.rewards.append(rews)
-            self.terminals.append(terms)
+        self._lines = [f"\n[{message['agent_name']}]: {message['content']}" for message in self.messages[:self.day_end_idx]]
+        self._day_offsets = []
+        self._day_speeches = {}
+        offset = 0
+        for idx in range(self.day_start_idx, self.day_end_idx):
+            self._day_offsets.append(offset)
+            offset += len(self._lines[idx])
+            self._day_speeches.setdefault(self.messages[idx]["agent_name"], []).append(idx)
+        self._day_buffer = "".join(self._lines[self.day_start_idx: self.day_end_idx])
+    
+    @staticmethod
+    def _is_visible(message, player):
+        """
+        Check whether a message is visible to player. `visible_to` is "all", a player name or a list of player names.
+        """
+        visible_to = message["visible_to"]
+        if visible_to == "all":
+            return True
+        if isinstance(visible_to, str):
+            return visible_to == player
+        return player in visible_to
     
     def _get_transitions(self, player):
         """
@@ -76,25 +257,21 @@ class DataProcessor(object):
         args:
             player: the name of player
         returns:
-            observations, actions, rewards, terminals, original_rewards (all numpy.array)
+            observations (list of str, to be embedded), actions, rewards, terminals, original_rewards (numpy.array)
         """
         # get visible messages in night phase
-        visible_messages = ""
-        for message in self.messages[:self.day_start_idx]:
-            if message["visible_to"] == "all" or player in message["visible_to"]:
-                visible_messages = f"{visible_messages}\n[{message['agent_name']}]: {message['content']}"
+        night_messages = "".join(self._lines[idx] for idx in range(self.day_start_idx) if self._is_visible(self.messages[idx], player))
         
-        # extract observations and actions
+        # extract observations and actions, the history before each speech is a prefix of the shared day buffer
         observations = []
         actions = []
-        for message in self.messages[self.day_start_idx: self.day_end_idx]:
-            if message["agent_name"] == player:
-                obs = f"<Game history>:{visible_messages}\n<My thought and belief>: {message['belief']}".strip()
-                observations.append(get_embeddings(obs, backend=self.embedding_model))
-                actions.append(SPEAKING_STRATEGY[message["strategy"]])
-            visible_messages = f"{visible_messages}\n[{message['agent_name']}]: {message['content']}"
+        for idx in self._day_speeches.get(player, []):
+            message = self.messages[idx]
+            day_messages = self._day_buffer[:self._day_offsets[idx - self.day_start_idx]]
+            obs = f"<Game history>:{night_messages}{day_messages}\n<My thought and belief>: {message['belief']}".strip()
+            observations.append(obs)
+            actions.append(SPEAKING_STRATEGY[message["strategy"]])
         
-        observations = np.array(observations)
         actions = np.array(actions)
         # get rewards
         rew, ori_rew = self._calc_reward(player)
@@ -131,6 +308,7 @@ class DataProcessor(object):
         """
         Clear data caches in the buffer.
         """
+        self.store = None
         self.observations.clear()
         self.actions.clear()
         self.rewards.clear()
@@ -138,8 +316,10 @@ class DataProcessor(object):
     
     def get_dataset(self):
         """
-        Get transitions in the buffer.
+        Get transitions in the buffer, memory-mapped from the on-disk store if transitions were streamed to it.
         """
+        if self.store is not None:
+            return self.store.load()
         observations = np.concatenate(self.observations)
         actions = np.concatenate(self.actions)
         rewards = np.concatenate(self.rewards)
@@ -152,10 +332,7 @@ class DataProcessor(object):
         args:
             save_path: the path of saved dataset
         """
-        observations = np.concatenate(self.observations)
-        actions = np.concatenate(self.actions)
-        rewards = np.concatenate(self.rewards)
-        terminals = np.concatenate(self.terminals)
+        observations, actions, rewards, terminals = self.get_dataset()
 
         import d3rlpy
         dataset = d3rlpy.dataset.MDPDataset(
@@ -170,6 +347,9 @@ class DataProcessor(object):
 
 
 if __name__ == "__main__":
+    save_path = "./processed_dataset.h5"
     processor = DataProcessor(embedding_model="openai")
-    processor.process_dataset(dir_path="../results/dataset")
-    processor.save_dataset(save_path="./processed_dataset.h5")
+    # only new or changed histories are processed, and the dataset is rewritten only if the transitions changed
+    changed = processor.update_dataset(dir_path="../results/dataset", store_dir="./processed_transitions")
+    if changed or not os.path.exists(save_path):
+        processor.save_dataset(save_path=save_path)
@@ -0,0 +1,135 @@
+import os
+import json
+import numpy as np
+
+# The columns of transitions and their data types on disk
+COLUMNS = {
+    "observations": np.float32,
+    "actions": np.int64,
+    "rewards": np.float32,
+    "terminals": np.float32
+}
+
+
+class TransitionStore(object):
+    """
+    An appendable on-disk store of transitions.
+    Each column is a raw binary file of fixed-width rows, so chunks are appended without loading the stored data,
+    and the whole store is read back with memory-mapping.
+    """
+    def __init__(self, dir_path):
+        self.dir_path = dir_path
+        self.meta_path = os.path.join(dir_path, "meta.json")
+        os.makedirs(dir_path, exist_ok=True)
+
+        self.num_rows = 0
+        self.obs_dim = None
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, mode='r') as f:
+                meta = json.load(f)
+            self.num_rows, self.obs_dim = meta["num_rows"], meta["obs_dim"]
+        self._truncate()
+
+    def _column_path(self, column):
+        return os.path.join(self.dir_path, f"{column}.bin")
+
+    def _row_width(self, column):
+        return self.obs_dim if column == "observations" else 1
+
+    def _truncate(self):
+        """
+        Drop rows written after the last committed meta, e.g. by an interrupted append.
+        """
+        for column, dtype in COLUMNS.items():
+            path = self._column_path(column)
+            if os.path.exists(path):
+                size = self.num_rows * (self._row_width(column) or 0) * np.dtype(dtype).itemsize
+                if os.path.getsize(path) > size:
+                    with open(path, mode='r+b') as f:
+                        f.truncate(size)
+
+    def _write_meta(self):
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, mode='w') as f:
+            json.dump({"num_rows": self.num_rows, "obs_dim": self.obs_dim}, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def append(self, observations, actions, rewards, terminals):
+        """
+        Append a chunk of transitions to the store.
+        args:
+            observations: embeddings of shape (num_rows, obs_dim)
+            actions, rewards, terminals: arrays of shape (num_rows,)
+        """
+        if len(actions) == 0:
+            return
+        observations = np.asarray(observations, dtype=np.float32).reshape(len(actions), -1)
+        if self.obs_dim is None:
+            self.obs_dim = observations.shape[1]
+        assert observations.shape[1] == self.obs_dim, f"Observation dim {observations.shape[1]} does not match the store ({self.obs_dim})."
+
+        data = {"observations": observations, "actions": actions, "rewards": rewards, "terminals": terminals}
+        for column, dtype in COLUMNS.items():
+            with open(self._column_path(column), mode='ab') as f:
+                np.ascontiguousarray(data[column], dtype=dtype).tofile(f)
+        # commit the rows only after all columns are written
+        self.num_rows += len(actions)
+        self._write_meta()
+
+    def load(self):
+        """
+        Memory-map all transitions in the store.
+        returns:
+            observations, actions, rewards, terminals (numpy.memmap)
+        """
+        arrays = []
+        for column, dtype in COLUMNS.items():
+            width = self._row_width(column) or 0
+            shape = (self.num_rows, width) if column == "observations" else (self.num_rows,)
+            if self.num_rows == 0:
+                arrays.append(np.zeros(shape, dtype=dtype))
+            else:
+                arrays.append(np.memmap(self._column_path(column), dtype=dtype, mode='r', shape=shape))
+        return tuple(arrays)
+
+    def compact(self, ranges, chunk_rows=65536):
+        """
+        Rewrite the store to keep only the given row ranges, copying a bounded number of rows at a time.
+        args:
+            ranges: list of (start, end) row ranges to keep, in the new order
+            chunk_rows: the maximum number of rows copied at once
+        returns:
+            the new start row of each range
+        """
+        old_arrays = self.load()
+        new_starts, num_rows = [], 0
+        for start, end in ranges:
+            new_starts.append(num_rows)
+            num_rows += end - start
+        
+        for column, array in zip(COLUMNS, old_arrays):
+            tmp_path = self._column_path(column) + ".tmp"
+            with open(tmp_path, mode='wb') as f:
+                for start, end in ranges:
+                    for chunk_start in range(start, end, chunk_rows):
+                        np.ascontiguousarray(array[chunk_start: min(end, chunk_start + chunk_rows)]).tofile(f)
+        del old_arrays, array  # release the memory maps before replacing the files
+        
+        for column in COLUMNS:
+            os.replace(self._column_path(column) + ".tmp", self._column_path(column))
+        self.num_rows = num_rows
+        self._write_meta()
+        return new_starts
+
+    def clear(self):
+        """
+        Remove all transitions in the store.
+        """
+        for column in COLUMNS:
+            if os.path.exists(self._column_path(column)):
+                os.remove(self._column_path(column))
+        self.num_rows, self.obs_dim = 0, None
+        self._write_meta()
+
+    def __len__(self):
+        return self.num_rows
@@ -32,6 +32,11 @@ BACKEND_MODEL = {
     "gemini": "models/embedding-001",  # 768
     "openai": "text-embedding-ada-002"  # 1536
 }
+# The maximum number of inputs in one embedding request
+BACKEND_BATCH_SIZE = {
+    "gemini": 100,
+    "openai": 2048
+}
 
 
 @retry(stop=stop_after_attempt(6), wait=wait_random_exponential(min=1, max=60))
@@ -55,6 +60,35 @@ def get_embeddings(content, backend="gemini"):
     return embedding
 
 
+@retry(stop=stop_after_attempt(6), wait=wait_random_exponential(min=1, max=60))
+def get_embeddings_batch(contents, backend="gemini"):
+    """
+    Embed a batch of contents in one request.
+    args:
+        contents: the list of contents, no longer than BACKEND_BATCH_SIZE[backend]
+        backend: the embedding backend
+    returns:
+        the list of embeddings, in the same order as contents
+    """
+    contents = [content.replace("\n\n", "\n").replace("\n", " ") for content in contents]
+    if backend == "gemini":
+        result = genai.embed_content(
+            model=BACKEND_MODEL[backend],
+            content=contents,
+            task_type="semantic_similarity"
+        )
+        embeddings = result["embedding"]
+    elif backend == "openai":
+        result = openai.Embedding.create(
+            input=contents,
+            model=BACKEND_MODEL[backend]
+        )
+        embeddings = [item.embedding for item in sorted(result.data, key=lambda item: item.index)]
+    else:
+        embeddings = [[] for _ in contents]
+    return embeddings
+
+
 if __name__ == "__main__":
     content = "How are you?"
     result = get_embeddings(content, backend="gemini")
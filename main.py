@@ -1,24 +1,30 @@
 import os
 import time
 import argparse
-from dotenv import load_dotenv, find_dotenv
+from onuw.utils import load_env
 
-load_dotenv(find_dotenv(), override=True)
+load_env()
 
 from onuw.arena import Arena
+from onuw import metrics, tracing, profiling
 
 ENV_CONFIGS = {
     "Werewolf": "werewolf.json",  # standard 5-player game
     "WerewolfEasy": "werewolf_easy.json",  # fixed 5-player game in the easy setting
     "WerewolfHard": "werewolf_hard.json",  # fixed 5-player game in the hard setting
     "Werewolf3P": "werewolf_3p.json",  # 3-player game
-    "Werewolf3PWO": "werewolf_3p_wo.json"  # 3-player game without discussion
+    "Werewolf3PWO": "werewolf_3p_wo.json",  # 3-player game without discussion
+    "Werewolf10P": "werewolf_10p.json"  # 10-player game with 3 Werewolves
 }
 
 
 def main(args):
     config_path = os.path.join("configs", ENV_CONFIGS[args.env])
-    arena = Arena.from_config(config_path, randomness=args.random)
+    resume = args.checkpoint and args.resume and os.path.exists(args.checkpoint)
+    if resume:  # continue the unfinished game from its last checkpoint
+        arena = Arena.from_checkpoint(args.checkpoint)
+    else:
+        arena = Arena.from_config(config_path, randomness=args.random)
     
     config = arena.to_config()
     print(config.environment)
@@ -34,15 +40,23 @@ def main(args):
             model_name = "_".join(model_name_combinations)
     print("Model Name:", model_name)
 
+    if args.save_path and args.stream_history:  # write each game to a jsonl file while it is played
+        arena.stream_history(os.path.join(os.getcwd(), args.save_path), prefix=f"{model_name}_", current_game=resume)
+    if args.checkpoint and not resume:
+        arena.enable_checkpointing(args.checkpoint)
+
     for j in range(args.num_repeats):
         print(f"Repeat run {j+1} begins.")
         if args.cli:
             arena.launch_cli(interactive=True)
         else:
-            arena.reset()
-            arena.run(num_steps=30)
+            if resume and j == 0:
+                print(f"Resuming the game from {args.checkpoint}.")
+            else:
+                arena.reset()
+            arena.run(num_steps=None)  # to the end of the game
 
-        if args.save_path:  # save history
+        if args.save_path and not args.stream_history:  # save history
             cur_time = time.strftime("%Y-%m-%d-%H-%M-%S", time.localtime())
             save_dir = os.path.join(os.getcwd(), args.save_path)
             if not os.path.exists(save_dir):
@@ -59,8 +73,36 @@ if __name__ == "__main__":
     parser.add_argument("--random", action="store_true", default=False, help="whether to randomly assign roles at the beginning")
     parser.add_argument("--cli", action="store_true", default=False, help="whether to launch cli")
     parser.add_argument("--save_path", type=str, help="save path for game results")
+    parser.add_argument("--stream_history", action="store_true", default=False,
+                        help="stream game results to jsonl files in save_path while playing, instead of saving json files after each game")
+    parser.add_argument("--checkpoint", type=str, default=None, help="checkpoint the current game to this file after every step")
+    parser.add_argument("--resume", action="store_true", default=False,
+                        help="continue the unfinished game in the checkpoint file, if any, instead of starting a new one")
+    parser.add_argument("--metrics", type=str, default=None,
+                        help="record the latency and size of every backend query and save their histograms to this json file")
+    parser.add_argument("--trace", type=str, default=None,
+                        help="trace the steps of the games and save the spans to this file in the Chrome trace-event format")
+    parser.add_argument("--profile", type=str, default=None,
+                        help="profile the engine by sampling, excluding backend I/O, and save the collapsed stacks to this file")
+    parser.add_argument("--profile_top", type=int, default=20, help="number of hot functions printed by --profile")
     args = parser.parse_args()
 
+    if args.profile:
+        profiler = profiling.SamplingProfiler()
+        profiler.start()
+    if args.metrics:
+        recorder = metrics.enable()
+    if args.trace:
+        tracer = tracing.enable()
     for i in range(args.num_runs):
         print(f"Run {i+1} begins.")
         main(args)
+    if args.metrics:
+        recorder.print_summary()
+        recorder.save(args.metrics)
+    if args.trace:
+        tracer.save(args.trace)
+    if args.profile:
+        profiler.stop()
+        profiler.save_collapsed(args.profile)
+        profiler.print_summary(args.profile_top)
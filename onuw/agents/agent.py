@@ -5,18 +5,19 @@ import uuid
 from ..backends import IntelligenceBackend, load_backend
 from ..memory import SYSTEM_NAME
 from ..config import AgentConfig, Configurable, BackendConfig
+from .. import tracing
+from ..utils import LazyRegistry
 from .roles import ROLE_REGISTRY
-from .core import DPIns, ReAct, Human
-
-# agent structures
-AGENT_STRUCT = {
-    "react": ReAct,
-    "dpins:no": DPIns,
-    "dpins:random": DPIns,
-    "dpins:llm": DPIns,
-    "dpins:rl": DPIns,
-    "human": Human
-}
+
+# agent structures, whose cores are imported on first use
+AGENT_STRUCT = LazyRegistry({
+    "react": ".core.react:ReAct",
+    "dpins:no": ".core.dpins:DPIns",
+    "dpins:random": ".core.dpins:DPIns",
+    "dpins:llm": ".core.dpins:DPIns",
+    "dpins:rl": ".core.dpins:DPIns",
+    "human": ".core.human:Human"
+}, package=__package__)
 # A special signal sent by the player to indicate that it is not possible to continue the conversation, and it requests to end the conversation.
 # It contains a random UUID string to avoid being exploited by any of the players.
 SIGNAL_END_OF_CONVERSATION = f"<<<<<<END_OF_CONVERSATION>>>>>>{uuid.uuid4()}"
@@ -48,7 +49,7 @@ class Player(Agent):
     and perform an action (generate a response) based on the observation.
     """
     def __init__(self, name: str, role: str, backend: Union[BackendConfig, IntelligenceBackend], structure: str,
-                 global_prompt: str = None, **kwargs):
+                 global_prompt: str = None, context_budget: int = None, recent_speeches: int = 5, **kwargs):
         """
         Initialize the player with a name, role description, backend, and a global prompt.
 
@@ -58,6 +59,8 @@ class Player(Agent):
             backend (Union[BackendConfig, IntelligenceBackend]): The backend that will be used for decision making. It can be either a LLM backend or a Human backend.
             structure (str): The structure of LLM-based agent.
             global_prompt (str): A universal prompt that applies to all players. Defaults to None.
+            context_budget (int): The token budget of the conversation history in prompts (see `onuw.agents.context`). Defaults to None (no limit).
+            recent_speeches (int): The number of recent speeches kept verbatim when the history exceeds the budget. Defaults to 5.
         """
         if isinstance(backend, BackendConfig):
             backend_config = backend
@@ -71,7 +74,7 @@ class Player(Agent):
 
         # Register the fields in the _config
         super().__init__(name=name, role=role, backend=backend_config, structure=structure,
-                         global_prompt=global_prompt, **kwargs)
+                         global_prompt=global_prompt, context_budget=context_budget, recent_speeches=recent_speeches, **kwargs)
 
         self.backend = backend
         self.role = ROLE_REGISTRY[role](name=name)
@@ -79,7 +82,10 @@ class Player(Agent):
         self.structure = structure
 
         # initialize LLM-agent core
-        self.core = AGENT_STRUCT[self.structure](role=self.role, backend=self.backend, global_prompt=self.global_prompt, structure=self.structure)
+        self.context_budget = context_budget
+        self.recent_speeches = recent_speeches
+        self.core = AGENT_STRUCT[self.structure](role=self.role, backend=self.backend, global_prompt=self.global_prompt, structure=self.structure,
+                                                 context_budget=context_budget, recent_speeches=recent_speeches)
 
     def to_config(self) -> AgentConfig:
         return AgentConfig(
@@ -88,6 +94,8 @@ class Player(Agent):
             backend=self.backend.to_config(),
             structure=self.structure,
             global_prompt=self.global_prompt,
+            context_budget=self.context_budget,
+            recent_speeches=self.recent_speeches,
         )
 
     def act(self, observation: Dict) -> str:
@@ -100,7 +108,8 @@ class Player(Agent):
         Returns:
             str: The action (response) of the player.
         """
-        action = self.core.act(observation)  
+        with tracing.span("agent.act", player=self.name, phase=observation["current_phase"]):
+            action = self.core.act(observation)
         return action
 
     def __call__(self, observation: Dict) -> str:
@@ -112,3 +121,19 @@ class Player(Agent):
         This is usually called at the end of each episode.
         """
         self.backend.reset()
+
+    def get_state(self) -> Dict:
+        """
+        Get the state of the player in the current game, which is saved in checkpoints of the game.
+
+        Returns:
+            Dict: The state of the backend and the players the role can choose from.
+        """
+        return {"backend": self.backend.get_state(), "current_players": list(self.role.current_players)}
+
+    def set_state(self, state: Dict):
+        """
+        Restore the state returned by `get_state`, e.g. to resume a game.
+        """
+        self.backend.set_state(state["backend"])
+        self.role.current_players = list(state["current_players"])
@@ -0,0 +1,109 @@
+"""
+Token-budgeted windows of the conversation history put into the prompts of an agent.
+
+Without a budget, the window renders the whole history, as the prompts always did. With a budget, a history that
+does not fit is rendered as the private information of the agent (e.g. its night actions), verbatim, then a summary
+of the older public messages, then the most recent speeches, verbatim. The summary keeps the first sentence of each
+message, and is cached and extended as messages fall out of the recent speeches, so it is not rebuilt on every call.
+"""
+from typing import List, Optional
+import re
+
+from ..memory import Message, MODERATOR_NAME
+
+CHARS_PER_TOKEN = 4  # a rough estimate for English text, which avoids depending on the tokenizer of each provider
+SUMMARY_HEADER = "\n[Summary of the earlier conversation]:"
+_FIRST_SENTENCE = re.compile(r"^(.+?[.!?])(\s|$)")
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def format_message(message: Message) -> str:
+    return f"\n[{message.agent_name}]: {message.content}"
+
+
+def summarize_message(message: Message, max_chars: int = 160) -> str:
+    """
+    the first sentence of a message, at most max_chars long
+    """
+    content = message.content.strip()
+    match = _FIRST_SENTENCE.match(content)
+    sentence = match.group(1) if match else content
+    if len(sentence) > max_chars:
+        sentence = sentence[:max_chars - 3].rstrip() + "..."
+    return f"\n- {message.agent_name}: {sentence}"
+
+
+class HistoryWindow:
+    """
+    The window of the conversation history of one agent.
+
+    Parameters:
+        token_budget (int): The maximum estimated number of tokens of the rendered history, or None for no limit.
+        recent_speeches (int): The number of the most recent speeches of players kept verbatim.
+    """
+
+    def __init__(self, token_budget: Optional[int] = None, recent_speeches: int = 5):
+        self.token_budget = token_budget
+        self.recent_speeches = recent_speeches
+        # the running summary of the public messages before the recent speeches
+        self._summary_lines: List[str] = []
+        self._summarized: List[Message] = []
+        self.num_renders = 0
+        self.num_windowed = 0
+
+    def _public_split(self, public: List[Message]) -> int:
+        """
+        the index of the first public message kept verbatim, i.e. of the oldest of the recent speeches
+        """
+        num_speeches = 0
+        for idx in range(len(public) - 1, -1, -1):
+            if public[idx].agent_name != MODERATOR_NAME:
+                num_speeches += 1
+                if num_speeches == self.recent_speeches:
+                    return idx
+        return 0
+
+    def _summary(self, older: List[Message]) -> List[str]:
+        """
+        the summary lines of the older public messages, extending the cached summary if it covers a prefix of them
+        """
+        num_cached = len(self._summarized)
+        if num_cached > 0 and (num_cached > len(older) or older[0] is not self._summarized[0]
+                               or older[num_cached - 1] is not self._summarized[-1]):
+            self._summary_lines, self._summarized, num_cached = [], [], 0  # another game, start over
+        for message in older[num_cached:]:
+            self._summary_lines.append(summarize_message(message))
+            self._summarized.append(message)
+        return self._summary_lines
+
+    def render(self, history_messages: List[Message]) -> str:
+        """
+        Render the history as the text put into the prompts, within the token budget if possible.
+        The private messages and the most recent speeches are never dropped, so they may exceed a very small budget.
+        """
+        self.num_renders += 1
+        full = "".join(format_message(message) for message in history_messages)
+        if self.token_budget is None or estimate_tokens(full) <= self.token_budget:
+            return full
+
+        self.num_windowed += 1
+        private = [message for message in history_messages if message.visible_to != "all"]
+        public = [message for message in history_messages if message.visible_to == "all"]
+        split = self._public_split(public)
+        pinned = "".join(format_message(message) for message in private)
+        recent = "".join(format_message(message) for message in public[split:])
+
+        # keep the newest summary lines that fit into the rest of the budget
+        remaining = self.token_budget - estimate_tokens(pinned + recent + SUMMARY_HEADER)
+        summary_lines = self._summary(public[:split])
+        kept = []
+        for line in reversed(summary_lines):
+            remaining -= estimate_tokens(line)
+            if remaining < 0:
+                break
+            kept.append(line)
+        summary = SUMMARY_HEADER + "".join(reversed(kept)) if kept else ""
+        return pinned + summary + recent
@@ -1,3 +1,10 @@
-from .dpins import DPIns
-from .react import ReAct
-from .human import Human
+import importlib
+
+_CORE_MODULES = {"DPIns": ".dpins", "ReAct": ".react", "Human": ".human"}
+
+
+def __getattr__(name):
+    # the agent cores are imported on first use, e.g. d3rlpy is only imported with the DPIns core
+    if name in _CORE_MODULES:
+        return getattr(importlib.import_module(_CORE_MODULES[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -2,7 +2,12 @@ from typing import Dict
 from abc import abstractmethod
 
 from ..roles import BaseRole
+from ..context import HistoryWindow
 from ...backends import IntelligenceBackend
+from ... import metrics, tracing, profiling
+
+# The user prompts start with the conversation history, so that the queries of an agent share the longest prefix
+HISTORY_HEADER = "Here are some conversation history you can refer to:"
 
 
 class AgentCore:
@@ -13,7 +18,60 @@ class AgentCore:
         self.name = self.role.name
         self.role_desc = self.role.role_description
         self.global_prompt = global_prompt
+        # the conversation history put into the prompts, see `onuw.agents.context`
+        self.history_window = HistoryWindow(token_budget=kwargs.get("context_budget"),
+                                            recent_speeches=kwargs.get("recent_speeches", 5))
+        # The system prompt is the same in every query of the agent, so it is built once. The history only grows
+        # during a game, so each query starts with the system prompt and the history of the previous query, which
+        # providers with prefix caching (e.g. OpenAI, Gemini) can serve from their cache.
+        self.system_prompt = self._construct_system_prompt()
+        self._prompt_prefix = ""  # the cacheable prefix of the prompts being built, see `_history_prompt`
+        self._last_prompt_prefix = ""
+        self.num_queries = 0
+        self.num_prefix_reused = 0
+        self.prefix_chars_reused = 0
+
+    def _construct_system_prompt(self) -> str:
+        # Merge the role description and the global prompt as the system prompt for the agent
+        if self.global_prompt:
+            return f"You are a good conversation game player.\n{self.global_prompt.strip()}\n\nYour name is {self.name}.\n\nYour role:{self.role_desc}"
+        return f"You are a good conversation game player. Your name is {self.name}.\n\nYour role:{self.role_desc}"
+
+    def _history_prompt(self, history_messages, instructions: str) -> str:
+        """
+        The user prompt of the conversation history followed by the instructions of the phase.
+        """
+        history_prompt = f"{HISTORY_HEADER}{self.history_window.render(history_messages)}"
+        self._prompt_prefix = self.system_prompt + history_prompt
+        return f"{history_prompt}\n\n{instructions}"
+
+    def _count_prefix_reuse(self, prompts: Dict[str, str]) -> int:
+        """
+        Count whether the prompts start with the cacheable prefix of the previous query, returning its length if so.
+        """
+        previous, self._last_prompt_prefix = self._last_prompt_prefix, self._prompt_prefix or prompts["system_prompt"]
+        self._prompt_prefix = ""
+        self.num_queries += 1
+        if not previous or not (prompts["system_prompt"] + prompts["user_prompt"]).startswith(previous):
+            return 0
+        self.num_prefix_reused += 1
+        self.prefix_chars_reused += len(previous)
+        return len(previous)
     
+    def _query(self, kind: str, phase: str, request_msg: str, **prompt_kwargs) -> str:
+        """
+        Query the backend with the prompts constructed from prompt_kwargs by `_construct_prompts`.
+        The call is recorded as the given kind ("belief", "strategy" or "action") in the given phase, see `onuw.metrics`.
+        """
+        with tracing.span("agent.query", kind=kind):
+            with tracing.span("prompt.build"):
+                prompts = self._construct_prompts(**prompt_kwargs)
+                prefix_chars = self._count_prefix_reuse(prompts)
+            with tracing.span("backend.query", backend=self.backend.type_name), profiling.io_wait():
+                return metrics.recorded_query(self.backend, kind=kind, phase=phase, role=self.role.role_name,
+                                              agent_name=self.name, prompts=prompts, request_msg=request_msg,
+                                              prefix_chars=prefix_chars)
+
     @abstractmethod
     def act(self, observation: Dict):
         raise NotImplementedError
@@ -2,15 +2,13 @@ from typing import Dict
 from tenacity import RetryError
 import logging
 import uuid
-from fuzzywuzzy import process
 import time
-import d3rlpy
-import numpy as np
 import random
 
 from .base import AgentCore
 from ..roles import BaseRole, SPEAKING_STRATEGY
 from ...backends import IntelligenceBackend
+from ... import tracing
 from ...utils import extract_jsons, get_embeddings
 
 # A special signal sent by the player to indicate that it is not possible to continue the conversation, and it requests to end the conversation.
@@ -21,11 +19,10 @@ MAX_RETRIES = 5
 
 
 def choosing_speaking_strategy(policy, messages, belief):
+    import numpy as np
     print("Choosing speaking strategy by RL-policy")
     # Construct observation
-    history = ""
-    for msg in messages:
-        history = f"{history}\n[{msg.agent_name}]: {msg.content}"
+    history = "".join(f"\n[{msg.agent_name}]: {msg.content}" for msg in messages)
     observation = f"<Game history>:{history}\n<My thought and belief>: {belief}".strip()
     obs_vec = get_embeddings(observation, backend="openai")
     # get action
@@ -42,53 +39,39 @@ class DPIns(AgentCore):
         
         self.structure = kwargs.get("structure", "")
         if self.structure == "dpins:rl":
+            import d3rlpy  # only the RL policy needs d3rlpy and torch
             self.policy = d3rlpy.load_learnable("onuw/agents/models/discussion_policy.d3")
     
     def _construct_prompts(self, current_phase, history_messages, **kwargs):
-        # Merge the role description and the global prompt as the system prompt for the agent
-        if self.global_prompt:
-            system_prompt = f"You are a good conversation game player.\n{self.global_prompt.strip()}\n\nYour name is {self.name}.\n\nYour role:{self.role_desc}"
-        else:
-            system_prompt = f"You are a good conversation game player. Your name is {self.name}.\n\nYour role:{self.role_desc}"
-        
-        # Concatenate conversations
-        conversation_history = ""
-        for msg in history_messages:
-            conversation_history = f"{conversation_history}\n[{msg.agent_name}]: {msg.content}"
-        
-        # Instructions for different phases
+        # Instructions for different phases, after the conversation history (see `AgentCore._history_prompt`)
         if "Night" in current_phase:
             user_prompt = f"""Now it is the Night phase. Notice that you are {self.name}. 
 Based on the game rules, role descriptions and your experience, think about your acting strategy and take a proper action."""
         
         elif "Day" in current_phase:
-            user_prompt = f"""Now it is the Day phase. Here are some conversation history you can refer to: {conversation_history}
-Notice that you are {self.name} in the conversation. You should carefully analyze the conversation history since some ones might deceive during the conversation.
+            user_prompt = self._history_prompt(history_messages, f"""Now it is the Day phase. Notice that you are {self.name} in the conversation. You should carefully analyze the conversation history since some ones might deceive during the conversation.
 And here is your belief about possible roles of all players: {kwargs.get("current_belief", "")}
 Based on the game rules, role descriptions, messages and your belief, think about what insights you can summarize from the conversation and your speaking strategy next.
-After that, give a concise but informative and specific public speech besed on your insights and strategy."""
+After that, give a concise but informative and specific public speech besed on your insights and strategy.""")
         
         elif "Voting" in current_phase:
-            user_prompt = f"""Now it is the Voting phase. Here are some conversation history you can refer to: {conversation_history}
-Notice that you are {self.name} in the conversation. You should carefully analyze the conversation history since some ones might deceive during the conversation.
+            user_prompt = self._history_prompt(history_messages, f"""Now it is the Voting phase. Notice that you are {self.name} in the conversation. You should carefully analyze the conversation history since some ones might deceive during the conversation.
 And here is your belief about possible roles of all players: {kwargs.get("current_belief", "")}
-Based on the game rules, role descriptions, messages and your belief, think about who is most likely a Werewolf and then vote for this player."""
+Based on the game rules, role descriptions, messages and your belief, think about who is most likely a Werewolf and then vote for this player.""")
         
         elif "Belief" in current_phase:
-            user_prompt = f"""Here are some conversation history you can refer to: {conversation_history}
-Notice that you are {self.name} in the conversation. You should carefully analyze the conversation history since some ones might deceive during the conversation.
-Based on the game rules, role descriptions and messages, think about what roles all players (including yourself) can most probably be now."""
+            user_prompt = self._history_prompt(history_messages, f"""Notice that you are {self.name} in the conversation. You should carefully analyze the conversation history since some ones might deceive during the conversation.
+Based on the game rules, role descriptions and messages, think about what roles all players (including yourself) can most probably be now.""")
         
         elif "Strategy" in current_phase:
-            user_prompt = f"""Now it is the Day phase. Here are some conversation history you can refer to: {conversation_history}
-Notice that you are {self.name} in the conversation. You should carefully analyze the conversation history since some ones might deceive during the conversation.
+            user_prompt = self._history_prompt(history_messages, f"""Now it is the Day phase. Notice that you are {self.name} in the conversation. You should carefully analyze the conversation history since some ones might deceive during the conversation.
 And here is your belief about possible roles of all players: {kwargs.get("current_belief", "")}
-Based on the game rules, role descriptions, messages and your belief, think about what kind of speaking strategy you are going to use for your upcoming speech in this turn"""
+Based on the game rules, role descriptions, messages and your belief, think about what kind of speaking strategy you are going to use for your upcoming speech in this turn""")
         
         else:
             user_prompt = ""
         
-        return {"system_prompt": system_prompt, "user_prompt": user_prompt}
+        return {"system_prompt": self.system_prompt, "user_prompt": user_prompt}
 
     def act(self, observation: Dict):
         """
@@ -112,28 +95,27 @@ Based on the game rules, role descriptions, messages and your belief, think abou
                     action_prompt = self.role.get_night_prompt()
                 else:
                     belief_prompt = self.role.get_belief_prompt()
-                    current_belief = self.backend.query(agent_name=self.name, 
-                                                        prompts=self._construct_prompts(current_phase="Belief Modeling", 
-                                                                                        history_messages=observation["message_history"]), 
-                                                        request_msg=belief_prompt)
+                    current_belief = self._query("belief", current_phase, request_msg=belief_prompt,
+                                                 current_phase="Belief Modeling", history_messages=observation["message_history"])
                     # print("Current Belief: ", current_belief)
                     if "Day" in current_phase:
                         if self.structure == "dpins:llm":
                             # Choose speaking strategy by LLM
                             choose_prompt = self.role.get_strategy_prompt()
-                            chosen_result = self.backend.query(agent_name=self.name,
-                                                               prompts=self._construct_prompts(current_phase="Speaking Strategy",
-                                                                                               history_messages=observation["message_history"],
-                                                                                               current_belief=current_belief),
-                                                               request_msg=choose_prompt)
+                            chosen_result = self._query("strategy", current_phase, request_msg=choose_prompt,
+                                                        current_phase="Speaking Strategy",
+                                                        history_messages=observation["message_history"],
+                                                        current_belief=current_belief)
                             # print("Chosen Speaking Strategy: ", chosen_result)
                             
-                            json_list = extract_jsons(chosen_result)
+                            with tracing.span("agent.parse"):
+                                json_list = extract_jsons(chosen_result)
                             if len(json_list) < 1:
                                 raise ValueError(f"Player output {chosen_result} is not a valid json.")
                             chosen_strategy = json_list[0].get("strategy", "")
                             
                             # find the best match speaking strategy
+                            from fuzzywuzzy import process
                             chosen_strategy, _ = process.extractOne(chosen_strategy, SPEAKING_STRATEGY.keys())
                             speaking_strategy = SPEAKING_STRATEGY.get(chosen_strategy, "")
 
@@ -150,14 +132,13 @@ Based on the game rules, role descriptions, messages and your belief, think abou
                     else:
                         action_prompt = self.role.get_voting_prompt()
                 
-                response = self.backend.query(agent_name=self.name, 
-                                              prompts=self._construct_prompts(current_phase=current_phase, 
-                                                                              history_messages=observation["message_history"],
-                                                                              current_belief=current_belief), 
-                                              request_msg=action_prompt)
+                response = self._query("action", current_phase, request_msg=action_prompt,
+                                       current_phase=current_phase, history_messages=observation["message_history"],
+                                       current_belief=current_belief)
                 # print("Chosen Action: ", response)
                 
-                action_list = extract_jsons(response)
+                with tracing.span("agent.parse"):
+                    action_list = extract_jsons(response)
                 if len(action_list) < 1:
                     raise ValueError(f"Player output {response} is not a valid json.")
                 action = action_list[0]
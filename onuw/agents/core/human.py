@@ -1,5 +1,4 @@
 from typing import Dict
-from rich.console import Console
 
 from .base import AgentCore
 from ..roles import BaseRole
@@ -10,6 +9,7 @@ class Human(AgentCore):
     def __init__(self, role: BaseRole, backend: IntelligenceBackend, global_prompt: str = None, **kwargs):
         super().__init__(role=role, backend=backend, global_prompt=global_prompt, **kwargs)
 
+        from rich.console import Console  # only needed for human players
         self.console = Console()
     
     def act(self, observation: Dict):
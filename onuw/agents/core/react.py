@@ -7,6 +7,7 @@ import time
 from .base import AgentCore
 from ..roles import BaseRole
 from ...backends import IntelligenceBackend
+from ... import tracing
 from ...utils import extract_jsons
 
 # A special signal sent by the player to indicate that it is not possible to continue the conversation, and it requests to end the conversation.
@@ -24,36 +25,23 @@ class ReAct(AgentCore):
         super().__init__(role=role, backend=backend, global_prompt=global_prompt, **kwargs)
     
     def _construct_prompts(self, current_phase, history_messages, **kwargs):
-        # Merge the role description and the global prompt as the system prompt for the agent
-        if self.global_prompt:
-            system_prompt = f"You are a good conversation game player.\n{self.global_prompt.strip()}\n\nYour name is {self.name}.\n\nYour role:{self.role_desc}"
-        else:
-            system_prompt = f"You are a good conversation game player. Your name is {self.name}.\n\nYour role:{self.role_desc}"
-        
-        # Concatenate conversations
-        conversation_history = ""
-        for msg in history_messages:
-            conversation_history = f"{conversation_history}\n[{msg.agent_name}]: {msg.content}"
-        
-        # Instructions for different phases
+        # Instructions for different phases, after the conversation history (see `AgentCore._history_prompt`)
         if "Night" in current_phase:
             user_prompt = f"""Now it is the Night phase. Notice that you are {self.name}. 
 Based on the game rules, role descriptions and your experience, think about your acting strategy and take a proper action."""
         
         elif "Day" in current_phase:
-            user_prompt = f"""Now it is the Day phase. Here are some conversation history you can refer to: {conversation_history}
-Notice that you are {self.name} in the conversation. You should carefully analyze the conversation history since some ones might deceive during the conversation.
-Based on the game rules, role descriptions and messages, think about what you are about to say in your following public speech."""
+            user_prompt = self._history_prompt(history_messages, f"""Now it is the Day phase. Notice that you are {self.name} in the conversation. You should carefully analyze the conversation history since some ones might deceive during the conversation.
+Based on the game rules, role descriptions and messages, think about what you are about to say in your following public speech.""")
         
         elif "Voting" in current_phase:
-            user_prompt = f"""Now it is the Voting phase. Here are some conversation history you can refer to: {conversation_history}
-Notice that you are {self.name} in the conversation. You should carefully analyze the conversation history since some ones might deceive during the conversation.
-Based on the game rules, role descriptions and messages, think about who is on your opposite team and then vote for this player."""
+            user_prompt = self._history_prompt(history_messages, f"""Now it is the Voting phase. Notice that you are {self.name} in the conversation. You should carefully analyze the conversation history since some ones might deceive during the conversation.
+Based on the game rules, role descriptions and messages, think about who is on your opposite team and then vote for this player.""")
         
         else:
             user_prompt = ""
         
-        return {"system_prompt": system_prompt, "user_prompt": user_prompt}
+        return {"system_prompt": self.system_prompt, "user_prompt": user_prompt}
 
     def act(self, observation: Dict):
         """
@@ -78,13 +66,12 @@ Based on the game rules, role descriptions and messages, think about who is on y
                 else:
                     action_prompt = self.role.get_voting_prompt()
                 
-                response = self.backend.query(agent_name=self.name, 
-                                              prompts=self._construct_prompts(current_phase=current_phase, 
-                                                                              history_messages=observation["message_history"]), 
-                                              request_msg=action_prompt)
+                response = self._query("action", current_phase, request_msg=action_prompt,
+                                       current_phase=current_phase, history_messages=observation["message_history"])
                 # print("Chosen Action: ", response)
                 
-                action_list = extract_jsons(response)
+                with tracing.span("agent.parse"):
+                    action_list = extract_jsons(response)
                 if len(action_list) < 1:
                     raise ValueError(f"Player output {response} is not a valid json.")
                 action = action_list[0]
@@ -1,18 +1,21 @@
+from ...utils import LazyRegistry
 from .base import BaseRole, SPEAKING_STRATEGY
-from .villager import Villager
-from .werewolf import Werewolf
-from .seer import Seer
-from .robber import Robber
-from .troublemaker import Troublemaker
-from .insomniac import Insomniac
 
-ALL_ROLES = [
-    Villager,
-    Werewolf,
-    Seer,
-    Robber,
-    Troublemaker,
-    Insomniac,
-]
+# The roles are imported on first use, like the backends and the agent structures
+ROLE_REGISTRY = LazyRegistry({
+    "Villager": ".villager:Villager",
+    "Werewolf": ".werewolf:Werewolf",
+    "Seer": ".seer:Seer",
+    "Robber": ".robber:Robber",
+    "Troublemaker": ".troublemaker:Troublemaker",
+    "Insomniac": ".insomniac:Insomniac",
+}, package=__name__)
 
-ROLE_REGISTRY = {role.role_name: role for role in ALL_ROLES}
+
+def __getattr__(name):
+    # e.g. `from onuw.agents.roles import Seer`
+    if name in ROLE_REGISTRY:
+        return ROLE_REGISTRY[name]
+    if name == "ALL_ROLES":
+        return list(ROLE_REGISTRY.values())
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
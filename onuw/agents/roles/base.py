@@ -1,6 +1,4 @@
 from typing import List
-from prompt_toolkit import prompt
-from prompt_toolkit.styles import Style
 
 SPEAKING_STRATEGY = {
     "honest_evidence": "You need to provide some honest evidence or information in your public speech, and your evidence must be consistent with the information or beliefs you know.",
@@ -91,6 +89,9 @@ You must return your response in a JSON format that can be parsed by Python `jso
         raise NotImplementedError
 
     def get_day_input(self):
+        from prompt_toolkit import prompt  # only needed for human players
+        from prompt_toolkit.styles import Style
+
         speech = prompt(
             [('class:user_prompt', "Type your speech content: ")],
             style=Style.from_dict({'user_prompt': 'ansicyan underline'})
@@ -98,6 +99,9 @@ You must return your response in a JSON format that can be parsed by Python `jso
         return {"thought": "", "speech": speech}
     
     def get_voting_input(self):
+        from prompt_toolkit import prompt  # only needed for human players
+        from prompt_toolkit.styles import Style
+
         vote = prompt(
             [('class:info', "[Info] "),
              ('class:info_text', "You can vote for one other player from the following options: "),
@@ -1,6 +1,4 @@
 from .base import BaseRole
-from prompt_toolkit import prompt
-from prompt_toolkit.styles import Style
 
 
 class Robber(BaseRole):
@@ -28,6 +26,9 @@ You must return your response in a JSON format that can be parsed by Python `jso
         return action_prompt
     
     def get_night_input(self):
+        from prompt_toolkit import prompt  # only needed for human players
+        from prompt_toolkit.styles import Style
+
         human_input = prompt(
             [('class:info', "[Info] "),
              ('class:info_text', "As a Robber, you may choose to switch roles with another player and then become the new role you switched.\n"),
@@ -1,6 +1,4 @@
 from .base import BaseRole
-from prompt_toolkit import prompt
-from prompt_toolkit.styles import Style
 
 
 class Seer(BaseRole):
@@ -27,6 +25,9 @@ You must return your response in a JSON format that can be parsed by Python `jso
         return action_prompt
     
     def get_night_input(self):
+        from prompt_toolkit import prompt  # only needed for human players
+        from prompt_toolkit.styles import Style
+
         player = prompt(
             [('class:info', "[Info] "),
              ('class:info_text', """As a Seer, you may check another player's role, or two roles in the `role pool`.
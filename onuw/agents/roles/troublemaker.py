@@ -1,6 +1,4 @@
 from .base import BaseRole
-from prompt_toolkit import prompt
-from prompt_toolkit.styles import Style
 
 
 class Troublemaker(BaseRole):
@@ -29,6 +27,9 @@ You must return your response in a JSON format that can be parsed by Python `jso
         return action_prompt
     
     def get_night_input(self):
+        from prompt_toolkit import prompt  # only needed for human players
+        from prompt_toolkit.styles import Style
+
         human_input = prompt(
             [('class:info', "[Info] "),
              ('class:info_text', "As a Troublemaker, you may switch the roles of two other players, but you will not know their roles.\n"),
@@ -1,7 +1,13 @@
-from typing import List, Dict, Union
+from typing import List, Dict, Union, Optional
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import itertools
+import os
+import time
 import uuid
 import json
 import csv
+import pickle
 import logging
 import random
 
@@ -9,12 +15,49 @@ from .agents.agent import Player
 from .environments import Environment, TimeStep, load_environment
 from .backends import Human
 from .config import ArenaConfig
+from .storage.jsonl import JSONLHistoryWriter
+from . import metrics, tracing, profiling
 
 
 class TooManyInvalidActions(Exception):
     pass
 
 
+def expand_role_pool(role_pool: Union[List[str], Dict[str, int]]) -> List[str]:
+    """
+    expand a role pool given as the number of each role (e.g. {"Werewolf": 3, "Villager": 6}) to a list of roles
+    """
+    if isinstance(role_pool, dict):
+        return [role for role, count in role_pool.items() for _ in range(count)]
+    return list(role_pool)
+
+
+def _plural_role(role: str, count: int) -> str:
+    if count == 1:
+        return role
+    return role[:-1] + "ves" if role.endswith("f") else role + "s"  # e.g. Werewolf -> Werewolves
+
+
+def fill_global_prompt(global_prompt: str, num_players: int, role_pool: List[str]) -> str:
+    """
+    fill the placeholders about the game scale in the global prompt, so that one prompt fits games of any size.
+    Supported placeholders: {num_players}, {num_other_players}, {num_roles} and {role_counts}.
+    """
+    role_counts = {}
+    for role in role_pool:
+        role_counts[role] = role_counts.get(role, 0) + 1
+    role_counts = ", ".join(f"{count} {_plural_role(role, count)}" for role, count in role_counts.items())
+    placeholders = {
+        "{num_players}": str(num_players),
+        "{num_other_players}": str(num_players - 1),
+        "{num_roles}": str(len(role_pool)),
+        "{role_counts}": role_counts,
+    }
+    for placeholder, value in placeholders.items():
+        global_prompt = global_prompt.replace(placeholder, value)
+    return global_prompt
+
+
 class Arena:
     """
     Utility class that manages the game environment and players
@@ -23,6 +66,7 @@ class Arena:
     def __init__(self, players: List[Player], environment: Environment, global_prompt: str = None):
         # Create a container for the players and environment and reset the game
         self.players = players
+        self._name_to_player = {player.name: player for player in players}
         self.environment = environment
         self.global_prompt = global_prompt
 
@@ -30,47 +74,200 @@ class Arena:
         self.uuid = uuid.uuid4()  # Generate a unique id for the game
         self.invalid_actions_retry = 5
 
+        # streaming the history of each game, see `stream_history`
+        self._stream_dir = None
+        self._stream_prefix = ""
+        self._history_writer = None
+        # checkpointing the game after each step, see `enable_checkpointing`
+        self._checkpoint_path = None
+
     @property
     def num_players(self):
         return self.environment.num_players
 
     @property
     def name_to_player(self) -> Dict[str, Player]:
-        return {player.name: player for player in self.players}
+        return self._name_to_player
 
     def reset(self) -> TimeStep:
-        # Reset the environment
+        # Close the stream of an unfinished game before its messages are cleared
+        self._close_history_stream(aborted="reset")
+        # Reset the environment, starting the observation records of the new game
+        self.environment.observation_stats.clear()
         self.current_timestep = self.environment.reset()
         # Reset the players
         for player in self.players:
             player.reset()
         # Reset the uuid
         self.uuid = uuid.uuid4()
+        if self._stream_dir is not None:
+            self._open_history_stream()
+        self.save_checkpoint()
         return self.current_timestep
 
+    def stream_history(self, save_dir: str, prefix: str = "", current_game: bool = False):
+        """
+        stream the history of every game from the next reset to a JSONL file in save_dir,
+        appending each message as it is added and the evaluation at the end of the game (see `onuw.storage.jsonl`)
+        If current_game=True, the current game (e.g. one resumed from a checkpoint) is streamed too,
+        starting with the messages played so far.
+        """
+        os.makedirs(save_dir, exist_ok=True)
+        self._stream_dir = save_dir
+        self._stream_prefix = prefix
+        if current_game and self._history_writer is None:
+            self._open_history_stream()
+
+    def enable_checkpointing(self, path: str):
+        """
+        checkpoint the game to path after every step, so that an unfinished game can be resumed by `from_checkpoint`
+        after a crash or an outage of the backends. The checkpoint is removed when the game finishes.
+        """
+        save_dir = os.path.dirname(path)
+        if save_dir:
+            os.makedirs(save_dir, exist_ok=True)
+        self._checkpoint_path = path
+        self.save_checkpoint()
+
+    def save_checkpoint(self, path: str = None):
+        """
+        save the configs of the arena and the states of the environment and the players to a file,
+        which is replaced atomically so that a crash while writing keeps the previous checkpoint
+        """
+        path = path or self._checkpoint_path
+        if path is None:
+            return
+        checkpoint = {
+            "game_id": self.uuid,
+            "global_prompt": self.global_prompt,
+            "players": [player.to_config() for player in self.players],
+            "environment": self.environment.to_config(),
+            "environment_state": self.environment.get_state(),
+            "player_states": {player.name: player.get_state() for player in self.players},
+        }
+        tmp_path = f"{path}.{os.getpid()}.tmp"  # unique per process, e.g. of two workers playing the same game
+        with open(tmp_path, "wb") as f:
+            pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def _remove_checkpoint(self):
+        if self._checkpoint_path is not None and os.path.exists(self._checkpoint_path):
+            os.remove(self._checkpoint_path)
+
+    @classmethod
+    def from_checkpoint(cls, path: str, checkpointing: bool = True):
+        """
+        create an arena that continues the game saved by `save_checkpoint`,
+        and keep checkpointing it to the same path if checkpointing=True
+        """
+        with open(path, "rb") as f:
+            checkpoint = pickle.load(f)
+
+        players = [Player.from_config(player_config) for player_config in checkpoint["players"]]
+        env = load_environment(checkpoint["environment"])
+        arena = cls(players, env, global_prompt=checkpoint["global_prompt"])
+
+        env.set_state(checkpoint["environment_state"])
+        for player in players:
+            player.set_state(checkpoint["player_states"][player.name])
+        arena.uuid = checkpoint["game_id"]
+        arena.current_timestep = TimeStep(observation=env.lazy_observation(env.get_next_player()),
+                                          reward=env.get_zero_rewards(), terminal=env.is_terminal())
+        if checkpointing:
+            arena._checkpoint_path = path
+        return arena
+
+    def _open_history_stream(self):
+        cur_time = time.strftime("%Y-%m-%d-%H-%M-%S", time.localtime())
+        path = os.path.join(self._stream_dir, f"{self._stream_prefix}{cur_time}_{self.uuid.hex[:8]}.jsonl")
+        writer = JSONLHistoryWriter(path)
+        writer.write_header({
+            "game_id": str(self.uuid),
+            "roles_assigned": self.environment.roles_assigned,
+            "role_pool": self.environment.role_pool,
+            "player_backends": self._player_backends()
+        })
+        message_pool = self.environment.message_pool
+        for message in message_pool.get_all_messages():  # messages added by the reset
+            writer.write_message(message)
+        message_pool.add_listener(writer.write_message)
+        self._history_writer = writer
+
+    def _close_history_stream(self, evaluation: Dict = None, aborted: str = None):
+        if self._history_writer is None:
+            return
+        writer, self._history_writer = self._history_writer, None
+        self.environment.message_pool.remove_listener(writer.write_message)
+        writer.close(evaluation=evaluation, aborted=aborted)
+
     def step(self) -> TimeStep:
         """
-        Take a step in the game: one player takes an action and the environment updates
+        Take a step in the game: one player takes an action and the environment updates,
+        or all players who act simultaneously (see `Environment.get_next_players`) take their actions at once
         """
-        player_name = self.environment.get_next_player()
-        player = self.name_to_player[player_name]  # get the player object
-        observation = self.environment.get_observation(player_name, only_message=False)  # get the observation for the player
+        with metrics.tags(game=str(self.uuid)), tracing.span("arena.step", turn=self.environment._current_turn):
+            return self._step()  # the backend queries and spans of this step belong to this game
 
-        timestep = None
+    def _act(self, player_name: str, observation: Dict):
+        """
+        get an action of the player that the environment accepts, or None if the player made too many invalid actions
+        """
+        player = self.name_to_player[player_name]  # get the player object
         for i in range(self.invalid_actions_retry):  # try to take an action for a few times
             action = player(observation)  # take an action
-            if self.environment.check_action(action, player_name):  # action is valid
+            with tracing.span("env.check_action"):
+                is_valid = self.environment.check_action(action, player_name)
+            if is_valid:  # action is valid
+                return action
+            logging.warning(f"{player_name} made an invalid action {action}")  # action is invalid
+        return None
+
+    def _act_simultaneously(self, player_names: List[str]) -> List:
+        """
+        query the players concurrently, each with the observation of its own turn (see `Environment.get_observations`)
+        """
+        observations = self.environment.get_observations(player_names)
+        with ThreadPoolExecutor(max_workers=len(player_names), thread_name_prefix="arena-act") as executor:
+            # Run each query in a copy of the context, so that it keeps the metrics tags of this game
+            futures = [executor.submit(contextvars.copy_context().run, self._act_in_worker, player_name, observation)
+                       for player_name, observation in zip(player_names, observations)]
+            with profiling.io_wait():  # the workers wait for the backends
+                return [future.result() for future in futures]
+
+    def _act_in_worker(self, player_name: str, observation: Dict):
+        with profiling.sampled_thread():
+            return self._act(player_name, observation)
+
+    def _step(self) -> TimeStep:
+        player_names = self.environment.get_next_players()
+        # Humans are asked one after another
+        if len(player_names) > 1 and not any(isinstance(self.name_to_player[player_name].backend, Human)
+                                             for player_name in player_names):
+            actions = self._act_simultaneously(player_names)
+        else:
+            player_names = player_names[:1]
+            observation = self.environment.get_observation(player_names[0], only_message=False)  # get the observation for the player
+            actions = [self._act(player_names[0], observation)]
+
+        timestep = None
+        for player_name, action in zip(player_names, actions):
+            if action is None:  # if the player made invalid actions for too many times, terminate the game
+                warning_msg = f"{player_name} has made invalid actions for {self.invalid_actions_retry} times. Terminating the game."
+                logging.warning(warning_msg)
+                self._close_history_stream(aborted=warning_msg)
+                raise TooManyInvalidActions(warning_msg)
+            with tracing.span("env.step"):
                 timestep = self.environment.step(player_name, action)  # update the environment
+            if timestep.terminal:
                 break
-            else:  # action is invalid
-                logging.warning(f"{player_name} made an invalid action {action}")
-                continue
-
-        if timestep is None:  # if the player made invalid actions for too many times, terminate the game
-            warning_msg = f"{player_name} has made invalid actions for {self.invalid_actions_retry} times. Terminating the game."
-            logging.warning(warning_msg)
-            raise TooManyInvalidActions(warning_msg)
 
+        if not timestep.terminal:
+            self.save_checkpoint()
+        elif self.environment.winner is not None:  # the game is finished
+            self._close_history_stream(evaluation=self._evaluation())
+            self._remove_checkpoint()
+        else:  # the game is ended by an agent (e.g. the backend failed), keep the checkpoint before this step
+            self._close_history_stream(aborted=f"{player_name} ended the game")
         return timestep
 
     def next_is_human(self):
@@ -81,14 +278,19 @@ class Arena:
         player = self.name_to_player[player_name]
         return isinstance(player.backend, Human)
 
-    def run(self, num_steps: int = 1):
+    def run(self, num_steps: Optional[int] = 1):
         """
-        run the game for num_turns
+        run the game for num_steps, or to its end if num_steps=None
         """
-        for i in range(num_steps):
+        if num_steps is None:
+            num_steps = self.environment.max_steps
+        for i in (range(num_steps) if num_steps is not None else itertools.count()):
             timestep = self.step()
             if timestep.terminal:
                 break
+        unread = self.environment.unread_observations
+        logging.debug(f"{len(unread)} of {len(self.environment.observation_stats)} timestep observations were never read "
+                      f"(steps {unread}).")
 
     @classmethod
     def from_config(cls, config: Union[str, ArenaConfig], randomness: bool = False):
@@ -100,8 +302,10 @@ class Arena:
             config = ArenaConfig.load(config)
 
         global_prompt = config.get("global_prompt", None)
-        role_pool = config.environment.get("role_pool", None).copy()
+        role_pool = expand_role_pool(config.environment.get("role_pool", None))
         assert len(role_pool) == len(config.players) + 3, "The number of roles in role pool must be 3 more than the number of players."
+        if global_prompt is not None:
+            global_prompt = fill_global_prompt(global_prompt, num_players=len(config.players), role_pool=role_pool)
         if randomness:  # if randomness=True, shuffle role pool
             random.shuffle(role_pool)
         
@@ -161,10 +365,42 @@ class Arena:
         config = self.to_config()
         config.save(path)
 
+    def _player_backends(self) -> Dict[str, str]:
+        backends = {}
+        for player in self.players:
+            backend_name = player.backend.type_name
+            if backend_name == "openai-chat":
+                if "gpt-3.5" in player.backend.model:
+                    backend_name = "chatgpt-3.5"
+                elif "gpt-4" in player.backend.model:
+                    backend_name = "chatgpt-4"
+            backends[player.name] = backend_name
+        return backends
+
+    def _evaluation(self) -> Dict:
+        return {
+            "roles_assigned": self.environment.roles_assigned,
+            "roles_ground_truth": self.environment.roles_ground_truth,
+            "role_pool": self.environment.role_pool,
+            "player_backends": self._player_backends(),
+            "player_structures": {player.name: player.structure for player in self.players},
+            "voting_result": self.environment._players_votes,
+            "winner": self.environment.winner
+        }
+
+    def _history_dict(self) -> Dict:
+        """
+        the history of the game in the format of json files
+        """
+        return {
+            "messages": [message.to_dict() for message in self.environment.get_observation()],
+            "evaluation": self._evaluation(),
+        }
+
     def save_history(self, path: str):
         """
         save the history of the game to a file
-        Supports csv and json formats.
+        Supports csv, json and columnar (.onuwc, see `onuw.storage.columnar`) formats.
         """
         messages = self.environment.get_observation()
         message_rows = []
@@ -190,42 +426,10 @@ class Arena:
                 writer.writerow(header)
                 writer.writerows(message_rows)
         elif path.endswith(".json"):
-            for message in messages:
-                message_row = {
-                    "agent_name": message.agent_name,
-                    "belief": message.belief,
-                    "strategy": message.strategy,
-                    "content": message.content,
-                    "thought": message.thought,
-                    "turn": message.turn,
-                    "timestamp": str(message.timestamp),
-                    "visible_to": message.visible_to,
-                    "msg_type": message.msg_type,
-                }
-                message_rows.append(message_row)
-            
-            backends = {}
-            for player in self.players:
-                backend_name = player.backend.type_name
-                if backend_name == "openai-chat":
-                    if "gpt-3.5" in player.backend.model:
-                        backend_name = "chatgpt-3.5"
-                    elif "gpt-4" in player.backend.model:
-                        backend_name = "chatgpt-4"
-                backends[player.name] = backend_name
-            history = {
-                "messages": message_rows,
-                "evaluation": {
-                    "roles_assigned": self.environment.roles_assigned,
-                    "roles_ground_truth": self.environment.roles_ground_truth,
-                    "role_pool": self.environment.role_pool,
-                    "player_backends": backends,
-                    "voting_result": self.environment._players_votes,
-                    "winner": self.environment.winner
-                },
-            }
-
             with open(path, "w") as f:
-                json.dump(history, f, indent=4)
+                json.dump(self._history_dict(), f, indent=4)
+        elif path.endswith(".onuwc"):
+            from .storage.columnar import write_histories
+            write_histories(path, [self._history_dict()])
         else:
             raise ValueError("Invalid file format")
@@ -1,17 +1,26 @@
 from ..config import BackendConfig
+from ..utils import LazyRegistry
 
 from .base import IntelligenceBackend
-from .openai import OpenAIChat
-from .human import Human
-from .gemini import Gemini
 
-ALL_BACKENDS = [
-    Human,
-    OpenAIChat,
-    Gemini,
-]
+# The backends are imported on first use, so that only the client libraries of the backends in use are imported
+BACKEND_REGISTRY = LazyRegistry({
+    "human": ".human:Human",
+    "openai-chat": ".openai:OpenAIChat",
+    "gemini": ".gemini:Gemini",
+    "scripted": ".scripted:Scripted",
+}, package=__name__)
 
-BACKEND_REGISTRY = {backend.type_name: backend for backend in ALL_BACKENDS}
+_BACKEND_CLASSES = {"Human": "human", "OpenAIChat": "openai-chat", "Gemini": "gemini", "Scripted": "scripted"}
+
+
+def __getattr__(name):
+    # e.g. `from onuw.backends import OpenAIChat` imports the backend when it is accessed
+    if name in _BACKEND_CLASSES:
+        return BACKEND_REGISTRY[_BACKEND_CLASSES[name]]
+    if name == "ALL_BACKENDS":
+        return list(BACKEND_REGISTRY.values())
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # Load a backend from a config dictionary
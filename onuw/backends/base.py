@@ -35,3 +35,17 @@ class IntelligenceBackend(Configurable):
             raise NotImplementedError
         else:
             pass
+
+    # get the state of the backend, which is saved in checkpoints of the game
+    def get_state(self) -> Dict:
+        if self.stateful:
+            raise NotImplementedError
+        else:
+            return {}
+
+    # restore the state returned by get_state
+    def set_state(self, state: Dict):
+        if self.stateful:
+            raise NotImplementedError
+        else:
+            pass
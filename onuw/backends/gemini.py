@@ -1,9 +1,14 @@
 from typing import Dict
 import os
 import re
+import logging
 from tenacity import retry, stop_after_attempt, wait_random_exponential
 
 from .base import IntelligenceBackend
+from .. import metrics
+from ..utils import load_env
+
+load_env()
 
 try:
     import google.generativeai as genai
@@ -48,12 +53,13 @@ class Gemini(IntelligenceBackend):
     
     @retry(stop=stop_after_attempt(6), wait=wait_random_exponential(min=1, max=60))
     def _get_response(self, messages, *args, **kwargs):
+        metrics.count_attempt()
         completion = self.client.generate_content(messages)
         response = completion.text
         return response
     
     def query(self, agent_name: str, prompts: Dict[str, str], request_msg: str = None, *args, **kwargs) -> str:
-        print("Using backend with :" + DEFAULT_MODEL)
+        logging.debug(f"Using backend with: {self.model}")
         
         # Construct the prompts for ChatGPT
         messages = [
@@ -0,0 +1,68 @@
+from typing import Dict
+import re
+import json
+import time
+import random
+
+from .base import IntelligenceBackend
+
+DEFAULT_MODEL = "scripted"
+
+# The options listed in the action prompts of roles, e.g. "from the following options: [player1, player2]"
+OPTIONS_PATTERN = re.compile(r"options: \[([^\]]*)\]")
+
+
+class Scripted(IntelligenceBackend):
+    """
+    An offline backend that answers every request with a valid random response, without calling any LLM.
+    It is used for benchmarks, smoke tests and headless simulations of large games.
+    """
+    stateful = False
+    type_name = "scripted"
+
+    def __init__(self, seed: int = None, latency: float = 0., model: str = DEFAULT_MODEL, **kwargs):
+        """
+        instantiate the Scripted backend
+        args:
+            seed: the random seed of the responses
+            latency: the simulated latency (in seconds) of each query
+            model: the model name recorded in configs and game histories
+        """
+        super().__init__(seed=seed, latency=latency, model=model, **kwargs)
+
+        self.seed = seed
+        self.latency = latency
+        self.model = model
+        self._rng = random.Random(seed)
+
+    def get_state(self) -> Dict:
+        # the random responses of a resumed game continue from the checkpoint
+        return {"rng": self._rng.getstate()}
+
+    def set_state(self, state: Dict):
+        self._rng.setstate(state["rng"])
+
+    def query(self, agent_name: str, prompts: Dict[str, str], request_msg: str = None, *args, **kwargs) -> str:
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        request_msg = request_msg or ""
+        match = OPTIONS_PATTERN.search(request_msg)
+        options = [option.strip() for option in match.group(1).split(",")] if match else []
+        options = [option for option in options if option and option != agent_name]
+
+        if '"speech"' in request_msg:  # day phase speech
+            response = {"thought": "", "speech": f"I am {agent_name}, and I have nothing to hide."}
+        elif '"strategy"' in request_msg:  # speaking strategy selection
+            response = {"thought": "", "strategy": self._rng.choice(options) if options else ""}
+        elif '"swap"' in request_msg:  # Troublemaker
+            players = self._rng.sample(options, 2) if len(options) >= 2 else ["", ""]
+            response = {"thought": "", "swap": len(options) >= 2, "player_1": players[0], "player_2": players[1]}
+        elif '"switch"' in request_msg:  # Robber
+            response = {"thought": "", "switch": len(options) > 0, "player": self._rng.choice(options) if options else ""}
+        elif '"player"' in request_msg:  # Seer and voting
+            response = {"thought": "", "player": self._rng.choice(options) if options else ""}
+        else:  # belief modeling asks for free text
+            return "My step-by-step thought process: I have no evidence yet.\nMy concise result: Everyone's role is uncertain."
+
+        return json.dumps(response)
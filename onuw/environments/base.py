@@ -1,6 +1,7 @@
 from dataclasses import dataclass
-from typing import List, Dict
+from typing import List, Dict, Tuple, Union, Callable, Optional
 from abc import abstractmethod
+import copy
 
 from ..memory import Message
 from ..utils import AttributedDict
@@ -14,13 +15,60 @@ class TimeStep(AttributedDict):
 
     Attributes:
         observation (List[Message]): A list of messages (observations) for the current timestep.
+            It can also be a callable returning the messages, which is then evaluated on first access.
         reward (Dict[str, float]): A dictionary with player names as keys and corresponding rewards as values.
         terminal (bool): A boolean indicating whether the current state is terminal (end of episode).
     """
-    observation: List[Message]
+    observation: Union[List[Message], Callable[[], List[Message]]]
     reward: Dict[str, float]
     terminal: bool
 
+    def _materialize(self):
+        # Evaluate the lazy observation and cache it, so every read path of the dict sees the messages
+        value = super().get("observation")
+        if callable(value):
+            super().__setitem__("observation", value())
+
+    def __getitem__(self, key):
+        if key == "observation":
+            self._materialize()
+        return super().__getitem__(key)
+
+    def __iter__(self):
+        # Iterating over the keys makes dict(timestep) and {**timestep} read the values through __getitem__
+        return iter(self.keys())
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def values(self):
+        self._materialize()
+        return super().values()
+
+    def items(self):
+        self._materialize()
+        return super().items()
+
+    def copy(self):
+        self._materialize()
+        return super().copy()
+
+
+def index_roles(roles: Dict[str, str]) -> Dict[str, List[str]]:
+    """
+    Group players by their roles, keeping the seat order of the players.
+
+    Parameters:
+        roles (Dict[str, str]): A dictionary with player names as keys and their roles as values.
+
+    Returns:
+        Dict[str, List[str]]: A dictionary with roles as keys and the names of players holding the role as values.
+    """
+    role_to_players = {}
+    for player_name, role in roles.items():
+        role_to_players.setdefault(role, []).append(player_name)
+    return role_to_players
+
 
 class Environment(Configurable):
     """
@@ -47,6 +95,8 @@ class Environment(Configurable):
         """
         super().__init__(player_names=player_names, **kwargs)  # registers the arguments with Configurable
         self.player_names = player_names
+        # A record of the lazy observation handed out in the TimeStep of each step, and whether it was read
+        self.observation_stats: List[Dict] = []
 
     def __init_subclass__(cls, **kwargs):
         """
@@ -92,6 +142,52 @@ class Environment(Configurable):
         """
         pass
 
+    @property
+    def max_steps(self) -> Optional[int]:
+        """
+        Return the maximum number of steps of a game, or None if it is not known.
+        """
+        return None
+
+    def get_next_players(self) -> List[str]:
+        """
+        Return the names of the players who act next. Their actions must not depend on each other, so that they can be
+        queried at the same time, and they are applied by `step` in the order returned.
+        By default, only the next player acts.
+
+        Returns:
+            List[str]: The names of the next players, empty if the game is over.
+        """
+        next_player = self.get_next_player()
+        return [next_player] if next_player is not None else []
+
+    def get_observations(self, player_names: List[str]) -> List[Dict]:
+        """
+        Return the observations of the players returned together by `get_next_players`, each as the player observes
+        the game on its own turn. By default, they all observe the current state.
+
+        Parameters:
+            player_names (List[str]): The names of the players acting together.
+
+        Returns:
+            List[Dict]: The observations of the players, in the same order.
+        """
+        return [self.get_observation(player_name, only_message=False) for player_name in player_names]
+
+    def _preview_observations(self, player_names: List[str], action: Dict) -> List[Dict]:
+        """
+        Return the observations of the players on their turns, by playing the given action for each of them in turn
+        on a copy of the environment. It is only valid if what a player observes does not depend on the actions of
+        the players before it, e.g. because those actions are private.
+        """
+        preview = type(self).from_config(self.to_config())
+        preview.set_state(self.get_state())
+        observations = []
+        for player_name in player_names:
+            observations.append(preview.get_observation(player_name, only_message=False))
+            preview.step(player_name, dict(action))
+        return observations
+
     @abstractmethod
     def get_observation(self, player_name=None) -> List[Message]:
         """
@@ -108,6 +204,60 @@ class Environment(Configurable):
         """
         pass
 
+    def lazy_observation(self, player_name=None, **kwargs) -> Callable[[], List[Message]]:
+        """
+        Return a callable that computes the observation for a given player only when it is called.
+        It is used as the observation of a TimeStep, so the visibility filtering is skipped if nobody reads it.
+
+        Parameters:
+            player_name (str, optional): The name of the player for whom to get the observation.
+            **kwargs: Extra keyword arguments passed to `get_observation`.
+
+        Returns:
+            Callable[[], List[Message]]: The deferred observation.
+        """
+        record = {"step": len(self.observation_stats), "player": player_name, "read": False}
+        self.observation_stats.append(record)
+
+        def observe():
+            record["read"] = True
+            return self.get_observation(player_name, **kwargs)
+
+        return observe
+
+    def get_state(self) -> Dict:
+        """
+        Return a snapshot of the game state, from which `set_state` restores the environment, e.g. to resume a game
+        from a checkpoint. The snapshot holds a copy of the attributes of the environment except its config,
+        and the state of the message pool if the environment has one.
+
+        Returns:
+            Dict: The state of the environment, which can be pickled.
+        """
+        state = {"attributes": copy.deepcopy({key: value for key, value in vars(self).items()
+                                              if key not in ("_config_dict", "message_pool")})}
+        if hasattr(self, "message_pool"):
+            state["message_pool"] = self.message_pool.get_state()
+        return state
+
+    def set_state(self, state: Dict):
+        """
+        Restore the game state returned by `get_state` of an environment created from the same config.
+
+        Parameters:
+            state (Dict): The state of the environment.
+        """
+        vars(self).update(copy.deepcopy(state["attributes"]))
+        if "message_pool" in state:
+            self.message_pool.set_state(state["message_pool"])
+
+    @property
+    def unread_observations(self) -> List[int]:
+        """
+        get the steps whose lazy observation was never read
+        """
+        return [record["step"] for record in self.observation_stats if not record["read"]]
+
     @abstractmethod
     def print(self):
         """
@@ -179,3 +329,77 @@ class Environment(Configurable):
             Dict[str, float]: A dictionary of players and their rewards (all one).
         """
         return {player_name: 1. for player_name in self.player_names}
+
+
+class WerewolfMixin:
+    """
+    The night order, the role index and the simultaneous actions shared by the werewolf environments, which keep
+    the seats and roles in `_player_to_idx`, `_initial_role_to_players` and `_role_to_players`.
+
+    NIGHT_DEPENDENCIES lists the night roles that make decisions, in their wake order, with the earlier night roles
+    whose effects they observe before deciding. With parallel=True, the decisions that depend on no pending one are
+    requested together, and their effects are applied in the wake order (see `get_next_players`).
+    """
+    NIGHT_DEPENDENCIES: Dict[str, List[str]] = {}
+
+    @property
+    def num_night_actions(self) -> int:
+        """
+        get the number of night actions of a game, one for each player dealt a night role
+        """
+        return sum(len(self.role_to_player(role)) for role in self.NIGHT_DEPENDENCIES)
+
+    def _night_actors(self) -> List[Tuple[str, str]]:
+        """
+        get the night actors from the current one on, as (player, role) in wake order
+        """
+        current_role = self._current_phase.split("->")[-1]
+        actors = [(self.player_names[idx], current_role) for idx in [self._next_player_idx, *self._current_candidates]]
+        night_roles = list(self.NIGHT_DEPENDENCIES)
+        for role in night_roles[night_roles.index(current_role) + 1:]:
+            actors.extend((player_name, role) for player_name in self.role_to_player(role, return_name=True))
+        return actors
+
+    def get_next_players(self) -> List[str]:
+        """
+        get the players who act next. With parallel=True, the votes are cast simultaneously, since no vote is
+        visible to the other players, and so are the night actions that depend on no pending one (see
+        `NIGHT_DEPENDENCIES`). They are applied by `step` in the order returned.
+        """
+        if self.parallel and self._current_phase == "Voting":
+            return self.player_names[self._next_player_idx:]
+        if self.parallel and "Night" in self._current_phase:
+            player_names, pending_roles = [], set()
+            for player_name, role in self._night_actors():
+                if pending_roles.intersection(self.NIGHT_DEPENDENCIES[role]):
+                    break
+                player_names.append(player_name)
+                pending_roles.add(role)
+            return player_names
+        return super().get_next_players()
+
+    def get_observations(self, player_names: List[str]) -> List[Dict]:
+        if "Night" in self._current_phase and len(player_names) > 1:
+            # The actors woken later observe the announcements made until their turns, which do not depend on the
+            # actions of the earlier actors, so their observations are previewed with empty actions on a copy of the game
+            return self._preview_observations(player_names, action={})
+        return super().get_observations(player_names)
+
+    def role_to_player(self, role, return_name=False):
+        players = self._initial_role_to_players.get(role, [])
+        if return_name:  # Get the name of players corresponding to the role
+            return players.copy()
+        else:  # Get the index of players corresponding to the role
+            return [self._player_to_idx[player] for player in players]
+
+    def _swap_roles(self, player_1, player_2):
+        """
+        swap the current roles of two players and update the role index in place
+        """
+        role_1, role_2 = self.roles_ground_truth[player_1], self.roles_ground_truth[player_2]
+        self.roles_ground_truth[player_1], self.roles_ground_truth[player_2] = role_2, role_1
+        if role_1 != role_2:
+            self._role_to_players[role_1].discard(player_1)
+            self._role_to_players[role_1].add(player_2)
+            self._role_to_players[role_2].discard(player_2)
+            self._role_to_players[role_2].add(player_1)
@@ -1,19 +1,31 @@
 import random
+from collections import deque
 from typing import List, Dict, Union
 
-from .base import Environment, TimeStep
+from .base import Environment, TimeStep, WerewolfMixin, index_roles
 from ..memory import Message, MessagePool
 from ..agents.agent import SIGNAL_END_OF_CONVERSATION
 
 
-class Werewolf(Environment):
+class Werewolf(WerewolfMixin, Environment):
     type_name = "werewolf"
+    NIGHT_DEPENDENCIES = {  # see `WerewolfMixin`
+        "Seer": [],  # checks the initial deal, which no earlier role changes
+        "Robber": [],  # chooses blindly, and sees its new role only when its switch is applied
+        "Troublemaker": [],  # chooses blindly
+    }
 
-    def __init__(self, player_names: List[str], roles_assigned: Dict[str, str], role_pool: List[str], max_discuss_round: int, **kwargs):
-        super().__init__(player_names=player_names, roles_assigned=roles_assigned, role_pool=role_pool, max_discuss_round=max_discuss_round, **kwargs)
+    def __init__(self, player_names: List[str], roles_assigned: Dict[str, str], role_pool: List[str], max_discuss_round: int,
+                 parallel: bool = False, **kwargs):
+        super().__init__(player_names=player_names, roles_assigned=roles_assigned, role_pool=role_pool, max_discuss_round=max_discuss_round,
+                         parallel=parallel, **kwargs)
         self.roles_assigned = roles_assigned
         self.role_pool = role_pool
         self.roles_ground_truth = self.roles_assigned.copy()
+        # Indexes from players to seats and from roles to players, the latter is updated in place on role swaps
+        self._player_to_idx = {name: idx for idx, name in enumerate(self.player_names)}
+        self._initial_role_to_players = index_roles(self.roles_assigned)
+        self._role_to_players = {role: set(players) for role, players in self._initial_role_to_players.items()}
         
         # The "state" of the environment is maintained by the message pool
         self.message_pool = MessagePool()
@@ -28,7 +40,8 @@ class Werewolf(Environment):
         self.max_discuss_round = max_discuss_round
         self._discuss_round = 0
 
-        # Voting phase
+        # Voting phase, in which all players vote at once if parallel=True (see `get_next_players`)
+        self.parallel = parallel
         self._players_votes = {name: 0 for name in self.player_names}
         self.winner = None
 
@@ -40,21 +53,18 @@ class Werewolf(Environment):
             return self.player_names[self._next_player_idx]
         else:
             return None
-    
-    def role_to_player(self, role, return_name=False):
-        try:
-            if return_name:  # Get the name of players corresponding to the role
-                players = [player for player, player_role in self.roles_assigned.items() if player_role == role]
-            else:  # Get the index of players corresponding to the role
-                players = [self.player_names.index(player) for player, player_role in self.roles_assigned.items() if player_role == role]
-            return players
-        except KeyError:
-            print(f"Role {role} not found in the roles dictionary.")
-            return []
+
+    @property
+    def max_steps(self) -> int:
+        """
+        get the number of steps of a whole game played one player at a time: the night actions, the speeches of all discussion rounds and the votes
+        """
+        return self.num_night_actions + self.max_discuss_round * self.num_players + self.num_players
 
     def reset(self):
         self.message_pool.reset()
         self.roles_ground_truth = self.roles_assigned.copy()
+        self._role_to_players = {role: set(players) for role, players in self._initial_role_to_players.items()}
         
         self._current_turn = 0
         self._next_player_idx = 0
@@ -70,20 +80,21 @@ class Werewolf(Environment):
         self._switch_to_werewolf()  # Start with Werewolves
         
         self._initialized = True
-        init_timestep = TimeStep(observation=self.get_observation(self.get_next_player()),
+        init_timestep = TimeStep(observation=self.lazy_observation(self.get_next_player(), turn=self._current_turn),
                                  reward=self.get_zero_rewards(),
                                  terminal=False)
 
         return init_timestep
     
-    def get_observation(self, player_name=None, only_message=True) -> Union[List[Message], Dict]:
+    def get_observation(self, player_name=None, only_message=True, turn=None) -> Union[List[Message], Dict]:
         """
-        get observation for the player
+        get observation for the player, as seen before the given turn (defaults to the current turn)
         """
         if player_name is None:
             message_history = self.message_pool.get_all_messages()
         else:
-            message_history = self.message_pool.get_visible_messages(player_name, turn=self._current_turn)
+            turn = self._current_turn if turn is None else turn
+            message_history = self.message_pool.get_visible_messages(player_name, turn=turn)
         
         if only_message:
             return message_history
@@ -132,8 +143,8 @@ class Werewolf(Environment):
         troublemakers = self.role_to_player("Troublemaker")
         if len(troublemakers) > 0:
             self._current_phase = "Night->Troublemaker"
-            self._current_candidates = troublemakers
-            self._next_player_idx = self._current_candidates.pop(0)
+            self._current_candidates = deque(troublemakers)
+            self._next_player_idx = self._current_candidates.popleft()
         else:
             self._switch_to_insomniac()
     
@@ -142,8 +153,8 @@ class Werewolf(Environment):
         robbers = self.role_to_player("Robber")
         if len(robbers) > 0:
             self._current_phase = "Night->Robber"
-            self._current_candidates = robbers
-            self._next_player_idx = self._current_candidates.pop(0)
+            self._current_candidates = deque(robbers)
+            self._next_player_idx = self._current_candidates.popleft()
         else:
             self._switch_to_troublemaker()
     
@@ -152,8 +163,8 @@ class Werewolf(Environment):
         seers = self.role_to_player("Seer")
         if len(seers) > 0:
             self._current_phase = "Night->Seer"
-            self._current_candidates = seers
-            self._next_player_idx = self._current_candidates.pop(0)
+            self._current_candidates = deque(seers)
+            self._next_player_idx = self._current_candidates.popleft()
         else:
             self._switch_to_robber()
     
@@ -177,7 +188,7 @@ class Werewolf(Environment):
                 roles_checked = random.sample(self.role_pool, 2)
                 self._moderator_speak(f"The two roles you checked in role pool are: {', '.join(roles_checked)}.",
                                       visible_to=player_name)
-            elif check_player in self.player_names:
+            elif check_player in self._player_to_idx:
                 message = Message(agent_name=player_name, content=f"I would like to check {check_player}.", 
                                   thought=action.get("thought", ""), turn=self._current_turn, visible_to=player_name)
                 self.message_pool.append_message(message)
@@ -188,19 +199,19 @@ class Werewolf(Environment):
             if len(self._current_candidates) == 0:
                 self._switch_to_robber()
             else:
-                self._next_player_idx = self._current_candidates.pop(0)
+                self._next_player_idx = self._current_candidates.popleft()
         
         elif self._current_phase == "Night->Robber":
             swap_player = action.get("player") if action.get("player") else ""
             swap_player = swap_player.lower()
-            if action.get("switch", False) and swap_player in self.player_names:
+            if action.get("switch", False) and swap_player in self._player_to_idx:
                 message = Message(agent_name=player_name, content=f"I want to switch my role with {swap_player}.", 
                                   thought=action.get("thought", ""), turn=self._current_turn, visible_to=player_name)
                 self.message_pool.append_message(message)
                 self._current_turn += 1
                 self._moderator_speak(f"You switched your role with {swap_player}, and your new role is {self.roles_ground_truth[swap_player]}.", 
                                       visible_to=player_name)
-                self.roles_ground_truth[player_name], self.roles_ground_truth[swap_player] = self.roles_ground_truth[swap_player], self.roles_ground_truth[player_name]
+                self._swap_roles(player_name, swap_player)
             else:
                 message = Message(agent_name=player_name, content="I decide not to switch with others.", 
                                   thought=action.get("thought", ""), turn=self._current_turn, visible_to=player_name)
@@ -212,20 +223,20 @@ class Werewolf(Environment):
             if len(self._current_candidates) == 0:
                 self._switch_to_troublemaker()
             else:
-                self._next_player_idx = self._current_candidates.pop(0)
+                self._next_player_idx = self._current_candidates.popleft()
         
         elif self._current_phase == "Night->Troublemaker":
             swap1 = action.get("player_1") if action.get("player_1") else ""
             swap2 = action.get("player_2") if action.get("player_2") else ""
             swap1, swap2 = swap1.lower(), swap2.lower()
-            if action.get("swap", False) and swap1 in self.player_names and swap2 in self.player_names:
+            if action.get("swap", False) and swap1 in self._player_to_idx and swap2 in self._player_to_idx:
                 message = Message(agent_name=player_name, content=f"I decide to swap roles between {swap1} and {swap2}.", 
                                   thought=action.get("thought", ""), turn=self._current_turn, visible_to=player_name)
                 self.message_pool.append_message(message)
                 self._current_turn += 1
                 self._moderator_speak(f"You successfully swapped roles between {swap1} and {swap2}", 
                                       visible_to=player_name)
-                self.roles_ground_truth[swap1], self.roles_ground_truth[swap2] = self.roles_ground_truth[swap2], self.roles_ground_truth[swap1]
+                self._swap_roles(swap1, swap2)
             else:
                 message = Message(agent_name=player_name, content="I decide not to swap others' role cards.", 
                                   thought=action.get("thought", ""), turn=self._current_turn, visible_to=player_name)
@@ -237,11 +248,11 @@ class Werewolf(Environment):
             if len(self._current_candidates) == 0:
                 self._switch_to_insomniac()
             else:
-                self._next_player_idx = self._current_candidates.pop(0)
+                self._next_player_idx = self._current_candidates.popleft()
         
         # print(self.roles_ground_truth)
         timestep = TimeStep(
-            observation=self.get_observation(self.get_next_player()),
+            observation=self.lazy_observation(self.get_next_player(), turn=self._current_turn),
             reward=self.get_zero_rewards(),
             terminal=self.is_terminal()
         )
@@ -267,7 +278,7 @@ class Werewolf(Environment):
                 self._current_phase = "Voting"
         
         timestep = TimeStep(
-            observation=self.get_observation(self.get_next_player()),
+            observation=self.lazy_observation(self.get_next_player(), turn=self._current_turn),
             reward=self.get_zero_rewards(),
             terminal=self.is_terminal()
         )
@@ -277,7 +288,7 @@ class Werewolf(Environment):
     def voting_step(self, player_name: str, action: Dict) -> TimeStep:
         vote = action.get("player") if action.get("player") else ""
         vote = vote.lower()
-        if vote in self.player_names:
+        if vote in self._player_to_idx:
             self._players_votes[vote] += 1
             message = Message(agent_name=player_name, content=f"I am voting for {vote}.", belief=action.get("belief", ""), 
                               thought=action.get("thought", ""), turn=self._current_turn, visible_to=player_name)
@@ -291,10 +302,7 @@ class Werewolf(Environment):
             self._next_player_idx += 1
         else:
             # check whether Werewolf exists among players
-            exist_werewolf = False
-            for role in self.roles_ground_truth.values():
-                if role == "Werewolf":
-                    exist_werewolf = True
+            exist_werewolf = len(self._role_to_players.get("Werewolf", ())) > 0
             
             if not exist_werewolf:
                 self._moderator_speak(f"Game over. There are no Werewolves, and everyone is on Team Village.")
@@ -331,7 +339,7 @@ class Werewolf(Environment):
             # print(f"The final votes: {self._players_votes}")
         
         timestep = TimeStep(
-            observation=self.get_observation(self.get_next_player()),
+            observation=self.lazy_observation(self.get_next_player(), turn=self._current_turn),
             reward=self.get_zero_rewards(),
             terminal=self.is_terminal()
         )
@@ -46,6 +46,41 @@ class Message:
     msg_type: str = "text"
     logged: bool = False  # Whether the message is logged in the database
 
+    def is_visible_to(self, agent_name: str) -> bool:
+        """
+        Check whether the message is visible to a given agent.
+
+        Parameters:
+            agent_name (str): The name of the agent.
+
+        Returns:
+            bool: True if the message is visible to the agent, False otherwise.
+        """
+        if self.visible_to == "all" or agent_name == "Moderator":
+            return True
+        if isinstance(self.visible_to, str):  # a single receiver, compare names rather than substrings
+            return self.visible_to == agent_name
+        return agent_name in self.visible_to
+
+    def to_dict(self) -> dict:
+        """
+        Get the fields of the message saved in game histories.
+
+        Returns:
+            dict: The fields of the message, with the timestamp as a string.
+        """
+        return {
+            "agent_name": self.agent_name,
+            "belief": self.belief,
+            "strategy": self.strategy,
+            "content": self.content,
+            "thought": self.thought,
+            "turn": self.turn,
+            "timestamp": str(self.timestamp),
+            "visible_to": self.visible_to,
+            "msg_type": self.msg_type,
+        }
+
     @property
     def msg_hash(self):
         # Generate a unique message id given the content, timestamp and role
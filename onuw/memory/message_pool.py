@@ -1,5 +1,6 @@
-from typing import List
+from typing import List, Dict, Callable
 from uuid import uuid1
+from bisect import bisect_left
 
 from .message_item import Message
 
@@ -19,13 +20,36 @@ class MessagePool:
         """
         self.conversation_id = str(uuid1())
         self._messages: List[Message] = []  # TODO: for the sake of thread safety, use a queue instead
+        self._turns: List[int] = []  # turns of the messages, which are non-decreasing since messages are appended in order
         self._last_message_idx = 0
+        self._listeners: List[Callable[[Message], None]] = []  # called with each appended message, e.g. to stream the history
 
     def reset(self):
         """
         Clear the message pool.
         """
         self._messages = []
+        self._turns = []
+
+    def get_state(self) -> Dict:
+        """
+        Get the messages in the pool, without the listeners.
+
+        Returns:
+            Dict: The state of the pool, restored by `set_state`.
+        """
+        return {"conversation_id": self.conversation_id, "messages": list(self._messages)}
+
+    def set_state(self, state: Dict):
+        """
+        Replace the messages in the pool, e.g. to resume a game. The listeners are not called.
+
+        Parameters:
+            state (Dict): The state of the pool returned by `get_state`.
+        """
+        self.conversation_id = state["conversation_id"]
+        self._messages = list(state["messages"])
+        self._turns = [message.turn for message in self._messages]
 
     def append_message(self, message: Message):
         """
@@ -35,6 +59,25 @@ class MessagePool:
             message (Message): The message to be added to the pool.
         """
         self._messages.append(message)
+        self._turns.append(message.turn)
+        for listener in self._listeners:
+            listener(message)
+
+    def add_listener(self, listener: Callable[[Message], None]):
+        """
+        Register a function called with each message appended to the pool.
+
+        Parameters:
+            listener (Callable[[Message], None]): The function, which should return quickly since it runs in the step loop.
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[Message], None]):
+        """
+        Unregister a function registered by `add_listener`.
+        """
+        if listener in self._listeners:
+            self._listeners.remove(listener)
 
     def print(self):
         """
@@ -91,10 +134,13 @@ class MessagePool:
         """
 
         # Get the messages before the current turn
-        prev_messages = [message for message in self._messages if message.turn < turn]
+        num_prev_messages = bisect_left(self._turns, turn)
+        if agent_name == "Moderator":
+            return self._messages[:num_prev_messages]
 
         visible_messages = []
-        for message in prev_messages:
-            if message.visible_to == "all" or agent_name in message.visible_to or agent_name == "Moderator":
+        for idx in range(num_prev_messages):
+            message = self._messages[idx]
+            if message.is_visible_to(agent_name):
                 visible_messages.append(message)
         return visible_messages
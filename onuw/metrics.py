@@ -0,0 +1,195 @@
+"""
+Per-call metrics of the backend queries: wall time, retries, prompt size and response size of each query,
+tagged by game, player, role, phase and call kind ("belief", "strategy" or "action").
+
+Recording is off by default and every query goes straight to the backend. After `enable()`, the queries made through
+`AgentCore._query` are recorded, and `MetricsRecorder.save` exports histograms per call kind for the whole sweep and
+for each game, e.g. to find which kind of call dominates the latency and the cost of the games.
+"""
+from typing import List, Dict, Optional, Any
+from dataclasses import dataclass, asdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from bisect import bisect_left
+import json
+import time
+
+# Upper edges of the histogram bins, the last bin counts the larger values
+LATENCY_BINS = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1., 2., 5., 10., 20., 50., 100.]  # seconds
+SIZE_BINS = [2 ** exponent for exponent in range(6, 19)]  # characters
+
+_tags: ContextVar[Dict[str, Any]] = ContextVar("metrics_tags", default={})
+_attempts: ContextVar[Optional[List[int]]] = ContextVar("metrics_attempts", default=None)
+_recorder: Optional["MetricsRecorder"] = None
+
+
+@dataclass
+class CallRecord:
+    game: str
+    player: str
+    role: str
+    phase: str
+    kind: str
+    backend: str
+    wall_time: float
+    retries: int
+    prompt_chars: int
+    response_chars: int
+    ok: bool
+    prefix_chars: int = 0  # characters of the prompt shared with the previous query of the player, see `AgentCore`
+
+
+def _histogram(values: List[float], bins: List[float]) -> List[int]:
+    counts = [0] * (len(bins) + 1)
+    for value in values:
+        counts[bisect_left(bins, value)] += 1
+    return counts
+
+
+def _quantile(sorted_values: List[float], q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def summarize(records: List[CallRecord]) -> Dict[str, Dict]:
+    """
+    Summarize the calls of each kind: count, failures, retries, latency quantiles and the histograms of latency
+    and prompt size, plus the total of all kinds under "all".
+    """
+    groups = {"all": records}
+    for record in records:
+        groups.setdefault(record.kind, []).append(record)
+
+    summary = {}
+    for kind, group in groups.items():
+        if not group:
+            continue
+        wall_times = sorted(record.wall_time for record in group)
+        summary[kind] = {
+            "calls": len(group),
+            "failures": sum(not record.ok for record in group),
+            "retries": sum(record.retries for record in group),
+            "wall_time": sum(wall_times),
+            "p50": _quantile(wall_times, 0.5),
+            "p90": _quantile(wall_times, 0.9),
+            "p99": _quantile(wall_times, 0.99),
+            "prompt_chars": sum(record.prompt_chars for record in group),
+            "response_chars": sum(record.response_chars for record in group),
+            "prefix_chars": sum(record.prefix_chars for record in group),
+            "latency_histogram": _histogram(wall_times, LATENCY_BINS),
+            "prompt_histogram": _histogram([record.prompt_chars for record in group], SIZE_BINS),
+        }
+    return summary
+
+
+class MetricsRecorder:
+    """
+    Collect the records of the backend queries of one or many games.
+    """
+
+    def __init__(self):
+        self.records: List[CallRecord] = []
+
+    def add(self, record: CallRecord):
+        self.records.append(record)  # list.append is atomic, so queries may be recorded from several threads
+
+    def games(self) -> Dict[str, List[CallRecord]]:
+        games = {}
+        for record in self.records:
+            games.setdefault(record.game, []).append(record)
+        return games
+
+    def print_summary(self):
+        summary = summarize(self.records)
+        print(f"{'kind':>10} {'calls':>6} {'retries':>7} {'total s':>9} {'p50 s':>7} {'p99 s':>7} {'prompt chars':>13} "
+              f"{'prefix %':>8}")
+        for kind, stats in summary.items():
+            print(f"{kind:>10} {stats['calls']:>6} {stats['retries']:>7} {stats['wall_time']:>9.2f} {stats['p50']:>7.3f} "
+                  f"{stats['p99']:>7.3f} {stats['prompt_chars']:>13} {stats['prefix_chars'] / max(1, stats['prompt_chars']):>8.1%}")
+
+    def save(self, path: str, include_records: bool = False):
+        """
+        Save the summaries of the sweep and of each game as json, with the raw records if include_records=True.
+        """
+        result = {
+            "latency_bins": LATENCY_BINS,
+            "size_bins": SIZE_BINS,
+            "sweep": summarize(self.records),
+            "games": {game: summarize(records) for game, records in self.games().items()},
+        }
+        if include_records:
+            result["records"] = [asdict(record) for record in self.records]
+        with open(path, "w") as f:
+            json.dump(result, f, indent=4)
+
+
+def enable(recorder: MetricsRecorder = None) -> MetricsRecorder:
+    """
+    Start recording the backend queries of all agents, to the given recorder or a new one.
+    """
+    global _recorder
+    _recorder = recorder or MetricsRecorder()
+    return _recorder
+
+
+def disable() -> Optional[MetricsRecorder]:
+    """
+    Stop recording, returning the recorder in use.
+    """
+    global _recorder
+    recorder, _recorder = _recorder, None
+    return recorder
+
+
+@contextmanager
+def tags(**kwargs):
+    """
+    Tag the queries made in this context, e.g. with the game they belong to.
+    """
+    token = _tags.set({**_tags.get(), **kwargs})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+
+def count_attempt():
+    """
+    Count an attempt of a request to the provider, called by the backends on each (re)try of their request.
+    """
+    attempts = _attempts.get()
+    if attempts is not None:
+        attempts[0] += 1
+
+
+def recorded_query(backend, kind: str, phase: str, role: str, agent_name: str, prompts: Dict[str, str],
+                   request_msg: str = None, prefix_chars: int = 0) -> str:
+    """
+    Query the backend, recording the call if recording is enabled.
+    """
+    recorder = _recorder
+    if recorder is None:
+        return backend.query(agent_name=agent_name, prompts=prompts, request_msg=request_msg)
+
+    attempts = [0]
+    token = _attempts.set(attempts)
+    response, start = None, time.perf_counter()
+    try:
+        response = backend.query(agent_name=agent_name, prompts=prompts, request_msg=request_msg)
+        return response
+    finally:
+        wall_time = time.perf_counter() - start
+        _attempts.reset(token)
+        recorder.add(CallRecord(
+            game=str(_tags.get().get("game", "")),
+            player=agent_name,
+            role=role,
+            phase=phase,
+            kind=kind,
+            backend=f"{backend.type_name}/{backend.model}" if getattr(backend, "model", None) else backend.type_name,
+            wall_time=wall_time,
+            retries=max(0, attempts[0] - 1),
+            prompt_chars=sum(len(prompt) for prompt in prompts.values()) + len(request_msg or ""),
+            response_chars=len(response) if response is not None else 0,
+            ok=response is not None,
+            prefix_chars=prefix_chars,
+        ))
@@ -0,0 +1,153 @@
+"""
+A sampling profiler of the game engine, which separates the engine costs from the time blocked in backend I/O.
+
+A background thread samples the Python stacks of the profiled threads at a fixed interval. Samples taken while a
+thread is inside `io_wait()`, which wraps every backend query (see `AgentCore._query`), are only counted as I/O wait,
+so the stacks and the hot functions cover the engine alone, e.g. `get_visible_messages`, `_construct_prompts` and
+`extract_jsons`, including those of the worker threads that query players concurrently (see `sampled_thread()`).
+The stacks are saved in the collapsed format of flamegraph.pl, speedscope and similar tools.
+Since the sampler needs the GIL, the switch interval of the interpreter is shortened while profiling, so that
+a busy engine thread hands the GIL over to the sampler about as often as it is due.
+"""
+from typing import List, Dict, Tuple, Optional
+from contextlib import contextmanager
+from collections import Counter
+import os
+import sys
+import threading
+
+_io_waiting = set()  # idents of the threads blocked in backend I/O
+_profiler: Optional["SamplingProfiler"] = None
+
+
+@contextmanager
+def io_wait():
+    """
+    Mark the current thread as blocked in backend I/O while profiling, so its samples are left out of the stacks.
+    """
+    if _profiler is None:
+        yield
+        return
+    tid = threading.get_ident()
+    _io_waiting.add(tid)
+    try:
+        yield
+    finally:
+        _io_waiting.discard(tid)
+
+
+@contextmanager
+def sampled_thread():
+    """
+    Sample the current thread too while profiling, e.g. a worker thread that queries the players of the profiled one.
+    """
+    profiler = _profiler
+    if profiler is None or profiler.all_threads:
+        yield
+        return
+    tid = threading.get_ident()
+    profiler._thread_ids.append(tid)
+    try:
+        yield
+    finally:
+        profiler._thread_ids.remove(tid)
+
+
+class SamplingProfiler:
+    """
+    Sample the stacks of the thread that starts the profiler and of the threads in `sampled_thread()`,
+    or of all threads if all_threads=True.
+    """
+
+    def __init__(self, interval: float = 0.005, all_threads: bool = False):
+        self.interval = interval
+        self.all_threads = all_threads
+        self.stacks: Counter = Counter()
+        self.io_wait_samples = 0
+        self._labels: Dict = {}
+        self._thread_ids: List[int] = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._switch_interval = None
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            name = getattr(code, "co_qualname", code.co_name)
+            label = self._labels[code] = f"{os.path.basename(code.co_filename)}:{name}"
+        return label
+
+    def _sample(self):
+        own_tid = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for tid in (frames if self.all_threads else list(self._thread_ids)):
+                frame = frames.get(tid)
+                if frame is None or tid == own_tid:
+                    continue
+                if tid in _io_waiting:
+                    self.io_wait_samples += 1
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def start(self):
+        global _profiler
+        _profiler = self
+        self._thread_ids = [threading.get_ident()]
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self._switch_interval, self.interval / 4))
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        global _profiler
+        self._stop.set()
+        self._thread.join()
+        sys.setswitchinterval(self._switch_interval)
+        _profiler = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
+
+    @property
+    def engine_samples(self) -> int:
+        return sum(self.stacks.values())
+
+    def save_collapsed(self, path: str):
+        """
+        Save the stacks in the collapsed format, one "frame;frame;...;frame count" line per stack.
+        """
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{';'.join(stack)} {count}\n")
+
+    def top(self, n: int = 20) -> List[Tuple[str, int, int]]:
+        """
+        The n functions with the most samples in their own code (self samples),
+        as (function, self samples, cumulative samples including their callees) tuples.
+        """
+        self_samples, cumulative_samples = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            self_samples[stack[-1]] += count
+            for label in set(stack):
+                cumulative_samples[label] += count
+        return [(label, count, cumulative_samples[label]) for label, count in self_samples.most_common(n)]
+
+    def print_summary(self, n: int = 20):
+        engine, io = self.engine_samples, self.io_wait_samples
+        total = max(1, engine + io)
+        print(f"{engine + io} samples every {self.interval * 1000:.1f}ms: engine {100 * engine / total:.1f}%, "
+              f"backend I/O wait {100 * io / total:.1f}%")
+        print(f"{'self %':>7} {'cum %':>7}  function (share of the engine samples)")
+        for label, self_count, cumulative_count in self.top(n):
+            print(f"{100 * self_count / max(1, engine):>7.1f} {100 * cumulative_count / max(1, engine):>7.1f}  {label}")
@@ -0,0 +1,19 @@
+import importlib
+
+# The storage formats are imported on first use, e.g. numpy is only imported with the columnar format
+_EXPORTS = {
+    "ColumnarWriter": ".columnar",
+    "ColumnarReader": ".columnar",
+    "write_histories": ".columnar",
+    "convert_json": ".columnar",
+    "iter_histories": ".columnar",
+    "JSONLHistoryWriter": ".jsonl",
+    "load_jsonl": ".jsonl",
+    "GameArchive": ".archive",
+}
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
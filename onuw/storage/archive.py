@@ -0,0 +1,315 @@
+"""
+A SQLite archive of game histories for analysis.
+
+Games saved by `Arena.save_history` (json), streamed by `Arena.stream_history` (jsonl) or stored in columnar shards
+(onuwc) are ingested once into the tables
+
+    games(game_id, source, model_name, saved_at, num_players, winner, num_messages)
+    roles(game_id, player, seat, role_assigned, role_final, team, backend, structure, won)
+    votes(game_id, voter, target)
+    messages(game_id, idx, agent_name, backend, phase, turn, strategy, visible_to, content, belief, thought, timestamp)
+
+which are indexed on backend, role, winner and strategy, so common queries answer without re-parsing files.
+"""
+from typing import List, Dict, Iterable, Iterator, Tuple, Optional, Sequence
+import os
+import re
+import json
+import sqlite3
+
+from .columnar import ColumnarReader
+from .jsonl import load_jsonl
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    game_id INTEGER PRIMARY KEY,
+    source TEXT UNIQUE NOT NULL,
+    model_name TEXT,
+    saved_at TEXT,
+    num_players INTEGER,
+    winner TEXT,
+    num_messages INTEGER
+);
+CREATE TABLE IF NOT EXISTS roles (
+    game_id INTEGER NOT NULL REFERENCES games(game_id),
+    player TEXT NOT NULL,
+    seat INTEGER NOT NULL,
+    role_assigned TEXT,
+    role_final TEXT,
+    team TEXT,
+    backend TEXT,
+    structure TEXT,
+    won INTEGER
+);
+CREATE TABLE IF NOT EXISTS votes (
+    game_id INTEGER NOT NULL REFERENCES games(game_id),
+    voter TEXT NOT NULL,
+    target TEXT
+);
+CREATE TABLE IF NOT EXISTS messages (
+    game_id INTEGER NOT NULL REFERENCES games(game_id),
+    idx INTEGER NOT NULL,
+    agent_name TEXT,
+    backend TEXT,
+    phase TEXT,
+    turn INTEGER,
+    strategy TEXT,
+    visible_to TEXT,
+    content TEXT,
+    belief TEXT,
+    thought TEXT,
+    timestamp TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_games_winner ON games(winner);
+CREATE INDEX IF NOT EXISTS idx_roles_backend ON roles(backend, role_final);
+CREATE INDEX IF NOT EXISTS idx_roles_role_final ON roles(role_final);
+CREATE INDEX IF NOT EXISTS idx_roles_role_assigned ON roles(role_assigned);
+CREATE INDEX IF NOT EXISTS idx_roles_game ON roles(game_id);
+CREATE INDEX IF NOT EXISTS idx_votes_game ON votes(game_id);
+CREATE INDEX IF NOT EXISTS idx_messages_game ON messages(game_id, idx);
+CREATE INDEX IF NOT EXISTS idx_messages_strategy ON messages(phase, strategy);
+CREATE INDEX IF NOT EXISTS idx_messages_backend_strategy ON messages(backend, phase, strategy);
+"""
+
+# file names of `main.py` are {model_name}_{timestamp}
+FILE_NAME_PATTERN = re.compile(r"^(?P<model_name>.*)_(?P<saved_at>\d{4}-\d{2}-\d{2}-\d{2}-\d{2}-\d{2})")
+VOTE_PATTERN = re.compile(r"^I am voting for (?P<target>.+)\.$")
+GROUP_COLUMNS = {"role_assigned": "r.role_assigned", "role_final": "r.role_final", "team": "r.team",
+                 "backend": "r.backend", "structure": "r.structure", "model_name": "g.model_name"}
+
+
+def team_of(role: str) -> str:
+    return "Team Werewolf" if role == "Werewolf" else "Team Village"
+
+
+def message_phases(messages: List[Dict]) -> List[str]:
+    """
+    Get the phase (Night, Day or Voting) of each message, from the announcements of the moderator.
+    """
+    phases, phase = [], "Night"
+    for message in messages:
+        if message["agent_name"] == "Moderator":
+            if message["content"].startswith("Night phase ends"):
+                phase = "Day"
+            elif message["content"].startswith("Day phase ends"):
+                phase = "Voting"
+        phases.append(phase)
+    return phases
+
+
+def iter_sources(paths: Iterable[str]) -> Iterator[Tuple[str, Dict]]:
+    """
+    Iterate over (source, history) of finished games in json, jsonl or columnar files,
+    where the source identifies a game, e.g. the path of its json file.
+    """
+    for path in paths:
+        if path.endswith(".onuwc"):
+            for idx, history in enumerate(ColumnarReader(path)):
+                yield f"{path}#{idx}", history
+        elif path.endswith(".jsonl"):
+            history = load_jsonl(path)
+            if history["evaluation"] is not None:
+                yield path, history
+        elif path.endswith(".json"):
+            with open(path, "r") as f:
+                yield path, json.load(f)
+
+
+class GameArchive:
+    """
+    A SQLite archive of game histories.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM games").fetchone()[0]
+
+    def has_source(self, source: str) -> bool:
+        return self.conn.execute("SELECT 1 FROM games WHERE source = ?", (source,)).fetchone() is not None
+
+    def ingest(self, paths: Iterable[str], batch_size: int = 1000) -> int:
+        """
+        Ingest the games in json, jsonl or columnar files (see `iter_sources`), skipping games already in the archive.
+
+        Parameters:
+            paths: The paths of the files, or directories of them.
+            batch_size: The number of games ingested in one transaction.
+
+        Returns:
+            int: The number of ingested games.
+        """
+        file_paths = []
+        for path in paths:
+            if os.path.isdir(path):
+                file_paths.extend(os.path.join(path, name) for name in sorted(os.listdir(path)))
+            else:
+                file_paths.append(path)
+
+        num_ingested, pending = 0, 0
+        with self.conn:
+            for source, history in iter_sources(file_paths):
+                if self.has_source(source):
+                    continue
+                self.add_game(history, source)
+                num_ingested += 1
+                pending += 1
+                if pending >= batch_size:
+                    self.conn.commit()
+                    pending = 0
+        self.conn.execute("PRAGMA optimize")  # refresh the statistics of the query planner
+        return num_ingested
+
+    def add_game(self, history: Dict, source: str) -> int:
+        """
+        Add a game history in the JSON format of `Arena.save_history`, returning its game_id.
+        The caller commits, e.g. within `with archive.conn:`.
+        """
+        evaluation, messages = history["evaluation"], history["messages"]
+        match = FILE_NAME_PATTERN.match(os.path.basename(source))
+        model_name, saved_at = (match.group("model_name"), match.group("saved_at")) if match else (None, None)
+        winner = evaluation.get("winner")
+        players = list(evaluation["roles_assigned"].keys())
+
+        cursor = self.conn.execute(
+            "INSERT INTO games (source, model_name, saved_at, num_players, winner, num_messages) VALUES (?, ?, ?, ?, ?, ?)",
+            (source, model_name, saved_at, len(players), winner, len(messages)))
+        game_id = cursor.lastrowid
+
+        backends = evaluation.get("player_backends") or {}
+        structures = evaluation.get("player_structures") or {}
+        role_rows = []
+        for seat, player in enumerate(players):
+            role_final = evaluation["roles_ground_truth"].get(player)
+            team = team_of(role_final)
+            won = None if winner is None else int(winner == team)
+            role_rows.append((game_id, player, seat, evaluation["roles_assigned"][player], role_final, team,
+                              backends.get(player), structures.get(player), won))
+        self.conn.executemany("INSERT INTO roles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", role_rows)
+
+        phases = message_phases(messages)
+        message_rows, vote_rows = [], []
+        for idx, (message, phase) in enumerate(zip(messages, phases)):
+            visible_to = message["visible_to"]
+            message_rows.append((game_id, idx, message["agent_name"], backends.get(message["agent_name"]), phase, message["turn"], message.get("strategy") or None,
+                                 visible_to if isinstance(visible_to, str) else json.dumps(visible_to),
+                                 message["content"], message.get("belief"), message.get("thought"), message.get("timestamp")))
+            if phase == "Voting" and message["agent_name"] in evaluation["roles_assigned"]:
+                vote = VOTE_PATTERN.match(message["content"])
+                vote_rows.append((game_id, message["agent_name"], vote.group("target") if vote else None))
+        self.conn.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", message_rows)
+        self.conn.executemany("INSERT INTO votes VALUES (?, ?, ?)", vote_rows)
+        return game_id
+
+    def query(self, sql: str, params: Sequence = ()) -> List[Dict]:
+        """
+        Run a SQL query, returning the rows as dicts.
+        """
+        cursor = self.conn.execute(sql, params)
+        columns = [description[0] for description in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def win_rate(self, by: Sequence[str] = ("role_final", "backend"), exclude_draws: bool = False) -> List[Dict]:
+        """
+        Win rate of players grouped by columns of roles (role_assigned, role_final, team, backend, structure)
+        or games (model_name).
+
+        Returns:
+            List[Dict]: The groups with the number of games played, won and the win rate.
+        """
+        for column in by:
+            if column not in GROUP_COLUMNS:
+                raise ValueError(f"Cannot group by {column}, choose from {list(GROUP_COLUMNS)}.")
+        group = ", ".join(f"{GROUP_COLUMNS[column]} AS {column}" for column in by)
+        where = "r.won IS NOT NULL" + (" AND g.winner != 'Draw'" if exclude_draws else "")
+        return self.query(
+            f"SELECT {group}, COUNT(*) AS games, SUM(r.won) AS wins, AVG(r.won) AS win_rate "
+            f"FROM roles r JOIN games g ON g.game_id = r.game_id WHERE {where} "
+            f"GROUP BY {', '.join(by)} ORDER BY {', '.join(by)}")
+
+    def strategy_frequency(self, by_phase: bool = True, backend: Optional[str] = None) -> List[Dict]:
+        """
+        Frequency of speaking strategies among the messages with a strategy, per phase if by_phase,
+        optionally only of players with a backend.
+        """
+        phase = "m.phase" if by_phase else "'all'"
+        where, params = "m.strategy IS NOT NULL", []
+        if backend is not None:
+            where += " AND m.backend = ?"
+            params.append(backend)
+        return self.query(
+            f"SELECT {phase} AS phase, m.strategy AS strategy, COUNT(*) AS count, "
+            f"CAST(COUNT(*) AS REAL) / SUM(COUNT(*)) OVER (PARTITION BY {phase}) AS frequency "
+            f"FROM messages m WHERE {where} GROUP BY {phase}, m.strategy ORDER BY phase, count DESC", params)
+
+    def games(self, winner: Optional[str] = None, backend: Optional[str] = None, role: Optional[str] = None,
+              limit: Optional[int] = None) -> List[Dict]:
+        """
+        Games with a winner, and with a player of a backend and/or a final role.
+        """
+        conditions, params = [], []
+        if winner is not None:
+            conditions.append("g.winner = ?")
+            params.append(winner)
+        if backend is not None or role is not None:
+            sub_conditions = ["r.game_id = g.game_id"]
+            if backend is not None:
+                sub_conditions.append("r.backend = ?")
+                params.append(backend)
+            if role is not None:
+                sub_conditions.append("r.role_final = ?")
+                params.append(role)
+            conditions.append(f"EXISTS (SELECT 1 FROM roles r WHERE {' AND '.join(sub_conditions)})")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        sql = f"SELECT g.* FROM games g {where} ORDER BY g.game_id"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return self.query(sql, params)
+
+
+def print_rows(rows: List[Dict]):
+    if len(rows) == 0:
+        print("(no rows)")
+        return
+    columns = list(rows[0].keys())
+    cells = [[f"{row[column]:.3f}" if isinstance(row[column], float) else str(row[column]) for column in columns] for row in rows]
+    widths = [max(len(column), *(len(cell[i]) for cell in cells)) for i, column in enumerate(columns)]
+    print("  ".join(column.rjust(width) for column, width in zip(columns, widths)))
+    for cell in cells:
+        print("  ".join(value.rjust(width) for value, width in zip(cell, widths)))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Ingest game histories into a SQLite archive and query it.")
+    parser.add_argument("database", type=str, help="path of the SQLite archive")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = subparsers.add_parser("ingest", help="ingest json, jsonl or onuwc files, or directories of them")
+    ingest_parser.add_argument("paths", type=str, nargs="+")
+    win_rate_parser = subparsers.add_parser("winrate", help="win rate grouped by columns")
+    win_rate_parser.add_argument("--by", type=str, nargs="+", default=["role_final", "backend"], choices=list(GROUP_COLUMNS))
+    strategy_parser = subparsers.add_parser("strategies", help="frequency of speaking strategies per phase")
+    strategy_parser.add_argument("--backend", type=str, default=None)
+    args = parser.parse_args()
+
+    with GameArchive(args.database) as archive:
+        if args.command == "ingest":
+            print(f"Ingested {archive.ingest(args.paths)} games, {len(archive)} games in the archive.")
+        elif args.command == "winrate":
+            print_rows(archive.win_rate(by=args.by))
+        elif args.command == "strategies":
+            print_rows(archive.strategy_frequency(backend=args.backend))
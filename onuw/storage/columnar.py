@@ -0,0 +1,360 @@
+"""
+A compact columnar format of game histories.
+
+A shard file (`.onuwc`) stores many games. Messages are stored as arrays, with names, speaking strategies,
+message types, roles, backends and winners coded as indices into string tables, and the receivers of each message
+coded as a bitmask over the seats of its game. Texts (content, belief, thought) are UTF-8 blobs with offsets.
+
+Layout: MAGIC, the header length (uint64), the JSON header with the string tables and the offset, dtype and length
+of each array, then the arrays, each aligned to ALIGNMENT bytes. `ColumnarReader` memory-maps a shard
+and exposes the arrays as zero-copy numpy views, decoding games in the JSON format of `Arena.save_history` on demand.
+"""
+from typing import List, Dict, Iterable, Iterator, Union
+import os
+import json
+import mmap
+
+import numpy as np
+
+from .jsonl import load_jsonl
+
+MAGIC = b"ONUWC\x00\x00\x01"
+ALIGNMENT = 64
+VISIBLE_TO_ALL = np.uint64(0xFFFFFFFFFFFFFFFF)
+LIST_FLAG = 1 << 63  # set for receivers given as a list, so that a single receiver in a list round-trips
+MAX_PLAYERS = 62  # seats are bits 0..61 of the visibility, leaving the all-ones mask to "all"
+TEXT_COLUMNS = ["content", "belief", "thought"]
+TABLES = ["names", "strategies", "msg_types", "roles", "backends", "structures", "winners"]
+NO_CODE = 0xFFFF  # e.g. the structure of a player in a game saved without structures
+MESSAGE_FIELDS = ["agent_name", "belief", "strategy", "content", "thought", "turn", "timestamp", "visible_to", "msg_type"]
+
+# arrays of messages, players, role pools and games, and their dtypes
+ARRAYS = {
+    "game_msg_offsets": np.int64,
+    "game_player_offsets": np.int64,
+    "game_pool_offsets": np.int64,
+    "game_winner": np.int16,
+    "msg_agent": np.uint16,
+    "msg_strategy": np.uint16,
+    "msg_type": np.uint8,
+    "msg_turn": np.int32,
+    "msg_timestamp": np.int64,
+    "msg_visible": np.uint64,
+    "player_name": np.uint16,
+    "player_role_assigned": np.uint16,
+    "player_role_truth": np.uint16,
+    "player_backend": np.uint16,
+    "player_structure": np.uint16,
+    "player_votes": np.int32,
+    "pool_role": np.uint16,
+    **{f"{column}_offsets": np.int64 for column in TEXT_COLUMNS},
+    **{f"{column}_blob": np.uint8 for column in TEXT_COLUMNS},
+}
+
+
+def _timestamp(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+class ColumnarWriter:
+    """
+    Accumulate games and write them to a shard file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tables = {table: [] for table in TABLES}
+        self._table_index = {table: {} for table in TABLES}
+        self.columns = {name: [] for name in ARRAYS if not name.endswith("_offsets") and not name.endswith("_blob")}
+        self.texts = {column: [] for column in TEXT_COLUMNS}
+        self.game_msg_offsets, self.game_player_offsets, self.game_pool_offsets = [0], [0], [0]
+
+    def _code(self, table: str, value: str) -> int:
+        index = self._table_index[table]
+        if value not in index:
+            index[value] = len(self.tables[table])
+            self.tables[table].append(value)
+        return index[value]
+
+    def __len__(self):
+        return len(self.game_msg_offsets) - 1
+
+    def add(self, history: Dict):
+        """
+        Add a game history in the JSON format of `Arena.save_history`.
+        """
+        evaluation = history["evaluation"]
+        players = list(evaluation["roles_assigned"].keys())
+        if len(players) > MAX_PLAYERS:
+            raise ValueError(f"The columnar format supports at most {MAX_PLAYERS} players, got {len(players)}.")
+        seats = {player: seat for seat, player in enumerate(players)}
+
+        for message in history["messages"]:
+            visible_to = message["visible_to"]
+            if visible_to == "all":
+                visible = int(VISIBLE_TO_ALL)
+            else:
+                receivers = [visible_to] if isinstance(visible_to, str) else visible_to
+                try:
+                    visible = sum(1 << seats[receiver] for receiver in set(receivers))
+                except KeyError as e:
+                    raise ValueError(f"Message visible to {e.args[0]}, who is not a player of the game.")
+                if not isinstance(visible_to, str):
+                    visible |= LIST_FLAG
+            self.columns["msg_agent"].append(self._code("names", message["agent_name"]))
+            self.columns["msg_strategy"].append(self._code("strategies", message.get("strategy", "")))
+            self.columns["msg_type"].append(self._code("msg_types", message.get("msg_type", "text")))
+            self.columns["msg_turn"].append(message["turn"])
+            self.columns["msg_timestamp"].append(_timestamp(message.get("timestamp")))
+            self.columns["msg_visible"].append(visible)
+            for column in TEXT_COLUMNS:
+                self.texts[column].append((message.get(column) or "").encode("utf-8"))
+
+        votes = evaluation.get("voting_result") or {}
+        backends = evaluation.get("player_backends") or {}
+        structures = evaluation.get("player_structures")
+        for player in players:
+            self.columns["player_name"].append(self._code("names", player))
+            self.columns["player_role_assigned"].append(self._code("roles", evaluation["roles_assigned"][player]))
+            self.columns["player_role_truth"].append(self._code("roles", evaluation["roles_ground_truth"][player]))
+            self.columns["player_backend"].append(self._code("backends", backends.get(player, "")))
+            self.columns["player_structure"].append(NO_CODE if structures is None else self._code("structures", structures[player]))
+            self.columns["player_votes"].append(votes.get(player, -1))
+        for role in evaluation.get("role_pool") or []:
+            self.columns["pool_role"].append(self._code("roles", role))
+        winner = evaluation.get("winner")
+        self.columns["game_winner"].append(-1 if winner is None else self._code("winners", winner))
+
+        self.game_msg_offsets.append(len(self.columns["msg_turn"]))
+        self.game_player_offsets.append(len(self.columns["player_name"]))
+        self.game_pool_offsets.append(len(self.columns["pool_role"]))
+
+    def _arrays(self) -> Dict[str, np.ndarray]:
+        arrays = {name: np.asarray(values, dtype=ARRAYS[name]) for name, values in self.columns.items()}
+        arrays["game_msg_offsets"] = np.asarray(self.game_msg_offsets, dtype=np.int64)
+        arrays["game_player_offsets"] = np.asarray(self.game_player_offsets, dtype=np.int64)
+        arrays["game_pool_offsets"] = np.asarray(self.game_pool_offsets, dtype=np.int64)
+        for column in TEXT_COLUMNS:
+            lengths = np.fromiter((len(text) for text in self.texts[column]), dtype=np.int64, count=len(self.texts[column]))
+            arrays[f"{column}_offsets"] = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+            arrays[f"{column}_blob"] = np.frombuffer(b"".join(self.texts[column]), dtype=np.uint8)
+        return arrays
+
+    def close(self):
+        """
+        Write the accumulated games to the shard file, atomically.
+        """
+        arrays = self._arrays()
+        layout, offset = {}, 0
+        for name, array in arrays.items():
+            layout[name] = {"dtype": np.dtype(ARRAYS[name]).str, "offset": offset, "length": len(array)}
+            offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+        header = json.dumps({
+            "version": 1,
+            "num_games": len(self),
+            "num_messages": len(arrays["msg_turn"]),
+            "tables": self.tables,
+            "arrays": layout
+        }).encode("utf-8")
+        data_start = -(-(len(MAGIC) + 8 + len(header)) // ALIGNMENT) * ALIGNMENT
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(len(header).to_bytes(8, "little"))
+            f.write(header)
+            for name, array in arrays.items():
+                f.seek(data_start + layout[name]["offset"])
+                f.write(array.tobytes())
+            f.truncate(data_start + offset)
+        os.replace(tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+
+class ColumnarReader:
+    """
+    Memory-map a shard file. The arrays are zero-copy views of the file, and games are decoded on demand.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a columnar game history file.")
+            header_length = int.from_bytes(f.read(8), "little")
+            header = json.loads(f.read(header_length).decode("utf-8"))
+            data_start = -(-(len(MAGIC) + 8 + header_length) // ALIGNMENT) * ALIGNMENT
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.num_games = header["num_games"]
+        self.num_messages = header["num_messages"]
+        self.tables: Dict[str, List[str]] = header["tables"]
+        self.arrays: Dict[str, np.ndarray] = {}
+        for name, spec in header["arrays"].items():
+            if spec["length"] == 0:
+                self.arrays[name] = np.zeros(0, dtype=spec["dtype"])
+            else:
+                self.arrays[name] = np.frombuffer(self._mmap, dtype=spec["dtype"], count=spec["length"],
+                                                  offset=data_start + spec["offset"])
+
+    def __len__(self):
+        return self.num_games
+
+    def __iter__(self) -> Iterator[Dict]:
+        for idx in range(self.num_games):
+            yield self[idx]
+
+    def text(self, column: str, idx: int) -> str:
+        """
+        Get the text of a message in a text column (content, belief or thought).
+        """
+        offsets = self.arrays[f"{column}_offsets"]
+        return self.arrays[f"{column}_blob"][offsets[idx]: offsets[idx + 1]].tobytes().decode("utf-8")
+
+    def _texts(self, column: str, start: int, end: int) -> List[str]:
+        offsets = self.arrays[f"{column}_offsets"]
+        blob = self.arrays[f"{column}_blob"]
+        if end == start or offsets[end] == offsets[start]:
+            return [""] * (end - start)
+        chunk = blob[offsets[start]: offsets[end]].tobytes()  # one copy for all messages of a game
+        bounds = (offsets[start: end + 1] - offsets[start]).tolist()
+        if chunk.isascii():  # byte offsets are character offsets, decode once
+            text = chunk.decode("ascii")
+            return [text[a: b] for a, b in zip(bounds, bounds[1:])]
+        return [chunk[a: b].decode("utf-8") for a, b in zip(bounds, bounds[1:])]
+
+    def game_slice(self, idx: int) -> slice:
+        """
+        The messages of a game, as a slice of the message arrays.
+        """
+        offsets = self.arrays["game_msg_offsets"]
+        return slice(int(offsets[idx]), int(offsets[idx + 1]))
+
+    def __getitem__(self, idx: int) -> Dict:
+        """
+        Decode a game in the JSON format of `Arena.save_history`.
+        """
+        if not 0 <= idx < self.num_games:
+            raise IndexError(idx)
+        arrays, tables = self.arrays, self.tables
+        names = tables["names"]
+
+        p_start, p_end = int(arrays["game_player_offsets"][idx]), int(arrays["game_player_offsets"][idx + 1])
+        players = [names[code] for code in arrays["player_name"][p_start: p_end].tolist()]
+        roles = tables["roles"]
+        votes = arrays["player_votes"][p_start: p_end].tolist()
+        pool_start, pool_end = int(arrays["game_pool_offsets"][idx]), int(arrays["game_pool_offsets"][idx + 1])
+        winner = int(arrays["game_winner"][idx])
+        evaluation = {
+            "roles_assigned": dict(zip(players, (roles[code] for code in arrays["player_role_assigned"][p_start: p_end].tolist()))),
+            "roles_ground_truth": dict(zip(players, (roles[code] for code in arrays["player_role_truth"][p_start: p_end].tolist()))),
+            "role_pool": [roles[code] for code in arrays["pool_role"][pool_start: pool_end].tolist()],
+            "player_backends": dict(zip(players, (tables["backends"][code] for code in arrays["player_backend"][p_start: p_end].tolist()))),
+            "voting_result": {player: vote for player, vote in zip(players, votes) if vote >= 0},
+            "winner": None if winner < 0 else tables["winners"][winner]
+        }
+        structures = arrays["player_structure"][p_start: p_end].tolist() if "player_structure" in arrays else []
+        if len(structures) > 0 and structures[0] != NO_CODE:
+            evaluation["player_structures"] = dict(zip(players, (tables["structures"][code] for code in structures)))
+
+        messages = self.game_slice(idx)
+        texts = {column: self._texts(column, messages.start, messages.stop) for column in TEXT_COLUMNS}
+        strategies, msg_types = tables["strategies"], tables["msg_types"]
+        receivers = {}  # decode each distinct visibility of the game once
+        for visible in set(arrays["msg_visible"][messages].tolist()):
+            receivers[visible] = self._decode_visible(visible, players)
+        columns = zip(
+            [names[code] for code in arrays["msg_agent"][messages].tolist()],
+            texts["belief"],
+            [strategies[code] for code in arrays["msg_strategy"][messages].tolist()],
+            texts["content"],
+            texts["thought"],
+            arrays["msg_turn"][messages].tolist(),
+            [str(timestamp) for timestamp in arrays["msg_timestamp"][messages].tolist()],
+            [receivers[visible] if isinstance(receivers[visible], str) else list(receivers[visible])
+             for visible in arrays["msg_visible"][messages].tolist()],
+            [msg_types[code] for code in arrays["msg_type"][messages].tolist()]
+        )
+        return {"messages": [dict(zip(MESSAGE_FIELDS, row)) for row in columns], "evaluation": evaluation}
+
+    @staticmethod
+    def _decode_visible(visible: int, players: List[str]) -> Union[str, List[str]]:
+        if visible == int(VISIBLE_TO_ALL):
+            return "all"
+        receivers = [player for seat, player in enumerate(players) if visible >> seat & 1]
+        if visible & LIST_FLAG:
+            return receivers
+        return receivers[0]
+
+    def close(self):
+        self.arrays = {}
+        try:
+            self._mmap.close()
+        except BufferError:  # views of the arrays are still alive, the map is released with them
+            pass
+
+
+def write_histories(path: str, histories: Iterable[Dict]) -> int:
+    """
+    Write game histories in the JSON format of `Arena.save_history` to a shard file, returning the number of games.
+    """
+    with ColumnarWriter(path) as writer:
+        for history in histories:
+            writer.add(history)
+    return len(writer)
+
+
+def convert_json(json_paths: List[str], output_dir: str, games_per_shard: int = 10000) -> List[str]:
+    """
+    Convert JSON game histories to shard files in output_dir, returning the paths of the shards.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    shard_paths = []
+    for shard_idx, start in enumerate(range(0, len(json_paths), games_per_shard)):
+        def histories():
+            for json_path in json_paths[start: start + games_per_shard]:
+                with open(json_path, "r") as f:
+                    yield json.load(f)
+        shard_path = os.path.join(output_dir, f"shard_{shard_idx:05d}.onuwc")
+        write_histories(shard_path, histories())
+        shard_paths.append(shard_path)
+    return shard_paths
+
+
+def iter_histories(paths: Iterable[str]) -> Iterator[Dict]:
+    """
+    Iterate over the games in shard files, JSONL game history files (finished games only) or JSON game history files.
+    """
+    for path in paths:
+        if path.endswith(".onuwc"):
+            reader = ColumnarReader(path)
+            yield from reader
+        elif path.endswith(".jsonl"):
+            history = load_jsonl(path)
+            if history["evaluation"] is not None:
+                yield {"messages": history["messages"], "evaluation": history["evaluation"]}
+        else:
+            with open(path, "r") as f:
+                yield json.load(f)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Convert JSON game histories to the columnar format.")
+    parser.add_argument("input_dir", type=str, help="directory of JSON game histories")
+    parser.add_argument("output_dir", type=str, help="directory of the shard files")
+    parser.add_argument("--games_per_shard", type=int, default=10000)
+    args = parser.parse_args()
+
+    json_paths = sorted(os.path.join(args.input_dir, name) for name in os.listdir(args.input_dir) if name.endswith(".json"))
+    shard_paths = convert_json(json_paths, args.output_dir, args.games_per_shard)
+    print(f"Converted {len(json_paths)} games to {len(shard_paths)} shards in {args.output_dir}")
@@ -0,0 +1,133 @@
+"""
+An append-only JSONL format of game histories, written while the game is played.
+
+Each line is a JSON object with a "type": a "header" with the setting of the game, then one "message" per message
+in the order of the message pool, then the "evaluation" at the end of the game, or "aborted" if the game was
+terminated early. Lines are serialized and written by a background thread, so the step loop only enqueues messages,
+and every written line reaches the file before the next batch, so a crash loses at most the messages in flight.
+"""
+from typing import Dict, Optional
+import os
+import json
+import queue
+import atexit
+import weakref
+import threading
+
+from ..memory import Message
+
+_STOP = object()
+_open_writers = weakref.WeakSet()
+
+
+class JSONLHistoryWriter:
+    """
+    Stream the history of one game to a JSONL file through a buffered background writer.
+    """
+
+    def __init__(self, path: str, max_batch: int = 256, fsync: bool = True):
+        """
+        Parameters:
+            path (str): The path of the JSONL file, to which lines are appended.
+            max_batch (int): The maximum number of lines written at once.
+            fsync (bool): Whether to fsync the file when the writer is closed.
+        """
+        self.path = path
+        self.max_batch = max_batch
+        self.fsync = fsync
+        self.num_lines = 0
+        self.closed = False
+        self._queue = queue.SimpleQueue()
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name=f"history-writer-{os.path.basename(path)}", daemon=True)
+        self._thread.start()
+        _open_writers.add(self)
+
+    def _run(self):
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                while True:
+                    batch = [self._queue.get()]
+                    while len(batch) < self.max_batch:
+                        try:
+                            batch.append(self._queue.get_nowait())
+                        except queue.Empty:
+                            break
+                    lines, stop = [], False
+                    for item in batch:
+                        if item is _STOP:
+                            stop = True
+                            break
+                        record = {"type": "message", **item.to_dict()} if isinstance(item, Message) else item
+                        lines.append(json.dumps(record, ensure_ascii=False) + "\n")
+                    f.write("".join(lines))
+                    f.flush()
+                    self.num_lines += len(lines)
+                    if stop:
+                        if self.fsync:
+                            os.fsync(f.fileno())
+                        return
+        except BaseException as e:  # surfaced to the game loop by close()
+            self._error = e
+
+    def write_header(self, header: Dict):
+        self._queue.put({"type": "header", **header})
+
+    def write_message(self, message: Message):
+        """
+        Enqueue a message, e.g. as a listener of `MessagePool`. The message is serialized in the background.
+        """
+        self._queue.put(message)
+
+    def close(self, evaluation: Optional[Dict] = None, aborted: Optional[str] = None):
+        """
+        Write the footer, if any, and wait for all lines to be written.
+
+        Parameters:
+            evaluation (dict): The evaluation of a finished game, written as the last line.
+            aborted (str): The reason why the game was terminated early, written as the last line.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        if evaluation is not None:
+            self._queue.put({"type": "evaluation", **evaluation})
+        elif aborted is not None:
+            self._queue.put({"type": "aborted", "reason": aborted})
+        self._queue.put(_STOP)
+        self._thread.join()
+        _open_writers.discard(self)
+        if self._error is not None:
+            raise IOError(f"Failed to write the game history to {self.path}") from self._error
+
+
+@atexit.register
+def _close_open_writers():
+    # e.g. the game loop crashed, keep what has been played
+    for writer in list(_open_writers):
+        try:
+            writer.close(aborted="interrupted")
+        except IOError:
+            pass
+
+
+def load_jsonl(path: str) -> Dict:
+    """
+    Load a JSONL game history in the JSON format of `Arena.save_history`.
+    The "evaluation" is None if the game did not finish, and a line truncated by a crash is ignored.
+    """
+    header, messages, evaluation = None, [], None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            record_type = record.pop("type", None)
+            if record_type == "header":
+                header = record
+            elif record_type == "message":
+                messages.append(record)
+            elif record_type == "evaluation":
+                evaluation = record
+    return {"header": header, "messages": messages, "evaluation": evaluation}
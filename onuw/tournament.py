@@ -0,0 +1,275 @@
+"""
+Tournaments between combinations of backends and agent structures, played through the work queue of
+`onuw.workqueue` and reported as win rates while the results come in.
+
+Each entrant is a backend (fields overriding the backend config of the players) with an agent structure. Every
+pair of entrants plays lineups that alternate their seats, in every rotation of the seats and with both entrants
+first, and each lineup is played with every rotation of the role pool over the seats (or the first few), so each
+entrant sits in each seat and holds each role equally often. The roles are dealt by the lineup, not at random.
+
+A lineup is identified by a hash of the config, the entrants and roles of the seats and the repeat index, which
+names its games in the queue as `{lineup_id}_{timestamp}`, so the archive of `onuw.storage.archive` records it as
+the model name of the game. Lineups already in the archive or in the queue are not scheduled again, so a tournament
+can be extended with new entrants or resumed after an interruption. The finished games are ingested into the archive.
+
+Usage (from the root of the repository):
+    python -m onuw.tournament run queue --config configs/werewolf.json --archive games.db --num_workers 4 \\
+        --backends '{"backend_type": "openai-chat", "model": "gpt-4"}' '{"backend_type": "gemini"}' \\
+        --structures react dpins:llm
+    python -m onuw.tournament report queue --archive games.db
+"""
+from typing import List, Dict, Tuple, Optional, Set
+from itertools import combinations, product
+import os
+import json
+import time
+import hashlib
+import argparse
+import multiprocessing
+
+from .arena import expand_role_pool
+from .config import ArenaConfig
+from .storage.archive import GameArchive, team_of
+from .workqueue import WorkQueue, run_worker, _read_json
+
+LINEUP_PREFIX = "T"
+
+
+def backend_name(backend: Dict) -> str:
+    """
+    the model or backend type of a backend, followed by a short hash of the whole backend config if it has other
+    fields (e.g. the temperature), so backends differing in any field are distinct entrants
+    """
+    name = backend.get("model") or backend["backend_type"]
+    if set(backend) - {"backend_type", "model"}:
+        name += "#" + hashlib.sha1(json.dumps(backend, sort_keys=True).encode()).hexdigest()[:6]
+    return name
+
+
+def make_entrants(backends: List[Dict], structures: List[str]) -> List[Dict]:
+    """
+    the entrants of every combination of a backend and a structure, named "{backend name}/{structure}"
+    """
+    entrants = []
+    for backend, structure in product(backends, structures):
+        entrants.append({"name": f"{backend_name(backend)}/{structure}", "backend": backend, "structure": structure})
+    names = [entrant["name"] for entrant in entrants]
+    duplicates = sorted(set(name for name in names if names.count(name) > 1))
+    if duplicates:
+        raise ValueError(f"Entrants given more than once: {', '.join(duplicates)}")
+    return entrants
+
+
+def seat_patterns(num_entrants: int, num_seats: int, self_play: bool = False) -> List[Tuple[int, ...]]:
+    """
+    the entrant of each seat in the lineups: for every pair of entrants, their alternating seats in every rotation
+    and with either entrant first, and a lineup of each entrant alone if self_play=True
+    """
+    patterns = []
+    if self_play or num_entrants == 1:
+        patterns.extend((idx,) * num_seats for idx in range(num_entrants))
+    for first, second in combinations(range(num_entrants), 2):
+        for pair in ((first, second), (second, first)):
+            alternating = [pair[seat % 2] for seat in range(num_seats)]
+            for shift in range(num_seats):
+                pattern = tuple(alternating[shift:] + alternating[:shift])
+                if pattern not in patterns:
+                    patterns.append(pattern)
+    return patterns
+
+
+def role_deals(role_pool: List[str], num_seats: int, num_rotations: Optional[int] = None) -> List[List[str]]:
+    """
+    the roles of the seats, rotating the role pool so that each seat holds each role of the pool once,
+    the roles left over being the center cards
+    """
+    num_rotations = len(role_pool) if num_rotations is None else min(num_rotations, len(role_pool))
+    return [(role_pool[shift:] + role_pool[:shift])[:num_seats] for shift in range(num_rotations)]
+
+
+def lineup_id(config_path: str, entrants: List[Dict], roles: List[str], repeat: int) -> str:
+    key = json.dumps({"config": os.path.normpath(config_path), "seats": [[entrant["name"], entrant["backend"],
+                      entrant["structure"], role] for entrant, role in zip(entrants, roles)], "repeat": repeat},
+                     sort_keys=True)
+    return LINEUP_PREFIX + hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def schedule(config_path: str, entrants: List[Dict], num_role_rotations: Optional[int] = None, num_repeats: int = 1,
+             self_play: bool = False, num_steps: Optional[int] = None) -> List[Dict]:
+    """
+    the specs of the games of a tournament in the format of `WorkQueue.submit`, keyed by their lineup ids
+    """
+    config = ArenaConfig.load(config_path)
+    num_seats = len(config.players)
+    role_pool = expand_role_pool(config.environment["role_pool"])
+    specs = []
+    for pattern in seat_patterns(len(entrants), num_seats, self_play):
+        seats = [entrants[idx] for idx in pattern]
+        for roles in role_deals(role_pool, num_seats, num_role_rotations):
+            for repeat in range(num_repeats):
+                specs.append({
+                    "lineup_id": lineup_id(config_path, seats, roles, repeat),
+                    "config": config_path,
+                    "seed": len(specs),
+                    "randomness": False,
+                    "num_steps": num_steps,
+                    "lineup": [entrant["name"] for entrant in seats],
+                    "players": [{"backend": entrant["backend"], "structure": entrant["structure"], "role": role}
+                                for entrant, role in zip(seats, roles)],
+                })
+    return specs
+
+
+def scheduled_lineups(queue: WorkQueue, archive: Optional[GameArchive] = None) -> Set[str]:
+    """
+    the ids of the lineups in the archive, and of those pending, being played or finished in the queue
+    """
+    lineup_ids = set()
+    for state in ("pending", "claimed", "done"):
+        lineup_ids.update(task_id.split("_")[0] for task_id in queue.task_ids(state))
+    if archive is not None:
+        rows = archive.query("SELECT DISTINCT model_name FROM games WHERE model_name LIKE ?", (f"{LINEUP_PREFIX}%",))
+        lineup_ids.update(row["model_name"] for row in rows)
+    return lineup_ids
+
+
+def submit(queue: WorkQueue, specs: List[Dict], archive: Optional[GameArchive] = None) -> List[str]:
+    """
+    Add the games of the lineups not yet scheduled to the queue.
+
+    Returns:
+        List[str]: The ids of the submitted games.
+    """
+    skipped = scheduled_lineups(queue, archive)
+    cur_time = time.strftime("%Y-%m-%d-%H-%M-%S", time.localtime())
+    new_specs = [dict(spec, task_id=f"{spec['lineup_id']}_{cur_time}") for spec in specs
+                 if spec["lineup_id"] not in skipped]
+    return queue.submit(new_specs)
+
+
+class Standings:
+    """
+    The win rates of the entrants, overall and in each team, updated with each finished game.
+    """
+
+    def __init__(self):
+        self.games: Set[str] = set()
+        self.records: Dict[str, Dict[str, List[int]]] = {}  # entrant -> team -> [games, wins]
+
+    def add_game(self, task_id: str, lineup: List[str], evaluation: Dict):
+        if task_id in self.games:
+            return
+        self.games.add(task_id)
+        if evaluation.get("winner") is None:  # unfinished
+            return
+        for entrant, player in zip(lineup, evaluation["roles_assigned"]):
+            team = team_of(evaluation["roles_ground_truth"][player])
+            record = self.records.setdefault(entrant, {}).setdefault(team, [0, 0])
+            record[0] += 1
+            record[1] += int(evaluation["winner"] == team)
+
+    def rows(self) -> List[Dict]:
+        rows = []
+        for entrant, teams in sorted(self.records.items()):
+            games, wins = sum(record[0] for record in teams.values()), sum(record[1] for record in teams.values())
+            row = {"entrant": entrant, "seats": games, "wins": wins, "win_rate": wins / games}
+            for team in ("Team Village", "Team Werewolf"):
+                team_games, team_wins = teams.get(team, [0, 0])
+                row[team] = team_wins / team_games if team_games else None
+            rows.append(row)
+        return sorted(rows, key=lambda row: row["win_rate"], reverse=True)
+
+    def print(self):
+        print(f"{len(self.games)} games")
+        print(f"{'entrant':>30} {'seats':>6} {'wins':>5} {'win rate':>8} {'village':>8} {'werewolf':>8}")
+        for row in self.rows():
+            village, werewolf = (f"{row[team]:.3f}" if row[team] is not None else "-"
+                                 for team in ("Team Village", "Team Werewolf"))
+            print(f"{row['entrant']:>30} {row['seats']:>6} {row['wins']:>5} {row['win_rate']:>8.3f} {village:>8} {werewolf:>8}",
+                  flush=True)
+
+
+def report(root: str, archive_path: Optional[str] = None, report_interval: float = 10., stale_timeout: float = 120.,
+           exit_when_empty: bool = True) -> Standings:
+    """
+    Update the standings with the games finished in the queue and print them every report_interval seconds,
+    ingesting the games into the archive and re-queueing stale claims, until no game is pending or claimed
+    (if exit_when_empty=True).
+    """
+    queue = WorkQueue(root)
+    archive = GameArchive(archive_path) if archive_path else None
+    standings = Standings()
+    try:
+        while True:
+            queue.requeue_stale(stale_timeout)
+            new_ids = [task_id for task_id in queue.task_ids("done") if task_id not in standings.games
+                       and task_id.startswith(LINEUP_PREFIX)]
+            for task_id in new_ids:
+                spec = _read_json(queue.path("done", task_id))
+                standings.add_game(task_id, spec["lineup"], _read_json(queue.path("results", task_id))["evaluation"])
+            if archive is not None and new_ids:
+                archive.ingest([queue.path("results", task_id) for task_id in new_ids])
+            status = queue.status()
+            if new_ids:
+                print(" ".join(f"{state} {count}" for state, count in status.items()))
+                standings.print()
+            if exit_when_empty and status["pending"] == 0 and status["claimed"] == 0:
+                return standings
+            time.sleep(report_interval)
+    finally:
+        if archive is not None:
+            archive.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="schedule a tournament, play it and report the win rates")
+    run_parser.add_argument("root", type=str, help="the directory of the queue")
+    run_parser.add_argument("--config", type=str, required=True, help="the arena config of the games")
+    run_parser.add_argument("--backends", type=json.loads, nargs="+", required=True,
+                            help="json fields overriding the backend config of the players, one per backend")
+    run_parser.add_argument("--structures", type=str, nargs="+", default=["dpins:llm"],
+                            help="agent structures, e.g. react, dpins:no, dpins:llm, dpins:rl or dpins:random")
+    run_parser.add_argument("--archive", type=str, default=None,
+                            help="SQLite archive of the games, whose lineups are not played again")
+    run_parser.add_argument("--num_role_rotations", type=int, default=None,
+                            help="number of rotations of the role pool played by each lineup, defaults to all")
+    run_parser.add_argument("--num_repeats", type=int, default=1, help="number of games of each lineup and roles")
+    run_parser.add_argument("--self_play", action="store_true", default=False, help="also play each entrant alone")
+    run_parser.add_argument("--num_steps", type=int, default=None,
+                            help="the maximum number of steps of a game, defaults to the length of a whole game")
+    run_parser.add_argument("--num_workers", type=int, default=1,
+                            help="number of worker processes on this host, 0 if the games are played by remote workers")
+    run_parser.add_argument("--report_interval", type=float, default=10.)
+
+    report_parser = subparsers.add_parser("report", help="report the win rates of the finished games")
+    report_parser.add_argument("root", type=str, help="the directory of the queue")
+    report_parser.add_argument("--archive", type=str, default=None, help="SQLite archive to ingest the games into")
+    report_parser.add_argument("--report_interval", type=float, default=10.)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        entrants = make_entrants(args.backends, args.structures)
+        specs = schedule(args.config, entrants, args.num_role_rotations, args.num_repeats, args.self_play, args.num_steps)
+        queue = WorkQueue(args.root)
+        if args.archive:
+            with GameArchive(args.archive) as archive:
+                task_ids = submit(queue, specs, archive)
+        else:
+            task_ids = submit(queue, specs)
+        print(f"{len(entrants)} entrants, {len(specs)} games, {len(specs) - len(task_ids)} already played or scheduled, "
+              f"submitted {len(task_ids)} games to {args.root}.")
+        processes = [multiprocessing.Process(target=run_worker, args=(args.root,)) for _ in range(args.num_workers)]
+        for process in processes:
+            process.start()
+        report(args.root, args.archive, report_interval=args.report_interval)
+        for process in processes:
+            process.join()
+    elif args.command == "report":
+        report(args.root, args.archive, report_interval=args.report_interval)
+
+
+if __name__ == "__main__":
+    main()
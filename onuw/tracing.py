@@ -0,0 +1,116 @@
+"""
+Opt-in tracing of the game loop as nested spans, saved in the Chrome trace-event format,
+so the timeline of whole games can be opened in chrome://tracing or https://ui.perfetto.dev.
+
+The spans of a step are nested as: arena.step > agent.act > agent.query > prompt.build / backend.query,
+agent.parse (JSON parsing of the responses), then env.check_action and env.step.
+When tracing is disabled, `span` returns a shared no-op span, so the instrumented code only pays a function call.
+"""
+from typing import List, Dict, Optional
+import os
+import json
+import time
+import threading
+
+_tracer: Optional["Tracer"] = None
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """
+    A span being recorded, whose attributes can be extended by `set` before it ends.
+    """
+    __slots__ = ("tracer", "name", "attrs", "start")
+
+    def __init__(self, tracer: "Tracer", name: str, attrs: Dict):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer.add_event(self.name, self.start, end, self.attrs)
+        return False
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class Tracer:
+    """
+    Collect the spans of all threads as complete ("X") events of the Chrome trace-event format.
+    """
+
+    def __init__(self):
+        self.events: List[Dict] = []
+        self.origin = time.perf_counter_ns()
+        self.pid = os.getpid()
+        self._thread_names = {}
+
+    def add_event(self, name: str, start: int, end: int, attrs: Dict):
+        tid = threading.get_ident()
+        if tid not in self._thread_names:
+            self._thread_names[tid] = threading.current_thread().name
+        self.events.append({
+            "name": name,
+            "ph": "X",
+            "ts": (start - self.origin) / 1000,  # microseconds
+            "dur": (end - start) / 1000,
+            "pid": self.pid,
+            "tid": tid,
+            "args": attrs,
+        })
+
+    def save(self, path: str):
+        thread_events = [{"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}}
+                         for tid, name in self._thread_names.items()]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": thread_events + self.events, "displayTimeUnit": "ms"}, f)
+
+
+def span(name: str, **attrs):
+    """
+    A context manager recording a span with the given attributes, or doing nothing if tracing is disabled.
+    Attributes known only later can be added by `set` on the span returned by `with`.
+    """
+    tracer = _tracer
+    if tracer is None:
+        return _NULL_SPAN
+    return Span(tracer, name, attrs)
+
+
+def enable(tracer: Tracer = None) -> Tracer:
+    """
+    Start tracing, to the given tracer or a new one.
+    """
+    global _tracer
+    _tracer = tracer or Tracer()
+    return _tracer
+
+
+def disable() -> Optional[Tracer]:
+    """
+    Stop tracing, returning the tracer in use.
+    """
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
@@ -55,7 +55,9 @@ class ArenaCLI:
 
         env_desc = self.arena.global_prompt
         num_players = env.num_players
-        player_colors = random.sample(visible_colors, num_players)  # sample different colors for players
+        # sample different colors for players, and reuse colors when there are more players than colors
+        player_colors = random.sample(visible_colors, min(num_players, len(visible_colors)))
+        player_colors = [player_colors[idx % len(player_colors)] for idx in range(num_players)]
         name_to_color = dict(zip(env.player_names, player_colors))
         # System and Moderator messages are printed in red
         name_to_color["System"] = "red"
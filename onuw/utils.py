@@ -1,33 +1,66 @@
+from typing import Dict, Union
+from collections.abc import Mapping
 import re
 import json
 import os
+import importlib
+import functools
 from tenacity import retry, stop_after_attempt, wait_random_exponential
-from dotenv import load_dotenv, find_dotenv
 
-load_dotenv(find_dotenv(), override=True)
+_env_loaded = False
 
-try:
-    import openai
-except ImportError:
-    is_openai_available = False
-else:
-    openai.api_key = os.environ.get("OPENAI_API_KEY")
-    if openai.api_key is None:
-        is_openai_available = False
-    else:
-        is_openai_available = True
-
-try:
-    import google.generativeai as genai
-except ImportError:
-    is_gemini_available = False
-else:
-    google_api_key = os.environ.get("GOOGLE_API_KEY")
-    if google_api_key is None:
-        is_gemini_available = False
-    else:
-        is_gemini_available = True
-        genai.configure(api_key=google_api_key)
+
+def load_env():
+    """
+    Load the environment variables (e.g. the API keys) from the .env file, once per process.
+    """
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv, find_dotenv
+        load_dotenv(find_dotenv(), override=True)
+        _env_loaded = True
+
+
+class LazyRegistry(Mapping):
+    """
+    A registry from names to classes, which imports the module of a class only when the class is first used,
+    so that the dependencies of unused implementations (e.g. d3rlpy for the RL policy) are never imported.
+
+    Parameters:
+        paths (Dict[str, str]): The "module:attribute" path of each class, relative modules resolved from package.
+        package (str): The package of the relative modules.
+    """
+
+    def __init__(self, paths: Dict[str, str], package: str = None):
+        self._paths = dict(paths)
+        self._package = package
+        self._loaded = {}
+
+    def __getitem__(self, name):
+        try:
+            return self._loaded[name]
+        except KeyError:
+            pass
+        module_name, attribute = self._paths[name].split(":")
+        obj = self._loaded[name] = getattr(importlib.import_module(module_name, self._package), attribute)
+        return obj
+
+    def __iter__(self):
+        return iter(self._paths)
+
+    def __len__(self):
+        return len(self._paths)
+
+    def register(self, name: str, target: Union[str, type]):
+        """
+        Register a class, or the "module:attribute" path of a class to be imported on first use.
+        """
+        if isinstance(target, str):
+            self._paths[name] = target
+            self._loaded.pop(name, None)
+        else:
+            self._paths[name] = f"{target.__module__}:{target.__qualname__}"
+            self._loaded[name] = target
 
 
 BACKEND_MODEL = {
@@ -36,10 +69,24 @@ BACKEND_MODEL = {
 }
 
 
+@functools.lru_cache(maxsize=None)
+def _embedding_client(backend):
+    # the client library is imported and configured when the first embedding is requested
+    load_env()
+    if backend == "gemini":
+        import google.generativeai as genai
+        genai.configure(api_key=os.environ.get("GOOGLE_API_KEY"))
+        return genai
+    import openai
+    openai.api_key = os.environ.get("OPENAI_API_KEY")
+    return openai
+
+
 @retry(stop=stop_after_attempt(6), wait=wait_random_exponential(min=1, max=60))
 def get_embeddings(content, backend="gemini"):
     content = content.replace("\n\n", "\n").replace("\n", " ")
     if backend == "gemini":
+        genai = _embedding_client(backend)
         result = genai.embed_content(
             model=BACKEND_MODEL[backend],
             content=content,
@@ -47,6 +94,7 @@ def get_embeddings(content, backend="gemini"):
         )
         embedding = result["embedding"]
     elif backend == "openai":
+        openai = _embedding_client(backend)
         result = openai.Embedding.create(
             input=content,
             model=BACKEND_MODEL[backend]
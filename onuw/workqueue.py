@@ -0,0 +1,342 @@
+"""
+A work queue of games in a shared directory, to spread sweeps over several processes or machines without a broker.
+
+Each game is a JSON spec (config path, seed, backend overrides) that moves between the subdirectories of the queue:
+    pending/   specs waiting for a worker
+    claimed/   specs being played, claimed by an atomic rename and kept fresh by the heartbeat of the worker
+    done/      specs of finished games, with the worker, wall time and number of steps
+    failed/    specs that failed too many times
+    results/   the histories of finished games, in the json format of `Arena.save_history`
+    checkpoints/  checkpoints of unfinished games, so a re-queued game resumes where its last worker stopped
+
+The directory only needs a filesystem on which rename is atomic (e.g. a local disk or NFS shared by the nodes).
+A coordinator re-queues claims whose heartbeat is stale, e.g. of crashed workers, and reports the throughput.
+
+Usage (from the root of the repository):
+    python -m onuw.workqueue submit queue --config configs/werewolf.json --num_games 100 --backend '{"backend_type": "scripted"}'
+    python -m onuw.workqueue worker queue --num_workers 4
+    python -m onuw.workqueue coordinate queue --stale_timeout 120
+"""
+from typing import List, Dict, Optional, Tuple
+import os
+import json
+import time
+import uuid
+import random
+import socket
+import logging
+import argparse
+import threading
+import traceback
+import multiprocessing
+
+from .arena import Arena
+from .config import ArenaConfig
+
+QUEUE_DIRS = ("pending", "claimed", "done", "failed", "results", "checkpoints")
+
+
+def _write_json(path: str, obj: Dict):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(obj, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str) -> Dict:
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+class WorkQueue:
+    """
+    The directory of a work queue, see the module docstring for its layout.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        for name in QUEUE_DIRS:
+            os.makedirs(os.path.join(root, name), exist_ok=True)
+
+    def path(self, state: str, task_id: str, suffix: str = ".json") -> str:
+        return os.path.join(self.root, state, f"{task_id}{suffix}")
+
+    def task_ids(self, state: str) -> List[str]:
+        return sorted(name[:-5] for name in os.listdir(os.path.join(self.root, state)) if name.endswith(".json"))
+
+    def submit(self, specs: List[Dict]) -> List[str]:
+        """
+        Add games to the queue. A spec has the keys "config" (the path of an arena config), "seed" (the seed of
+        the role assignment), "backend" (fields overriding the backend config of every player) and "num_steps",
+        and optionally "players" (fields overriding the config of each seat, e.g. its backend, structure and role)
+        and "randomness" (whether the roles are dealt randomly, True by default).
+
+        Returns:
+            List[str]: The ids of the submitted games.
+        """
+        task_ids = []
+        for spec in specs:
+            task_id = spec.get("task_id") or uuid.uuid4().hex
+            _write_json(self.path("pending", task_id), dict(spec, task_id=task_id, attempts=0))
+            task_ids.append(task_id)
+        return task_ids
+
+    def claim(self, worker_id: str) -> Optional[Dict]:
+        """
+        Claim a pending game by renaming its spec to claimed/, which only one of the competing workers can do.
+
+        Returns:
+            Optional[Dict]: The spec of the claimed game, or None if no game is pending.
+        """
+        task_ids = self.task_ids("pending")
+        random.shuffle(task_ids)  # workers starting together try different games first
+        for task_id in task_ids:
+            claimed_path = self.path("claimed", task_id)
+            try:
+                os.rename(self.path("pending", task_id), claimed_path)
+                os.utime(claimed_path)  # the first heartbeat, rename keeps the time of the submission
+                spec = _read_json(claimed_path)
+            except FileNotFoundError:  # claimed by another worker
+                continue
+            spec.update(worker=worker_id, attempts=spec.get("attempts", 0) + 1)
+            _write_json(claimed_path, spec)  # so the attempt is counted even if the worker is killed
+            return spec
+        return None
+
+    def heartbeat(self, task_id: str) -> bool:
+        """
+        Refresh the claim of a game. Returns False if the claim was lost, i.e. the game was re-queued as stale.
+        """
+        try:
+            os.utime(self.path("claimed", task_id))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def complete(self, spec: Dict, history: Dict, elapsed: float, num_steps: int):
+        """
+        Save the history of a finished game and move its spec to done/.
+        """
+        task_id = spec["task_id"]
+        _write_json(self.path("results", task_id), history)
+        _write_json(self.path("done", task_id), dict(spec, elapsed=elapsed, num_steps=num_steps, finished_at=time.time()))
+        self._release(task_id)
+
+    def fail(self, spec: Dict, error: str, max_attempts: int):
+        """
+        Re-queue a game that raised an error, or move it to failed/ after max_attempts.
+        The checkpoint of the game is kept, so the next attempt continues from the last step.
+        """
+        state = "pending" if spec["attempts"] < max_attempts else "failed"
+        _write_json(self.path(state, spec["task_id"]), dict(spec, error=error))
+        self._release(spec["task_id"])
+
+    def _release(self, task_id: str):
+        try:
+            os.remove(self.path("claimed", task_id))
+        except FileNotFoundError:
+            logging.warning(f"The claim of game {task_id} was lost as stale, it may be played again.")
+
+    def requeue_stale(self, stale_timeout: float) -> List[str]:
+        """
+        Move the claims without a heartbeat for stale_timeout seconds back to pending/.
+
+        Returns:
+            List[str]: The ids of the re-queued games.
+        """
+        requeued, now = [], time.time()
+        for task_id in self.task_ids("claimed"):
+            claimed_path = self.path("claimed", task_id)
+            try:
+                if now - os.path.getmtime(claimed_path) < stale_timeout:
+                    continue
+                os.rename(claimed_path, self.path("pending", task_id))
+            except FileNotFoundError:  # finished or failed meanwhile
+                continue
+            requeued.append(task_id)
+        return requeued
+
+    def status(self) -> Dict[str, int]:
+        return {state: len(self.task_ids(state)) for state in ("pending", "claimed", "done", "failed")}
+
+
+def load_arena(spec: Dict, checkpoint_path: str) -> Arena:
+    """
+    Create the arena of a game, resuming it from its checkpoint if an earlier attempt was interrupted.
+    """
+    if os.path.exists(checkpoint_path):
+        logging.info(f"Resuming game {spec['task_id']} from {checkpoint_path}.")
+        return Arena.from_checkpoint(checkpoint_path)
+
+    config = ArenaConfig.load(spec["config"])
+    for player_config in config.players:
+        player_config["backend"].update(spec.get("backend") or {})
+    for player_config, seat in zip(config.players, spec.get("players") or []):  # overrides of each seat
+        player_config["backend"].update(seat.get("backend") or {})
+        player_config.update({key: value for key, value in seat.items() if key != "backend"})
+    random.seed(spec.get("seed"))  # the role assignment of the game
+    arena = Arena.from_config(config, randomness=spec.get("randomness", True))
+    arena.enable_checkpointing(checkpoint_path)
+    arena.reset()
+    return arena
+
+
+class ClaimLost(Exception):
+    """
+    The claim of a game was re-queued as stale while it was played, so another worker may be playing it.
+    """
+    pass
+
+
+def play_game(queue: WorkQueue, spec: Dict, heartbeat_interval: float) -> Tuple[Dict, int]:
+    """
+    Play a claimed game to the end while a background thread keeps its claim fresh.
+    Raises ClaimLost if the claim is lost, and RuntimeError if the game is not finished after spec["num_steps"] steps
+    (by default the length of a whole game, see `Environment.max_steps`),
+    in which case its checkpoint is kept and the next attempt continues from it.
+
+    Returns:
+        Tuple[Dict, int]: The history of the game and the number of steps played by this attempt.
+    """
+    stop, lost = threading.Event(), threading.Event()
+
+    def beat():
+        while not stop.wait(heartbeat_interval):
+            if not queue.heartbeat(spec["task_id"]):
+                lost.set()
+                return
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        arena = load_arena(spec, queue.path("checkpoints", spec["task_id"], suffix=".ckpt"))
+        max_steps, num_steps = spec.get("num_steps") or arena.environment.max_steps or 30, 0
+        while num_steps < max_steps:
+            if lost.is_set():
+                raise ClaimLost(f"The claim of game {spec['task_id']} was re-queued as stale.")
+            timestep = arena.step()
+            num_steps += 1
+            if timestep.terminal:
+                return arena._history_dict(), num_steps
+        raise RuntimeError(f"The game is not finished after {max_steps} steps.")
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_worker(root: str, worker_id: str = None, max_attempts: int = 3, heartbeat_interval: float = 10.,
+               poll_interval: float = 1., exit_when_empty: bool = True) -> int:
+    """
+    Claim and play games from the queue until it is empty, or forever if exit_when_empty=False.
+
+    Returns:
+        int: The number of games finished by this worker.
+    """
+    queue = WorkQueue(root)
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    num_finished = 0
+    while True:
+        spec = queue.claim(worker_id)
+        if spec is None:
+            if exit_when_empty and queue.status()["claimed"] == 0:
+                return num_finished
+            time.sleep(poll_interval)  # games may come back from stale claims
+            continue
+
+        if spec["attempts"] > max_attempts:  # the earlier attempts were killed without failing the game
+            queue.fail(spec, error=spec.get("error", "The workers were killed."), max_attempts=max_attempts)
+            continue
+
+        start = time.perf_counter()
+        try:
+            history, num_steps = play_game(queue, spec, heartbeat_interval)
+        except ClaimLost as e:  # abandon the game to the worker that claimed it again
+            logging.warning(f"Worker {worker_id} abandoned game {spec['task_id']}: {e}")
+            continue
+        except Exception as e:
+            logging.warning(f"Worker {worker_id} failed game {spec['task_id']}: {e}")
+            queue.fail(spec, error="".join(traceback.format_exception_only(type(e), e)).strip(), max_attempts=max_attempts)
+            continue
+        queue.complete(spec, history, elapsed=time.perf_counter() - start, num_steps=num_steps)
+        num_finished += 1
+
+
+def coordinate(root: str, stale_timeout: float = 120., report_interval: float = 10., exit_when_empty: bool = True):
+    """
+    Re-queue stale claims and print the throughput of the workers every report_interval seconds,
+    until no game is pending or claimed (if exit_when_empty=True).
+    """
+    queue = WorkQueue(root)
+    start = time.time()
+    while True:
+        time.sleep(report_interval)
+        requeued = queue.requeue_stale(stale_timeout)
+        if requeued:
+            logging.warning(f"Re-queued {len(requeued)} stale games: {', '.join(requeued)}")
+
+        records = [_read_json(queue.path("done", task_id)) for task_id in queue.task_ids("done")]
+        recent = [record for record in records if record["finished_at"] >= start]  # finished since the start
+        elapsed = time.time() - start
+        games_per_worker = {}
+        for record in recent:
+            games_per_worker[record["worker"]] = games_per_worker.get(record["worker"], 0) + 1
+        status = queue.status()
+        print(f"[{elapsed:8.1f}s] " + " ".join(f"{state} {count}" for state, count in status.items())
+              + f" | {len(recent) / elapsed:.2f} games/s, "
+              + f"{sum(record['num_steps'] for record in recent) / elapsed:.1f} steps/s, "
+              + f"{len(games_per_worker)} workers", flush=True)
+        if exit_when_empty and status["pending"] == 0 and status["claimed"] == 0:
+            return status
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    submit_parser = subparsers.add_parser("submit", help="add games to the queue")
+    submit_parser.add_argument("root", type=str, help="the directory of the queue")
+    submit_parser.add_argument("--config", type=str, required=True, help="the arena config of the games")
+    submit_parser.add_argument("--num_games", type=int, default=1)
+    submit_parser.add_argument("--seed", type=int, default=0, help="the seed of the first game, incremented per game")
+    submit_parser.add_argument("--backend", type=json.loads, default=None,
+                               help="json fields overriding the backend config of every player")
+    submit_parser.add_argument("--num_steps", type=int, default=None,
+                               help="the maximum number of steps of a game, defaults to the length of a whole game")
+
+    worker_parser = subparsers.add_parser("worker", help="play games from the queue")
+    worker_parser.add_argument("root", type=str, help="the directory of the queue")
+    worker_parser.add_argument("--num_workers", type=int, default=1, help="number of worker processes on this host")
+    worker_parser.add_argument("--max_attempts", type=int, default=3)
+    worker_parser.add_argument("--heartbeat_interval", type=float, default=10.)
+    worker_parser.add_argument("--forever", action="store_true", default=False, help="keep polling an empty queue")
+
+    coordinate_parser = subparsers.add_parser("coordinate", help="re-queue stale games and report the throughput")
+    coordinate_parser.add_argument("root", type=str, help="the directory of the queue")
+    coordinate_parser.add_argument("--stale_timeout", type=float, default=120.,
+                                   help="seconds without heartbeat after which a claimed game is re-queued")
+    coordinate_parser.add_argument("--report_interval", type=float, default=10.)
+    args = parser.parse_args()
+
+    if args.command == "submit":
+        specs = [{"config": args.config, "seed": args.seed + idx, "backend": args.backend, "num_steps": args.num_steps}
+                 for idx in range(args.num_games)]
+        WorkQueue(args.root).submit(specs)
+        print(f"Submitted {len(specs)} games to {args.root}.")
+    elif args.command == "worker":
+        kwargs = dict(max_attempts=args.max_attempts, heartbeat_interval=args.heartbeat_interval,
+                      exit_when_empty=not args.forever)
+        if args.num_workers == 1:
+            run_worker(args.root, **kwargs)
+        else:
+            processes = [multiprocessing.Process(target=run_worker, args=(args.root,), kwargs=kwargs)
+                         for _ in range(args.num_workers)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+    elif args.command == "coordinate":
+        coordinate(args.root, stale_timeout=args.stale_timeout, report_interval=args.report_interval)
+
+
+if __name__ == "__main__":
+    main()
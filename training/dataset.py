@@ -0,0 +1,146 @@
+"""
+The memory-mapped replay dataset format for training.
+
+An exported dataset is a directory of `.npy` arrays (observations, actions, rewards, terminals) and a `meta.json`.
+The loader memory-maps the arrays, so the observations are read from disk on demand
+and parallel trainers on one machine share them through the OS page cache instead of each holding a copy.
+"""
+import os
+import json
+
+import numpy as np
+
+ARRAYS = {
+    "observations": np.float32,
+    "actions": np.int64,
+    "rewards": np.float32,
+    "terminals": np.float32
+}
+META_FILE = "meta.json"
+
+
+def save_arrays(dir_path, observations, actions, rewards, terminals, source=None):
+    """
+    Save transitions in the export format.
+    args:
+        dir_path: the directory of the exported dataset
+        observations: array of shape (num_rows, obs_dim)
+        actions, rewards, terminals: arrays of shape (num_rows,), where terminals mark the ends of episodes
+        source: the path of the dataset the transitions come from, if any
+    """
+    os.makedirs(dir_path, exist_ok=True)
+    meta_path = os.path.join(dir_path, META_FILE)
+    if os.path.exists(meta_path):  # invalidate the previous export until all arrays are written
+        os.remove(meta_path)
+
+    data = {"observations": observations, "actions": actions, "rewards": rewards, "terminals": terminals}
+    num_rows = len(actions)
+    for name, dtype in ARRAYS.items():
+        array = np.asarray(data[name], dtype=dtype)
+        array = array.reshape(num_rows, -1) if name == "observations" else array.reshape(num_rows)
+        np.save(os.path.join(dir_path, f"{name}.npy"), array)
+
+    meta = {
+        "num_rows": num_rows,
+        "obs_dim": int(np.shape(observations)[1]) if num_rows > 0 else 0,
+        "num_episodes": int(np.count_nonzero(np.asarray(terminals))),
+        "source": source,
+        "source_mtime": os.path.getmtime(source) if source is not None else None
+    }
+    with open(meta_path + ".tmp", mode='w') as f:
+        json.dump(meta, f)
+    os.replace(meta_path + ".tmp", meta_path)
+
+
+def read_meta(dir_path):
+    """
+    Read the meta of an exported dataset, or None if there is no complete export in dir_path.
+    """
+    meta_path = os.path.join(dir_path, META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, mode='r') as f:
+        return json.load(f)
+
+
+def export_dataset(dataset_path, dir_path):
+    """
+    Export a d3rlpy `.h5` dataset, unless the export in dir_path is up to date.
+    args:
+        dataset_path: the path of the d3rlpy dataset
+        dir_path: the directory of the exported dataset
+    """
+    meta = read_meta(dir_path)
+    if meta is not None and meta["source_mtime"] == os.path.getmtime(dataset_path):
+        return
+
+    save_arrays(dir_path, *load_arrays(dataset_path), source=dataset_path)
+
+
+def episodes_to_arrays(episodes):
+    """
+    Concatenate d3rlpy episodes into transition arrays, where terminals mark the ends of episodes.
+    returns:
+        observations, actions, rewards, terminals
+    """
+    terminals = []
+    for episode in episodes:
+        episode_terminals = np.zeros(episode.size(), dtype=np.float32)
+        episode_terminals[-1] = 1.0  # timeouts are kept as episode ends
+        terminals.append(episode_terminals)
+    return (
+        np.concatenate([episode.observations for episode in episodes]),
+        np.concatenate([episode.actions for episode in episodes]).reshape(-1),
+        np.concatenate([episode.rewards for episode in episodes]).reshape(-1),
+        np.concatenate(terminals)
+    )
+
+
+def load_arrays(path):
+    """
+    Load the transition arrays of a dataset.
+    args:
+        path: an exported dataset directory, whose arrays are memory-mapped, or a d3rlpy `.h5` file
+    returns:
+        observations, actions, rewards, terminals
+    """
+    if not os.path.isdir(path):
+        import d3rlpy
+        with open(path, "rb") as f:
+            return episodes_to_arrays(d3rlpy.dataset.ReplayBuffer.load(f, d3rlpy.dataset.InfiniteBuffer()).episodes)
+    assert read_meta(path) is not None, f"No complete exported dataset in {path}."
+    return tuple(np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r') for name in ARRAYS)
+
+
+def load_dataset(path):
+    """
+    Load a replay dataset for d3rlpy.
+    args:
+        path: an exported dataset directory, whose observations stay memory-mapped,
+              or a d3rlpy `.h5` file, which is loaded into memory
+    returns:
+        d3rlpy ReplayBuffer
+    """
+    import d3rlpy
+    if not os.path.isdir(path):
+        with open(path, "rb") as f:
+            return d3rlpy.dataset.ReplayBuffer.load(f, d3rlpy.dataset.InfiniteBuffer())
+
+    observations, actions, rewards, terminals = load_arrays(path)
+    # episodes are slices, i.e. views into the memory-mapped observations
+    return d3rlpy.dataset.MDPDataset(
+        observations=observations,
+        actions=np.asarray(actions),
+        rewards=np.asarray(rewards),
+        terminals=np.asarray(terminals),
+        action_space=d3rlpy.ActionSpace.DISCRETE
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset", type=str, default="../dataset_process/processed_dataset.h5")
+    parser.add_argument("--output", type=str, default="../dataset_process/processed_dataset_arrays")
+    args = parser.parse_args()
+    export_dataset(args.dataset, args.output)
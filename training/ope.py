@@ -0,0 +1,253 @@
+"""
+Offline policy evaluation of trained checkpoints on the processed dataset, without playing games.
+
+All estimators are vectorized over the evaluated policies:
+    - IS / WIS: trajectory-wise (weighted) importance sampling, with the behavior policy estimated from action frequencies
+    - FQE: fitted Q evaluation with a linear Q-function on randomly projected observations, solved in closed form per action
+Confidence intervals are percentile bootstraps over episodes.
+
+Usage:
+    python ope.py --dataset ../dataset_process/processed_dataset_arrays --checkpoints "file_logs/DiscreteCQL_*/model_*.d3"
+"""
+import glob
+import argparse
+import warnings
+
+import numpy as np
+
+from dataset import load_arrays
+
+
+def split_episodes(terminals):
+    """
+    Get the episode of each transition and the start index of each episode, where terminals mark the ends of episodes.
+    returns:
+        episode_ids: array of shape (num_rows,)
+        starts: array of shape (num_episodes,)
+    """
+    terminals = np.asarray(terminals).reshape(-1) > 0
+    terminals[-1] = True  # an unfinished last episode ends with the dataset
+    ends = np.flatnonzero(terminals) + 1
+    starts = np.concatenate([[0], ends[:-1]])
+    episode_ids = np.repeat(np.arange(len(starts)), ends - starts)
+    return episode_ids, starts
+
+
+def behavior_policy(actions, action_size, smoothing=1.0):
+    """
+    Estimate the behavior policy as the (smoothed) frequencies of actions in the dataset.
+    returns:
+        probabilities of shape (action_size,)
+    """
+    counts = np.bincount(np.asarray(actions, dtype=np.int64), minlength=action_size) + smoothing
+    return counts / counts.sum()
+
+
+def softmax_policy(q_values, temperature=1.0):
+    """
+    The policy of Q-values, a softmax over actions, or greedy if the temperature is 0.
+    args:
+        q_values: array of shape (..., action_size)
+    returns:
+        probabilities of the same shape
+    """
+    if temperature == 0:
+        probs = np.zeros_like(q_values)
+        np.put_along_axis(probs, q_values.argmax(axis=-1)[..., None], 1.0, axis=-1)
+        return probs
+    logits = q_values / temperature
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    probs = np.exp(logits)
+    return probs / probs.sum(axis=-1, keepdims=True)
+
+
+def checkpoint_policies(checkpoints, observations, action_size, temperature=1.0, batch_size=4096, device="cpu:0"):
+    """
+    Compute the action probabilities of all checkpoints in one pass over the observations,
+    so that each chunk of the (memory-mapped) observations is read once for all policies.
+    args:
+        checkpoints: paths of d3rlpy checkpoints, e.g. file_logs/*/model_*.d3
+        observations: array of shape (num_rows, obs_dim)
+    returns:
+        probabilities of shape (num_policies, num_rows, action_size)
+    """
+    import d3rlpy
+    algos = [d3rlpy.load_learnable(checkpoint, device=device) for checkpoint in checkpoints]
+    probs = np.empty((len(algos), len(observations), action_size), dtype=np.float32)
+    for start in range(0, len(observations), batch_size):
+        batch = np.asarray(observations[start: start + batch_size], dtype=np.float32)
+        for k, algo in enumerate(algos):
+            q_values = np.stack([algo.predict_value(batch, np.full(len(batch), action)) for action in range(action_size)], axis=-1)
+            probs[k, start: start + len(batch)] = softmax_policy(q_values, temperature)
+    return probs
+
+
+def importance_sampling(policy_probs, actions, rewards, terminals, behavior_probs, gamma=0.99):
+    """
+    Per-episode importance weights and discounted returns of all policies.
+    args:
+        policy_probs: array of shape (num_policies, num_rows, action_size)
+        behavior_probs: array of shape (action_size,)
+    returns:
+        weights: array of shape (num_policies, num_episodes)
+        returns: array of shape (num_episodes,)
+    """
+    actions = np.asarray(actions, dtype=np.int64).reshape(-1)
+    episode_ids, starts = split_episodes(terminals)
+    discounts = gamma ** (np.arange(len(actions)) - starts[episode_ids])
+    returns = np.add.reduceat(discounts * np.asarray(rewards, dtype=np.float64).reshape(-1), starts)
+
+    taken = np.take_along_axis(policy_probs, actions[None, :, None], axis=2)[:, :, 0].astype(np.float64)
+    with np.errstate(divide='ignore'):
+        log_ratios = np.log(taken) - np.log(behavior_probs[actions])
+    log_weights = np.add.reduceat(log_ratios, starts, axis=1)
+    return np.exp(np.minimum(log_weights, 700.0)), returns
+
+
+def fitted_q_evaluation(policy_probs, observations, actions, rewards, terminals, gamma=0.99,
+                        feature_dim=64, l2=1e-3, n_iters=100, tol=1e-4, batch_size=65536, seed=0):
+    """
+    Fitted Q evaluation of all policies with a linear Q-function per action on randomly projected observations.
+    The regression of each action shares its Gram matrix across policies and iterations, so every iteration
+    is a few matrix products for all policies together.
+    args:
+        policy_probs: array of shape (num_policies, num_rows, action_size)
+        observations: array of shape (num_rows, obs_dim)
+    returns:
+        the estimated values of the initial state of each episode, array of shape (num_policies, num_episodes)
+    """
+    num_policies, num_rows, action_size = policy_probs.shape
+    actions = np.asarray(actions, dtype=np.int64).reshape(-1)
+    rewards = np.asarray(rewards, dtype=np.float64).reshape(-1)
+    _, starts = split_episodes(terminals)
+    not_done = np.ones(num_rows)
+    not_done[np.concatenate([starts[1:], [num_rows]]) - 1] = 0.0
+
+    # features: random projection of the observations and a bias
+    rng = np.random.default_rng(seed)
+    projection = rng.standard_normal((observations.shape[1], feature_dim)) / np.sqrt(feature_dim)
+    features = np.ones((num_rows, feature_dim + 1))
+    for start in range(0, num_rows, batch_size):
+        features[start: start + batch_size, :feature_dim] = np.asarray(observations[start: start + batch_size], dtype=np.float64) @ projection
+
+    masks = [actions == action for action in range(action_size)]
+    gram_invs = []
+    for mask in masks:
+        phi = features[mask]
+        gram_invs.append(np.linalg.inv(phi.T @ phi + l2 * max(len(phi), 1) * np.eye(feature_dim + 1)))
+
+    weights = np.zeros((action_size, feature_dim + 1, num_policies))
+    for _ in range(n_iters):
+        values = np.zeros((num_rows, num_policies))
+        for action in range(action_size):
+            values += policy_probs[:, :, action].T * (features @ weights[action])
+        next_values = np.zeros_like(values)
+        next_values[:-1] = values[1:]
+        targets = rewards[:, None] + gamma * not_done[:, None] * next_values
+
+        new_weights = np.stack([gram_invs[action] @ (features[mask].T @ targets[mask]) for action, mask in enumerate(masks)])
+        delta = np.abs(new_weights - weights).max()
+        weights = new_weights
+        if delta < tol:
+            break
+
+    initial_values = np.zeros((num_policies, len(starts)))
+    for action in range(action_size):
+        initial_values += policy_probs[:, starts, action] * (features[starts] @ weights[action]).T
+    return initial_values
+
+
+def bootstrap(numerators, denominators=None, n_bootstrap=1000, confidence=0.95, seed=0, block_elements=2 ** 22):
+    """
+    Percentile bootstrap over episodes of the mean of per-episode values of all policies,
+    or of a ratio of sums if denominators are given, e.g. for WIS.
+    The resample counts are drawn in blocks of replicates of at most block_elements counts, so the memory does not
+    grow with n_bootstrap * num_episodes.
+    args:
+        numerators, denominators: arrays of shape (num_policies, num_episodes)
+    returns:
+        estimates, lower bounds, upper bounds: arrays of shape (num_policies,)
+    """
+    num_policies, num_episodes = numerators.shape
+    rng = np.random.default_rng(seed)
+    block_size = max(1, block_elements // num_episodes)
+    sample_numerators = np.empty((num_policies, n_bootstrap))
+    sample_denominators = np.empty((num_policies, n_bootstrap)) if denominators is not None else None
+    for start in range(0, n_bootstrap, block_size):
+        stop = min(start + block_size, n_bootstrap)
+        counts = rng.multinomial(num_episodes, np.full(num_episodes, 1.0 / num_episodes), size=stop - start).astype(np.float64)
+        sample_numerators[:, start:stop] = numerators @ counts.T
+        if denominators is not None:
+            sample_denominators[:, start:stop] = denominators @ counts.T
+    if denominators is None:
+        estimates = numerators.mean(axis=1)
+        samples = sample_numerators / num_episodes
+    else:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            estimates = numerators.sum(axis=1) / denominators.sum(axis=1)
+            samples = sample_numerators / sample_denominators
+    alpha = (1 - confidence) / 2
+    with warnings.catch_warnings():  # WIS is undefined for a policy with zero weight on all episodes
+        warnings.simplefilter("ignore", RuntimeWarning)
+        lower, upper = np.nanquantile(samples, [alpha, 1 - alpha], axis=1)
+    return estimates, lower, upper
+
+
+def evaluate(policy_probs, observations, actions, rewards, terminals, gamma=0.99, n_bootstrap=1000, confidence=0.95, **fqe_kwargs):
+    """
+    Evaluate policies on a dataset, e.g. the arrays of `DataProcessor.get_dataset`, with IS, WIS and FQE.
+    args:
+        policy_probs: array of shape (num_policies, num_rows, action_size)
+    returns:
+        list of results of each policy: {"IS": (estimate, lower, upper), "WIS": ..., "FQE": ..., "ESS": effective sample size}
+    """
+    action_size = policy_probs.shape[2]
+    behavior_probs = behavior_policy(actions, action_size)
+    weights, returns = importance_sampling(policy_probs, actions, rewards, terminals, behavior_probs, gamma)
+    initial_values = fitted_q_evaluation(policy_probs, observations, actions, rewards, terminals, gamma, **fqe_kwargs)
+
+    estimators = {
+        "IS": bootstrap(weights * returns, n_bootstrap=n_bootstrap, confidence=confidence),
+        "WIS": bootstrap(weights * returns, weights, n_bootstrap=n_bootstrap, confidence=confidence),
+        "FQE": bootstrap(initial_values, n_bootstrap=n_bootstrap, confidence=confidence)
+    }
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ess = weights.sum(axis=1) ** 2 / (weights ** 2).sum(axis=1)
+    return [
+        {**{name: tuple(float(array[k]) for array in arrays) for name, arrays in estimators.items()}, "ESS": float(ess[k])}
+        for k in range(len(policy_probs))
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset", type=str, default="../dataset_process/processed_dataset_arrays",
+                        help="a directory exported by dataset.py, or a d3rlpy .h5 file")
+    parser.add_argument("--checkpoints", type=str, nargs="+", required=True, help="paths or glob patterns of d3rlpy checkpoints")
+    parser.add_argument("--action_size", type=int, default=None, help="number of actions, inferred from the dataset by default")
+    parser.add_argument("--temperature", type=float, default=1.0, help="softmax temperature of the policies, 0 for greedy")
+    parser.add_argument("--gamma", type=float, default=0.99)
+    parser.add_argument("--n_bootstrap", type=int, default=1000)
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--feature_dim", type=int, default=64, help="dimension of the projected observations for FQE")
+    args = parser.parse_args()
+
+    checkpoints = sorted(path for pattern in args.checkpoints for path in (glob.glob(pattern) or [pattern]))
+    observations, actions, rewards, terminals = load_arrays(args.dataset)
+    action_size = args.action_size or int(np.max(actions)) + 1
+    policy_probs = checkpoint_policies(checkpoints, observations, action_size, temperature=args.temperature)
+
+    # the value of the behavior policy for reference
+    _, returns = importance_sampling(policy_probs[:1], actions, rewards, terminals, behavior_policy(actions, action_size), args.gamma)
+    behavior, lower, upper = bootstrap(returns[None], n_bootstrap=args.n_bootstrap, confidence=args.confidence)
+    print(f"behavior: {behavior[0]:.4f} [{lower[0]:.4f}, {upper[0]:.4f}] over {len(returns)} episodes")
+
+    results = evaluate(policy_probs, observations, actions, rewards, terminals, gamma=args.gamma,
+                       n_bootstrap=args.n_bootstrap, confidence=args.confidence, feature_dim=args.feature_dim)
+    for checkpoint, result in zip(checkpoints, results):
+        estimates = "  ".join(f"{name} {result[name][0]:.4f} [{result[name][1]:.4f}, {result[name][2]:.4f}]" for name in ["IS", "WIS", "FQE"])
+        print(f"{checkpoint}: {estimates}  ESS {result['ESS']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
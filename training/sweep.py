@@ -0,0 +1,133 @@
+"""
+Train DiscreteCQL over a grid of seeds and hyperparameters in parallel CPU processes.
+
+The replay dataset is exported once to the format of `dataset.py`, which every process memory-maps,
+so the runs share one copy of the observations in the page cache instead of each loading the whole `.h5`.
+Each process uses a fixed number of threads, so parallel runs do not oversubscribe the cores.
+
+Usage:
+    python sweep.py --dataset ../dataset_process/processed_dataset.h5 --seeds 1 2 3 --alphas 1.0 4.0 --threads_per_run 2
+"""
+import os
+import csv
+import time
+import argparse
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from dataset import export_dataset, load_dataset
+
+THREAD_ENV_VARS = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"]
+
+
+def _init_worker(num_threads):
+    """
+    Pin the thread count of a worker before torch creates its thread pools.
+    """
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(num_threads)
+    import torch
+    torch.set_num_threads(num_threads)
+    torch.set_num_interop_threads(1)
+
+
+def _run(arrays_dir, run_config, n_steps, n_steps_per_epoch, tensorboard):
+    from train import train
+    dataset = load_dataset(arrays_dir)
+    experiment_name = "DiscreteCQL_seed{seed}_alpha{alpha}_nq{n_quantiles}_lr{learning_rate}".format(**run_config)
+    start = time.time()
+    results = train(dataset, device="cpu:0", n_steps=n_steps, n_steps_per_epoch=n_steps_per_epoch,
+                    experiment_name=experiment_name, tensorboard=tensorboard, show_progress=False, **run_config)
+    metrics = [metrics for _, metrics in results]
+    td_errors = [m["td_error"] for m in metrics if "td_error" in m]
+    return {
+        **run_config,
+        "loss": metrics[-1].get("loss", float("nan")) if metrics else float("nan"),
+        "td_error": td_errors[-1] if td_errors else float("nan"),
+        "best_td_error": min(td_errors) if td_errors else float("nan"),
+        "minutes": (time.time() - start) / 60
+    }
+
+
+def summarize(rows):
+    """
+    Aggregate the runs of each hyperparameter variant over seeds, as mean and standard deviation.
+    """
+    groups = {}
+    for row in rows:
+        groups.setdefault((row["alpha"], row["n_quantiles"], row["learning_rate"]), []).append(row)
+    summary = []
+    for (alpha, n_quantiles, learning_rate), group in sorted(groups.items()):
+        entry = {"alpha": alpha, "n_quantiles": n_quantiles, "learning_rate": learning_rate, "seeds": len(group)}
+        for key in ["loss", "td_error", "best_td_error"]:
+            values = np.array([row[key] for row in group], dtype=np.float64)
+            entry[key] = f"{values.mean():.4f} ± {values.std():.4f}"
+        summary.append(entry)
+    return summary
+
+
+def print_table(rows):
+    columns = list(rows[0].keys())
+    widths = [max(len(str(column)), *(len(str(row[column])) for row in rows)) for column in columns]
+    print("  ".join(str(column).rjust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(row[column]).rjust(width) for column, width in zip(columns, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset", type=str, default="../dataset_process/gpt4_examples.h5")
+    parser.add_argument("--arrays_dir", type=str, default=None, help="where the shared arrays are exported, next to the dataset by default")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[42])
+    parser.add_argument("--alphas", type=float, nargs="+", default=[4.0])
+    parser.add_argument("--n_quantiles", type=int, nargs="+", default=[32])
+    parser.add_argument("--learning_rates", type=float, nargs="+", default=[5e-5])
+    parser.add_argument("--n_steps", type=int, default=500000)
+    parser.add_argument("--n_steps_per_epoch", type=int, default=5000)
+    parser.add_argument("--threads_per_run", type=int, default=1)
+    parser.add_argument("--num_workers", type=int, default=None, help="parallel runs, all cores divided by threads_per_run by default")
+    parser.add_argument("--tensorboard", action="store_true")
+    parser.add_argument("--output", type=str, default="sweep_results.csv")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.dataset):  # already exported
+        arrays_dir = args.dataset
+    else:
+        arrays_dir = args.arrays_dir or os.path.splitext(args.dataset)[0] + "_arrays"
+        export_dataset(args.dataset, arrays_dir)
+
+    run_configs = [
+        {"seed": seed, "alpha": alpha, "n_quantiles": n_quantiles, "learning_rate": learning_rate}
+        for seed, alpha, n_quantiles, learning_rate in itertools.product(args.seeds, args.alphas, args.n_quantiles, args.learning_rates)
+    ]
+    num_workers = args.num_workers or max(1, (os.cpu_count() or 1) // args.threads_per_run)
+    num_workers = min(num_workers, len(run_configs))
+    print(f"{len(run_configs)} runs on {num_workers} workers with {args.threads_per_run} threads each")
+
+    rows = []
+    # spawn, so that each worker creates its own torch thread pools with the pinned size
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(args.threads_per_run,)) as executor:
+        futures = {executor.submit(_run, arrays_dir, run_config, args.n_steps, args.n_steps_per_epoch, args.tensorboard): run_config
+                   for run_config in run_configs}
+        for future in as_completed(futures):
+            row = future.result()
+            rows.append(row)
+            print(f"finished {futures[future]}: td_error={row['td_error']:.4f} in {row['minutes']:.1f} min")
+
+    rows.sort(key=lambda row: (row["alpha"], row["n_quantiles"], row["learning_rate"], row["seed"]))
+    with open(args.output, mode='w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print_table([{key: f"{value:.4g}" if isinstance(value, float) else value for key, value in row.items()} for row in rows])
+    print()
+    print_table(summarize(rows))
+
+
+if __name__ == "__main__":
+    main()
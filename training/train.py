@@ -1,47 +1,80 @@
 import argparse
 import d3rlpy
 
+from dataset import load_dataset
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--dataset", type=str, default="../dataset_process/gpt4_examples.h5")
-    parser.add_argument("--seed", type=int, default=42)
-    parser.add_argument("--device", type=str, default="cuda:0")
-    args = parser.parse_args()
 
+def train(dataset, seed=42, device="cpu:0", alpha=4.0, n_quantiles=32, learning_rate=5e-5,
+          n_steps=500000, n_steps_per_epoch=5000, experiment_name=None, tensorboard=True, show_progress=True):
+    """
+    Train DiscreteCQL on a dataset.
+    args:
+        dataset: d3rlpy ReplayBuffer
+        seed: the random seed
+        device: the torch device, e.g. "cpu:0" or "cuda:0"
+        alpha, n_quantiles, learning_rate: hyperparameters of DiscreteCQL
+        n_steps, n_steps_per_epoch: the training steps
+        experiment_name: the name of the logs, "DiscreteCQL_{seed}" by default
+        tensorboard: whether to also log to tensorboard
+    returns:
+        list of (epoch, metrics) of all epochs
+    """
     # fix seed
-    d3rlpy.seed(args.seed)
-    
-    # load dataset
-    with open(args.dataset, "rb") as f:
-        dataset = d3rlpy.dataset.ReplayBuffer.load(f, d3rlpy.dataset.InfiniteBuffer())
+    d3rlpy.seed(seed)
 
     # setup algorithm
     cql = d3rlpy.algos.DiscreteCQLConfig(
-        learning_rate=5e-5,
+        learning_rate=learning_rate,
         batch_size=32,
-        alpha=4.0,
-        q_func_factory=d3rlpy.models.q_functions.QRQFunctionFactory(n_quantiles=32),
+        alpha=alpha,
+        q_func_factory=d3rlpy.models.q_functions.QRQFunctionFactory(n_quantiles=n_quantiles),
         n_critics=2,
         target_update_interval=1000,
-    ).create(device=args.device)
+    ).create(device=device)
 
     # calculate metrics
     td_error_evaluator = d3rlpy.metrics.TDErrorEvaluator(episodes=dataset.episodes)
 
     # define interface for logging
-    logger_adapter = d3rlpy.logging.CombineAdapterFactory([
-        d3rlpy.logging.FileAdapterFactory(root_dir="file_logs"),
-        d3rlpy.logging.TensorboardAdapterFactory(root_dir="tensorboard_logs")
-    ])
+    adapters = [d3rlpy.logging.FileAdapterFactory(root_dir="file_logs")]
+    if tensorboard:
+        adapters.append(d3rlpy.logging.TensorboardAdapterFactory(root_dir="tensorboard_logs"))
+    logger_adapter = d3rlpy.logging.CombineAdapterFactory(adapters)
 
-    cql.fit(
+    return cql.fit(
         dataset,
-        n_steps=500000,
-        n_steps_per_epoch=5000,
+        n_steps=n_steps,
+        n_steps_per_epoch=n_steps_per_epoch,
         evaluators={'td_error': td_error_evaluator},
-        experiment_name=f"DiscreteCQL_{args.seed}",
-        logger_adapter=logger_adapter
+        experiment_name=experiment_name or f"DiscreteCQL_{seed}",
+        logger_adapter=logger_adapter,
+        show_progress=show_progress
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset", type=str, default="../dataset_process/gpt4_examples.h5",
+                        help="a d3rlpy .h5 file, or a directory exported by dataset.py to memory-map")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--device", type=str, default="cpu:0")
+    parser.add_argument("--alpha", type=float, default=4.0)
+    parser.add_argument("--n_quantiles", type=int, default=32)
+    parser.add_argument("--learning_rate", type=float, default=5e-5)
+    parser.add_argument("--n_steps", type=int, default=500000)
+    args = parser.parse_args()
+
+    # load dataset
+    dataset = load_dataset(args.dataset)
+
+    train(
+        dataset,
+        seed=args.seed,
+        device=args.device,
+        alpha=args.alpha,
+        n_quantiles=args.n_quantiles,
+        learning_rate=args.learning_rate,
+        n_steps=args.n_steps
     )
 
 